@@ -43,14 +43,19 @@
 #     return app
 
 
-from flask import Flask, send_from_directory,current_app , jsonify
+from flask import Flask, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import os
 
 db = SQLAlchemy()
 
-def create_app():
+def create_app(preload_models=None):
+    """
+    Args:
+        preload_models (bool): Load and warm the emotion models in a background
+            thread at startup. Defaults to MODEL_PRELOAD (env, on unless "0").
+    """
     app = Flask(__name__)
     CORS(app, supports_credentials=True)
 
@@ -63,14 +68,50 @@ def create_app():
         "pool_pre_ping": True
     }
 
+    # Uploads (app/services/uploads.py): cap on the whole request body, per-file
+    # caps enforced while the body streams in (by sniffed format), image header
+    # dimension cap, and how much of a request's files may stay in memory
+    # before spilling to temporary files
+    app.config["MAX_CONTENT_LENGTH"] = 128 * 1024 * 1024
+    app.config["UPLOAD_MAX_IMAGE_BYTES"] = 16 * 1024 * 1024
+    app.config["UPLOAD_MAX_CLIP_BYTES"] = 64 * 1024 * 1024
+    app.config["UPLOAD_MAX_IMAGE_PIXELS"] = 40_000_000
+    app.config["UPLOAD_SPOOL_BYTES"] = 1024 * 1024
+
+    from app.services.uploads import init_uploads
+    init_uploads(app)
+
+    # Serving of /uploads/... (app/services/static_files.py): immutable cache
+    # lifetime, and UPLOAD_SENDFILE "x-accel" (nginx) or "x-sendfile" to let the
+    # front proxy stream the bytes. For x-accel, UPLOAD_ACCEL_PREFIX is an
+    # internal nginx location aliased to app/uploads/.
+    app.config["UPLOAD_CACHE_MAX_AGE"] = 365 * 24 * 3600
+    app.config["UPLOAD_SENDFILE"] = os.environ.get("UPLOAD_SENDFILE") or None
+    app.config["UPLOAD_ACCEL_PREFIX"] = os.environ.get("UPLOAD_ACCEL_PREFIX", "/protected-uploads")
+
+    # Content-addressed upload store (app/services/upload_store.py): files are
+    # named by SHA-256 under ab/cd/ shards; reference counts for deduplicated
+    # files live in this SQLite index, outside the served folders
+    app.config["UPLOAD_STORE_INDEX"] = os.environ.get(
+        "UPLOAD_STORE_INDEX", os.path.join(app.root_path, "upload_index", "refs.sqlite3")
+    )
+    # Threads writing uploads in the background while /detect-saved predicts
+    app.config["UPLOAD_WRITER_WORKERS"] = 2
+
     # ✅ Pets upload folder config
     app.config["UPLOAD_FOLDER"] = os.path.join(app.root_path, "uploads/pets_data")
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
-    # Serve pet images
+    # Resized WebP variants of pet / vet photos (app/services/image_variants.py),
+    # made by a background pool at upload time and served with ?variant=
+    app.config["IMAGE_VARIANTS_ENABLED"] = True
+    app.config["IMAGE_VARIANT_WORKERS"] = 1
+
+    # Serve pet images (?variant=thumb|card|full for a resized copy)
     @app.route('/uploads/pets_data/<path:filename>')
     def serve_pet_image(filename):
-        return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+        from app.services.image_variants import send_image
+        return send_image(app.config["UPLOAD_FOLDER"], filename, request.args.get("variant"))
 
     db.init_app(app)
 
@@ -88,20 +129,139 @@ def create_app():
     from app.routes.veteri_routes import veteri_bp
     app.register_blueprint(veteri_bp, url_prefix="/api/veterinarians")
 
-    @app.route("/uploads/vets/<filename>")
+    @app.route("/uploads/vets/<path:filename>")
     def uploaded_vet_file(filename):
-        return send_from_directory(app.config["UPLOAD_FOLDER_VETS"], filename)
+        from app.services.image_variants import send_image
+        return send_image(app.config["UPLOAD_FOLDER_VETS"], filename, request.args.get("variant"))
+
+    # Unix socket of the shared inference server (python -m app.services.inference_server).
+    # When set, web workers forward predictions there instead of loading the models.
+    app.config["INFERENCE_SERVER_SOCKET"] = os.environ.get("INFERENCE_SERVER_SOCKET")
+
+    # "native" (PyTorch + TensorFlow) or "onnx" (ONNX Runtime only, see export_onnx_models.py).
+    # The ONNX paths default to app/trained/cat_resnet18.onnx and app/trained/dog.onnx.
+    app.config["INFERENCE_BACKEND"] = os.environ.get("INFERENCE_BACKEND", "native")
+    # Native model weights: a .pth / .h5 file or a .bundle folder (build_model_bundles.py).
+    # Unset means app/trained/<name>.bundle when present, else the .pth / .h5.
+    app.config["CAT_MODEL_PATH"] = os.environ.get("CAT_MODEL_PATH")
+    app.config["DOG_MODEL_PATH"] = os.environ.get("DOG_MODEL_PATH")
+    # Check bundle checksums against their manifest when loading
+    app.config["MODEL_BUNDLE_VERIFY"] = True
+    app.config["CAT_ONNX_MODEL_PATH"] = None
+    app.config["DOG_ONNX_MODEL_PATH"] = None
+    # "fp32", "int8-dynamic" or "int8-static" (see quantize_models.py)
+    app.config["ONNX_MODEL_VARIANT"] = os.environ.get("ONNX_MODEL_VARIANT", "fp32")
+    # Versioned models (app/services/model_registry.py). When the registry has an
+    # active version it is loaded instead of the paths above, and each process
+    # polls the file to hot-swap to a newly activated version.
+    app.config["MODEL_REGISTRY_PATH"] = os.environ.get("MODEL_REGISTRY_PATH")
+    app.config["MODEL_REGISTRY_WATCH"] = True
+    app.config["MODEL_REGISTRY_POLL_SECONDS"] = 2.0
+
+    # Content-addressed cache of predictions (image hash + model version)
+    app.config["PREDICTION_CACHE_ENABLED"] = True
+    app.config["PREDICTION_CACHE_MAX_ENTRIES"] = 2048
+    app.config["PREDICTION_CACHE_TTL_SECONDS"] = 900
+
+    # Load + warm the emotion models at startup instead of on the first request
+    app.config["MODEL_PRELOAD"] = os.environ.get("MODEL_PRELOAD", "1") != "0"
+    app.config["MODEL_WARMUP_BATCH_SIZES"] = (1, 8)
+    app.config["MODEL_WARMUP_ITERATIONS"] = 3
+
+    # CPU thread budget per worker process: cores are split between torch
+    # (cat), TensorFlow (dog) and concurrent forward passes, see thread_budget.py.
+    # CPU_BUDGET_CORES defaults to the cores this process may run on.
+    app.config["CPU_BUDGET_ENABLED"] = os.environ.get("CPU_BUDGET_ENABLED", "1") != "0"
+    app.config["CPU_BUDGET_CORES"] = int(os.environ.get("CPU_BUDGET_CORES", 0)) or None
+    app.config["CPU_BUDGET_WORKERS"] = int(os.environ.get("WEB_WORKERS", 1))
+    app.config["CPU_BUDGET_SHARES"] = {"cat": 0.5, "dog": 0.5}
+    app.config["CPU_BUDGET_INFERENCE_CONCURRENCY"] = 1
+
+    from app.services.thread_budget import configure_thread_budget
+    configure_thread_budget(app)
+
+    # Group commit of emotion history rows (app/services/history_writer.py): rows
+    # from concurrent requests go out as one multi-row INSERT + COMMIT when
+    # HISTORY_BATCH_MAX_SIZE are queued or after HISTORY_BATCH_MAX_WAIT_MS.
+    # HISTORY_COMMIT_WAIT=0 answers before the commit (no row id in the response)
+    app.config["HISTORY_GROUP_COMMIT"] = os.environ.get("HISTORY_GROUP_COMMIT", "1") == "1"
+    app.config["HISTORY_COMMIT_WAIT"] = os.environ.get("HISTORY_COMMIT_WAIT", "1") == "1"
+    app.config["HISTORY_BATCH_MAX_SIZE"] = 64
+    app.config["HISTORY_BATCH_MAX_WAIT_MS"] = 5
+    app.config["HISTORY_QUEUE_DEPTH"] = 1024
+    app.config["HISTORY_COMMIT_TIMEOUT"] = 30
+
+    # Async detection jobs (POST /detect?async=1), stored in a local SQLite file
+    # shared by all worker processes so queued jobs survive a restart
+    app.config["JOBS_ENABLED"] = True
+    app.config["JOBS_DB_PATH"] = os.environ.get("JOBS_DB_PATH", os.path.join(app.root_path, "jobs", "jobs.sqlite3"))
+    app.config["JOBS_WORKERS"] = 2
+    app.config["JOBS_QUEUE_CAPACITY"] = 256
+    app.config["JOBS_POLL_INTERVAL_SECONDS"] = 1.0
+    app.config["JOBS_RETENTION_SECONDS"] = 24 * 3600
+    app.config["JOBS_SSE_HEARTBEAT_SECONDS"] = 15
+
+    # Prometheus metrics at GET /metrics. Each process writes its totals to
+    # METRICS_DIR every METRICS_FLUSH_SECONDS and /metrics merges them, so the
+    # directory must be shared by all workers (and the inference server)
+    app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "1") != "0"
+    app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR", os.path.join(app.root_path, "metrics"))
+    app.config["METRICS_FLUSH_SECONDS"] = 1.0
+
+    from app.services.metrics import init_metrics
+    init_metrics(app)
+
+    # On-demand sampling profiler, see app/services/profiler.py. Requests are
+    # profiled when they carry an X-Profile-Signature signed with
+    # PROFILER_SECRET, or at PROFILER_SAMPLE_RATE (switchable at runtime via
+    # /api/admin/profiler). Collapsed stacks go to PROFILER_DIR.
+    app.config["PROFILER_ENABLED"] = os.environ.get("PROFILER_ENABLED", "0") == "1"
+    app.config["PROFILER_SECRET"] = os.environ.get("PROFILER_SECRET")
+    app.config["PROFILER_DIR"] = os.environ.get("PROFILER_DIR", os.path.join(app.root_path, "profiles"))
+    app.config["PROFILER_SAMPLE_RATE"] = 0.0
+    app.config["PROFILER_INTERVAL_MS"] = 5
+    app.config["PROFILER_MAX_FILES"] = 500
+
+    from app.services.profiler import init_profiler
+    init_profiler(app)
+
+    # Upper bound on images accepted by the /detect-batch endpoints
+    app.config["EMOTION_BATCH_MAX_IMAGES"] = 50
+
+    # /detect-clip (app/services/clip_analysis.py): frames analysed per second of
+    # clip, near-duplicate cutoff (mean abs. difference of 16x16 RGB thumbnails,
+    # 0-255) and per-request bounds
+    app.config["CLIP_SAMPLE_FPS"] = 2.0
+    app.config["CLIP_MAX_SAMPLE_FPS"] = 10.0
+    app.config["CLIP_DUPLICATE_THRESHOLD"] = 2.0
+    app.config["CLIP_BATCH_SIZE"] = 16
+    app.config["CLIP_MAX_SECONDS"] = 60
+    app.config["CLIP_MAX_FRAMES"] = 120
 
     # ✅ Cat Emotion Detection
     app.config["UPLOAD_FOLDER_CAT_EMOTIONS"] = os.path.join(app.root_path, "uploads/cat_emotions")
     os.makedirs(app.config["UPLOAD_FOLDER_CAT_EMOTIONS"], exist_ok=True)
 
+    # Micro-batching of concurrent /detect requests into one forward pass
+    app.config["CAT_BATCHING_ENABLED"] = True
+    app.config["CAT_BATCH_MAX_SIZE"] = 16
+    app.config["CAT_BATCH_MAX_WAIT_MS"] = 5
+    app.config["CAT_BATCH_QUEUE_DEPTH"] = 256
+
+    # Confidence-gated cascade: ResNet18 answers when its top-1 confidence is at
+    # least CAT_CASCADE_THRESHOLD, otherwise EfficientNet-B0 re-runs the image.
+    # Weights default to app/trained/cat_efficientnet.pth (cat_emotion_efficientnet.pth)
+    app.config["CAT_CASCADE_ENABLED"] = os.environ.get("CAT_CASCADE_ENABLED", "0") == "1"
+    app.config["CAT_CASCADE_MODEL_PATH"] = os.environ.get("CAT_CASCADE_MODEL_PATH")
+    app.config["CAT_CASCADE_THRESHOLD"] = 0.7
+
     from app.routes.cat_emotion_routes import cat_emotion_bp
     app.register_blueprint(cat_emotion_bp, url_prefix="/api/cat-emotion")
 
-    @app.route("/uploads/cat_emotions/<filename>")
+    @app.route("/uploads/cat_emotions/<path:filename>")
     def uploaded_cat_emotion_file(filename):
-        return send_from_directory(app.config["UPLOAD_FOLDER_CAT_EMOTIONS"], filename)
+        from app.services.static_files import send_upload
+        return send_upload(app.config["UPLOAD_FOLDER_CAT_EMOTIONS"], filename)
 
     # ✅ Dog Emotion Detection
     app.config["UPLOAD_FOLDER_DOG_EMOTIONS"] = os.path.join(app.root_path, "uploads/dog_emotions")
@@ -110,8 +270,28 @@ def create_app():
     from app.routes.dog_emotion_routes import dog_emotion_bp
     app.register_blueprint(dog_emotion_bp, url_prefix="/api/dog-emotion")
 
-    @app.route("/uploads/dog_emotions/<filename>")
+    @app.route("/uploads/dog_emotions/<path:filename>")
     def uploaded_dog_emotion_file(filename):
-        return send_from_directory(app.config["UPLOAD_FOLDER_DOG_EMOTIONS"], filename)
+        from app.services.static_files import send_upload
+        return send_upload(app.config["UPLOAD_FOLDER_DOG_EMOTIONS"], filename)
+
+    # ✅ Liveness / readiness probes
+    from app.routes.health_routes import health_bp
+    app.register_blueprint(health_bp, url_prefix="/api/health")
+
+    # ✅ Emotion model versions
+    from app.routes.model_registry_routes import model_registry_bp
+    app.register_blueprint(model_registry_bp, url_prefix="/api/models")
+
+    if preload_models is None:
+        preload_models = app.config["MODEL_PRELOAD"]
+    if preload_models:
+        from app.services.model_preload import preload_models as start_preload
+        start_preload(app)
+        # Drain jobs left queued by a previous run
+        from app.services.inference_jobs import start_job_workers
+        start_job_workers(app)
+        from app.services.model_registry import start_registry_watcher
+        start_registry_watcher(app)
 
     return app
@@ -1,8 +1,9 @@
-from app import create_app, db
-
-app = create_app()
+from app import create_app
 
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()  # create tables if not exist
-    app.run(host="0.0.0.0", port=8000, debug=True)
+    # Prefork server: models are loaded once and shared by the workers.
+    # "python -m app.main --dev" still runs the Flask debug server.
+    from app.server import main
+    main()
+else:
+    app = create_app()
@@ -94,6 +94,7 @@ class CatEmotionHistory(db.Model):
     confidence = db.Column(db.Float, nullable=False)  # 0.0 to 1.0
     probabilities = db.Column(db.Text, nullable=False)  # JSON string with all probabilities
     image_url = db.Column(db.String(255), nullable=True)  # Optional: saved image path
+    model_version = db.Column(db.String(64), nullable=True)  # Registry version (or weights fingerprint) that predicted
     created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
     
     # Relationship to Pet
@@ -109,6 +110,7 @@ class CatEmotionHistory(db.Model):
             "confidence": self.confidence,
             "probabilities": json.loads(self.probabilities) if self.probabilities else {},
             "image_url": self.image_url,
+            "model_version": self.model_version,
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
 
@@ -123,6 +125,7 @@ class DogEmotionHistory(db.Model):
     confidence = db.Column(db.Float, nullable=False)  # 0.0 to 1.0
     probabilities = db.Column(db.Text, nullable=False)  # JSON string with all probabilities
     image_url = db.Column(db.String(255), nullable=True)  # Optional: saved image path
+    model_version = db.Column(db.String(64), nullable=True)  # Registry version (or weights fingerprint) that predicted
     created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
     
     # Relationship to Pet
@@ -138,5 +141,6 @@ class DogEmotionHistory(db.Model):
             "confidence": self.confidence,
             "probabilities": json.loads(self.probabilities) if self.probabilities else {},
             "image_url": self.image_url,
+            "model_version": self.model_version,
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
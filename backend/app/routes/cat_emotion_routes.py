@@ -4,19 +4,11 @@ Handles API endpoints for cat emotion prediction
 """
 
 from flask import Blueprint, request, jsonify, current_app
-import os
-from werkzeug.utils import secure_filename
-
-cat_emotion_bp = Blueprint('cat_emotion', __name__)
-
-# Allowed image extensions
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 
+from app.services.upload_store import get_upload_store
+from app.services.uploads import CLIP_FORMATS, FORMAT_EXTENSIONS, IMAGE_FORMATS, UploadError, check_upload
 
-def allowed_file(filename):
-    """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
+cat_emotion_bp = Blueprint('cat_emotion', __name__)
 
 @cat_emotion_bp.route('/detect', methods=['POST'])
 def detect_cat_emotion():
@@ -46,56 +38,52 @@ def detect_cat_emotion():
         
         file = request.files['image']
         
-        # Check if file is empty
-        if file.filename == '':
+        # Check the content (magic bytes, image header); size was capped while streaming
+        try:
+            check_upload(file, IMAGE_FORMATS)
+        except UploadError as e:
             return jsonify({
                 'success': False,
-                'error': 'No file selected'
-            }), 400
+                'error': str(e)
+            }), e.status
         
-        # Check if file type is allowed
-        if not allowed_file(file.filename):
-            return jsonify({
-                'success': False,
-                'error': f'Invalid file type. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
-            }), 400
+        # Async mode: queue the image and answer right away with a job id
+        if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+            return _submit_async_job(pet_id, file.read())
         
-        # Read image bytes
-        image_bytes = file.read()
+        # Load the detector service (batched with concurrent requests if enabled)
+        from app.services.detectors import get_emotion_detector
+        detector = get_emotion_detector('cat', batched=True)
         
-        # Load the detector service
-        from app.services.cat_emotion_service import get_cat_emotion_detector
-        detector = get_cat_emotion_detector()
-        
-        # Make prediction
-        result = detector.predict_from_bytes(image_bytes)
+        # Make prediction, decoding straight from the spooled upload
+        result = detector.predict_from_bytes(file.stream)
         
         if result['success']:
-            # Save to database
+            # Save to database (group-committed with concurrent requests)
             from app.models import CatEmotionHistory
-            from app import db
+            from app.services.history_writer import record_history
             import json
             
-            # Create history record
-            history_record = CatEmotionHistory(
+            history_record = record_history(
+                CatEmotionHistory,
                 pet_id=int(pet_id),
                 emotion=result['emotion'],
                 confidence=result['confidence'],
                 probabilities=json.dumps(result['all_probabilities']),
-                image_url=None  # Not saving image for now, but can be added
+                image_url=None,  # Not saving image for now, but can be added
+                model_version=result.get('model_version')
             )
             
-            db.session.add(history_record)
-            db.session.commit()
-            
             return jsonify({
                 'success': True,
                 'data': {
-                    'id': history_record.id,
+                    'id': history_record['id'],
                     'emotion': result['emotion'],
                     'confidence': result['confidence'],
                     'probabilities': result['all_probabilities'],
-                    'created_at': history_record.created_at.isoformat()
+                    'stage': result.get('stage'),
+                    'model_version': result.get('model_version'),
+                    'created_at': history_record['created_at']
                 }
             }), 200
         else:
@@ -111,76 +99,216 @@ def detect_cat_emotion():
         }), 500
 
 
-@cat_emotion_bp.route('/detect-saved', methods=['POST'])
-def detect_cat_emotion_from_saved():
+@cat_emotion_bp.route('/detect-batch', methods=['POST'])
+def detect_cat_emotion_batch():
     """
-    Alternative endpoint: Save image first, then predict
-    Useful if you need to keep the images for records
+    Detect cat emotions for a whole photo session in one request
     
-    Expected: multipart/form-data with 'image' file
+    Expected: multipart/form-data with one or more 'images' files and a
+    'pet_id' field. Every image is decoded in parallel, all of them go
+    through one batched forward pass, and all history rows are written in
+    a single transaction. A bad image only fails its own entry.
     
     Returns:
-        JSON response with emotion prediction and file path
+        JSON response with one result entry per uploaded image
     """
     try:
-        # Check if image file is in request
-        if 'image' not in request.files:
+        files = request.files.getlist('images')
+        if not files:
             return jsonify({
                 'success': False,
-                'error': 'No image file provided'
+                'error': 'No image files provided'
             }), 400
         
-        file = request.files['image']
+        pet_id = request.form.get('pet_id')
+        if not pet_id:
+            return jsonify({
+                'success': False,
+                'error': 'pet_id is required'
+            }), 400
         
-        # Check if file is empty
-        if file.filename == '':
+        max_images = current_app.config.get('EMOTION_BATCH_MAX_IMAGES', 50)
+        if len(files) > max_images:
             return jsonify({
                 'success': False,
-                'error': 'No file selected'
+                'error': f'Too many images, at most {max_images} per batch'
             }), 400
         
-        # Check if file type is allowed
-        if not allowed_file(file.filename):
+        # Validate each file on its own so one bad upload does not sink the batch
+        results = [None] * len(files)
+        valid_indices = []
+        uploads = []
+        for index, file in enumerate(files):
+            try:
+                check_upload(file, IMAGE_FORMATS)
+            except UploadError as e:
+                results[index] = {'success': False, 'error': str(e)}
+                continue
+            valid_indices.append(index)
+            uploads.append(file.stream)
+        
+        # Load the detector service and predict everything in one pass
+        from app.services.detectors import get_emotion_detector
+        detector = get_emotion_detector('cat')
+        predictions = detector.predict_batch_from_bytes(uploads) if uploads else []
+        
+        from app.models import CatEmotionHistory
+        from app import db
+        import json
+        
+        records = []
+        for index, prediction in zip(valid_indices, predictions):
+            if not prediction['success']:
+                results[index] = {'success': False, 'error': prediction['error']}
+                continue
+            record = CatEmotionHistory(
+                pet_id=int(pet_id),
+                emotion=prediction['emotion'],
+                confidence=prediction['confidence'],
+                probabilities=json.dumps(prediction['all_probabilities']),
+                image_url=None,
+                model_version=prediction.get('model_version')
+            )
+            records.append((index, record, prediction))
+        
+        # One transaction for the whole session
+        if records:
+            try:
+                db.session.add_all([record for _, record, _ in records])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        
+        for index, record, prediction in records:
+            results[index] = {
+                'success': True,
+                'id': record.id,
+                'emotion': prediction['emotion'],
+                'confidence': prediction['confidence'],
+                'probabilities': prediction['all_probabilities'],
+                'stage': prediction.get('stage'),
+                'model_version': record.model_version,
+                'created_at': record.created_at.isoformat()
+            }
+        
+        for index, file in enumerate(files):
+            results[index] = {'index': index, 'filename': file.filename, **results[index]}
+        
+        succeeded = sum(1 for result in results if result['success'])
+        return jsonify({
+            'success': True,
+            'data': {
+                'pet_id': int(pet_id),
+                'total': len(results),
+                'succeeded': succeeded,
+                'failed': len(results) - succeeded,
+                'results': results
+            }
+        }), 200
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@cat_emotion_bp.route('/detect-clip', methods=['POST'])
+def detect_cat_emotion_clip():
+    """
+    Detect cat emotions over a short clip and save the aggregate to history
+    
+    Expected: multipart/form-data with a 'clip' file (animated GIF, WebP or
+    PNG; mp4/mov/webm/mkv/avi when OpenCV is installed), a 'pet_id' field
+    and an optional 'fps' field (frames analysed per second of clip).
+    
+    Returns:
+        JSON response with the temporally aggregated emotion, the emotion
+        segments and one result entry per sampled frame
+    """
+    try:
+        if 'clip' not in request.files:
             return jsonify({
                 'success': False,
-                'error': f'Invalid file type. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
+                'error': 'No clip file provided'
             }), 400
         
-        # Create upload folder for cat emotions if it doesn't exist
-        upload_folder = os.path.join(current_app.root_path, 'uploads', 'cat_emotions')
-        os.makedirs(upload_folder, exist_ok=True)
+        pet_id = request.form.get('pet_id')
+        if not pet_id:
+            return jsonify({
+                'success': False,
+                'error': 'pet_id is required'
+            }), 400
         
-        # Save the file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(upload_folder, filename)
-        file.save(filepath)
+        file = request.files['clip']
+        try:
+            clip_format = check_upload(file, CLIP_FORMATS)
+        except UploadError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), e.status
         
-        # Load the detector service
-        from app.services.cat_emotion_service import get_cat_emotion_detector
-        detector = get_cat_emotion_detector()
+        try:
+            sample_fps = float(request.form['fps']) if request.form.get('fps') else None
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'fps must be a number'
+            }), 400
         
-        # Make prediction
-        result = detector.predict(filepath)
+        from app.services.clip_analysis import ClipError, analyze_clip
+        from app.services.detectors import get_emotion_detector
+        detector = get_emotion_detector('cat')
         
-        if result['success']:
+        try:
+            result = analyze_clip('cat', detector, file.stream, clip_format, sample_fps)
+        except ClipError as e:
             return jsonify({
-                'success': True,
-                'data': {
-                    'emotion': result['emotion'],
-                    'confidence': result['confidence'],
-                    'probabilities': result['all_probabilities'],
-                    'saved_path': f'/uploads/cat_emotions/{filename}'
-                }
-            }), 200
-        else:
-            # Clean up the saved file if prediction failed
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        if not result['success']:
             return jsonify({
                 'success': False,
                 'error': result['error']
             }), 500
+        
+        from app.models import CatEmotionHistory
+        from app.services.history_writer import record_history
+        import json
+        
+        # One history row for the clip, carrying the aggregated emotion
+        history_record = record_history(
+            CatEmotionHistory,
+            pet_id=int(pet_id),
+            emotion=result['emotion'],
+            confidence=result['confidence'],
+            probabilities=json.dumps(result['all_probabilities']),
+            image_url=None,
+            model_version=result.get('model_version')
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'id': history_record['id'],
+                'emotion': result['emotion'],
+                'confidence': result['confidence'],
+                'probabilities': result['all_probabilities'],
+                'model_version': result.get('model_version'),
+                'created_at': history_record['created_at'],
+                'duration_seconds': result['duration_seconds'],
+                'truncated': result['truncated'],
+                'frames_sampled': result['frames_sampled'],
+                'frames_analysed': result['frames_analysed'],
+                'duplicates_skipped': result['duplicates_skipped'],
+                'segments': result['segments'],
+                'frames': result['frames']
+            }
+        }), 200
     
     except Exception as e:
         return jsonify({
@@ -189,20 +317,98 @@ def detect_cat_emotion_from_saved():
         }), 500
 
 
-@cat_emotion_bp.route('/health', methods=['GET'])
-def health_check():
+@cat_emotion_bp.route('/detect-saved', methods=['POST'])
+def detect_cat_emotion_from_saved():
     """
-    Health check endpoint to verify model is loaded
+    Alternative endpoint: predict and keep the image for records
+    
+    The upload is read once. The model decodes it from memory while the
+    upload store writes it in the background; the response waits for both.
+    
+    Expected: multipart/form-data with 'image' file and optional 'pet_id'
+    (when given, a history row with the saved image is created)
+    
+    Returns:
+        JSON response with emotion prediction and file path
     """
     try:
-        from app.services.cat_emotion_service import get_cat_emotion_detector
-        detector = get_cat_emotion_detector()
+        # Check if image file is in request
+        if 'image' not in request.files:
+            return jsonify({
+                'success': False,
+                'error': 'No image file provided'
+            }), 400
+        
+        pet_id = request.form.get('pet_id')
+        file = request.files['image']
+        
+        # Check the content (magic bytes, image header); size was capped while streaming
+        try:
+            image_format = check_upload(file, IMAGE_FORMATS)
+        except UploadError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), e.status
+        
+        # Start saving under the content hash (client file names can collide)
+        image_bytes = file.read()
+        store = get_upload_store(current_app.config['UPLOAD_FOLDER_CAT_EMOTIONS'])
+        saving = store.put_async(image_bytes, FORMAT_EXTENSIONS[image_format])
+        
+        # Load the detector service
+        from app.services.detectors import get_emotion_detector
+        detector = get_emotion_detector('cat', batched=True)
+        
+        # Make prediction from the same buffer while the write runs
+        result = detector.predict_from_bytes(image_bytes)
+        filename = saving.result()
+        saved_path = f'/uploads/cat_emotions/{filename}'
+        
+        if not result['success']:
+            # Drop the saved file if prediction failed
+            store.release(filename)
+            
+            return jsonify({
+                'success': False,
+                'error': result['error']
+            }), 500
+        
+        data = {
+            'emotion': result['emotion'],
+            'confidence': result['confidence'],
+            'probabilities': result['all_probabilities'],
+            'stage': result.get('stage'),
+            'model_version': result.get('model_version'),
+            'saved_path': saved_path
+        }
+        
+        if pet_id:
+            # Save to database, pointing at the stored image
+            from app.models import CatEmotionHistory
+            from app.services.history_writer import record_history
+            import json
+            
+            try:
+                history_record = record_history(
+                    CatEmotionHistory,
+                    pet_id=int(pet_id),
+                    emotion=result['emotion'],
+                    confidence=result['confidence'],
+                    probabilities=json.dumps(result['all_probabilities']),
+                    image_url=saved_path,
+                    model_version=result.get('model_version')
+                )
+            except Exception:
+                store.release(filename)
+                raise
+            
+            data['id'] = history_record['id']
+            data['created_at'] = history_record['created_at']
         
         return jsonify({
             'success': True,
-            'message': 'Cat emotion detector is ready',
-            'device': detector.device,
-            'classes': detector.classes
+            'data': data
         }), 200
     
     except Exception as e:
@@ -212,6 +418,146 @@ def health_check():
         }), 500
 
 
+@cat_emotion_bp.route('/health', methods=['GET'])
+def health_check():
+    """
+    Health check endpoint reporting whether the model is loaded
+    
+    Only reads the load state; it never loads the model itself.
+    """
+    from app.services.model_preload import model_status
+    status = model_status('cat')
+    ready = status.get('state') == 'ready'
+    
+    return jsonify({
+        'success': ready,
+        'message': 'Cat emotion detector is ready' if ready else f"Cat emotion detector is {status.get('state')}",
+        'data': status
+    }), 200 if ready else 503
+
+
+def _submit_async_job(pet_id, image_bytes):
+    """Validate and queue a /detect?async=1 upload, returning 202 with the job id"""
+    from flask import url_for
+    from app.services.inference_jobs import JobQueueFull, submit_job
+    
+    if not current_app.config.get('JOBS_ENABLED', True):
+        return jsonify({
+            'success': False,
+            'error': 'Async detection is disabled'
+        }), 400
+    
+    try:
+        pet_id = int(pet_id)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'pet_id must be an integer'
+        }), 400
+    
+    try:
+        job_id = submit_job('cat', pet_id, image_bytes)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except JobQueueFull:
+        response = jsonify({
+            'success': False,
+            'error': 'Too many queued detections, try again shortly'
+        })
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    return jsonify({
+        'success': True,
+        'data': {
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': url_for('.get_job_status', job_id=job_id),
+            'events_url': url_for('.stream_job_events', job_id=job_id)
+        }
+    }), 202
+
+
+@cat_emotion_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """
+    Status of an async detection job
+    
+    Returns:
+        JSON with the job status ('queued', 'running', 'done' or 'failed')
+        and, once done, the same 'result' data /detect returns
+    """
+    from app.services.inference_jobs import get_job
+    
+    job = get_job(job_id, species='cat')
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': job
+    }), 200
+
+
+@cat_emotion_bp.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """
+    Server-sent events for an async detection job
+    
+    Sends a 'status' event on every status change and closes the stream
+    after the final 'done' / 'failed' event.
+    """
+    from flask import Response, stream_with_context
+    from app.services.inference_jobs import job_events
+    
+    events = job_events(job_id, species='cat', heartbeat_seconds=current_app.config.get('JOBS_SSE_HEARTBEAT_SECONDS', 15))
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@cat_emotion_bp.route('/cascade-stats', methods=['GET'])
+def cascade_stats():
+    """
+    Escalation rate and average cost of the ResNet18 -> EfficientNet-B0 cascade
+    """
+    from app.services.cat_emotion_service import get_cat_emotion_detector
+    
+    detector = get_cat_emotion_detector()
+    if not hasattr(detector, 'cascade_stats'):
+        return jsonify({
+            'success': False,
+            'error': 'Cat emotion model is not loaded in this process'
+        }), 503
+    
+    return jsonify({
+        'success': True,
+        'data': detector.cascade_stats()
+    }), 200
+
+
+@cat_emotion_bp.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """
+    Hit/miss counters of the cat prediction cache
+    """
+    from app.services.prediction_cache import get_prediction_cache
+    
+    return jsonify({
+        'success': True,
+        'enabled': bool(current_app.config.get('PREDICTION_CACHE_ENABLED')),
+        'data': get_prediction_cache('cat').stats()
+    }), 200
+
+
 @cat_emotion_bp.route('/history/<int:pet_id>', methods=['GET'])
 def get_emotion_history(pet_id):
     """
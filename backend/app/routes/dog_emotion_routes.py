@@ -4,19 +4,11 @@ Handles API endpoints for dog emotion prediction
 """
 
 from flask import Blueprint, request, jsonify, current_app
-import os
-from werkzeug.utils import secure_filename
 
-dog_emotion_bp = Blueprint('dog_emotion', __name__)
-
-# Allowed image extensions
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
-
-
-def allowed_file(filename):
-    """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+from app.services.upload_store import get_upload_store
+from app.services.uploads import CLIP_FORMATS, FORMAT_EXTENSIONS, IMAGE_FORMATS, UploadError, check_upload
 
+dog_emotion_bp = Blueprint('dog_emotion', __name__)
 
 @dog_emotion_bp.route('/detect', methods=['POST'])
 def detect_dog_emotion():
@@ -46,56 +38,51 @@ def detect_dog_emotion():
         
         file = request.files['image']
         
-        # Check if file is empty
-        if file.filename == '':
+        # Check the content (magic bytes, image header); size was capped while streaming
+        try:
+            check_upload(file, IMAGE_FORMATS)
+        except UploadError as e:
             return jsonify({
                 'success': False,
-                'error': 'No file selected'
-            }), 400
+                'error': str(e)
+            }), e.status
         
-        # Check if file type is allowed
-        if not allowed_file(file.filename):
-            return jsonify({
-                'success': False,
-                'error': f'Invalid file type. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
-            }), 400
-        
-        # Read image bytes
-        image_bytes = file.read()
+        # Async mode: queue the image and answer right away with a job id
+        if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+            return _submit_async_job(pet_id, file.read())
         
         # Load the detector service
-        from app.services.dog_emotion_service import get_dog_emotion_detector
-        detector = get_dog_emotion_detector()
+        from app.services.detectors import get_emotion_detector
+        detector = get_emotion_detector('dog')
         
-        # Make prediction
-        result = detector.predict_from_bytes(image_bytes)
+        # Make prediction, decoding straight from the spooled upload
+        result = detector.predict_from_bytes(file.stream)
         
         if result['success']:
-            # Save to database
+            # Save to database (group-committed with concurrent requests)
             from app.models import DogEmotionHistory
-            from app import db
+            from app.services.history_writer import record_history
             import json
             
-            # Create history record
-            history_record = DogEmotionHistory(
+            history_record = record_history(
+                DogEmotionHistory,
                 pet_id=int(pet_id),
                 emotion=result['emotion'],
                 confidence=result['confidence'],
                 probabilities=json.dumps(result['all_probabilities']),
-                image_url=None  # Not saving image for now, but can be added
+                image_url=None,  # Not saving image for now, but can be added
+                model_version=result.get('model_version')
             )
             
-            db.session.add(history_record)
-            db.session.commit()
-            
             return jsonify({
                 'success': True,
                 'data': {
-                    'id': history_record.id,
+                    'id': history_record['id'],
                     'emotion': result['emotion'],
                     'confidence': result['confidence'],
                     'probabilities': result['all_probabilities'],
-                    'created_at': history_record.created_at.isoformat()
+                    'model_version': result.get('model_version'),
+                    'created_at': history_record['created_at']
                 }
             }), 200
         else:
@@ -111,6 +98,425 @@ def detect_dog_emotion():
         }), 500
 
 
+@dog_emotion_bp.route('/detect-saved', methods=['POST'])
+def detect_dog_emotion_from_saved():
+    """
+    Alternative endpoint: predict and keep the image for records
+    
+    The upload is read once. The model decodes it from memory while the
+    upload store writes it in the background; the response waits for both.
+    
+    Expected: multipart/form-data with 'image' file and optional 'pet_id'
+    (when given, a history row with the saved image is created)
+    
+    Returns:
+        JSON response with emotion prediction and file path
+    """
+    try:
+        # Check if image file is in request
+        if 'image' not in request.files:
+            return jsonify({
+                'success': False,
+                'error': 'No image file provided'
+            }), 400
+        
+        pet_id = request.form.get('pet_id')
+        file = request.files['image']
+        
+        # Check the content (magic bytes, image header); size was capped while streaming
+        try:
+            image_format = check_upload(file, IMAGE_FORMATS)
+        except UploadError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), e.status
+        
+        # Start saving under the content hash (client file names can collide)
+        image_bytes = file.read()
+        store = get_upload_store(current_app.config['UPLOAD_FOLDER_DOG_EMOTIONS'])
+        saving = store.put_async(image_bytes, FORMAT_EXTENSIONS[image_format])
+        
+        # Load the detector service
+        from app.services.detectors import get_emotion_detector
+        detector = get_emotion_detector('dog')
+        
+        # Make prediction from the same buffer while the write runs
+        result = detector.predict_from_bytes(image_bytes)
+        filename = saving.result()
+        saved_path = f'/uploads/dog_emotions/{filename}'
+        
+        if not result['success']:
+            # Drop the saved file if prediction failed
+            store.release(filename)
+            
+            return jsonify({
+                'success': False,
+                'error': result['error']
+            }), 500
+        
+        data = {
+            'emotion': result['emotion'],
+            'confidence': result['confidence'],
+            'probabilities': result['all_probabilities'],
+            'model_version': result.get('model_version'),
+            'saved_path': saved_path
+        }
+        
+        if pet_id:
+            # Save to database, pointing at the stored image
+            from app.models import DogEmotionHistory
+            from app.services.history_writer import record_history
+            import json
+            
+            try:
+                history_record = record_history(
+                    DogEmotionHistory,
+                    pet_id=int(pet_id),
+                    emotion=result['emotion'],
+                    confidence=result['confidence'],
+                    probabilities=json.dumps(result['all_probabilities']),
+                    image_url=saved_path,
+                    model_version=result.get('model_version')
+                )
+            except Exception:
+                store.release(filename)
+                raise
+            
+            data['id'] = history_record['id']
+            data['created_at'] = history_record['created_at']
+        
+        return jsonify({
+            'success': True,
+            'data': data
+        }), 200
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@dog_emotion_bp.route('/detect-batch', methods=['POST'])
+def detect_dog_emotion_batch():
+    """
+    Detect dog emotions for a whole photo session in one request
+    
+    Expected: multipart/form-data with one or more 'images' files and a
+    'pet_id' field. Every image is decoded in parallel, all of them go
+    through one batched forward pass, and all history rows are written in
+    a single transaction. A bad image only fails its own entry.
+    
+    Returns:
+        JSON response with one result entry per uploaded image
+    """
+    try:
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({
+                'success': False,
+                'error': 'No image files provided'
+            }), 400
+        
+        pet_id = request.form.get('pet_id')
+        if not pet_id:
+            return jsonify({
+                'success': False,
+                'error': 'pet_id is required'
+            }), 400
+        
+        max_images = current_app.config.get('EMOTION_BATCH_MAX_IMAGES', 50)
+        if len(files) > max_images:
+            return jsonify({
+                'success': False,
+                'error': f'Too many images, at most {max_images} per batch'
+            }), 400
+        
+        # Validate each file on its own so one bad upload does not sink the batch
+        results = [None] * len(files)
+        valid_indices = []
+        uploads = []
+        for index, file in enumerate(files):
+            try:
+                check_upload(file, IMAGE_FORMATS)
+            except UploadError as e:
+                results[index] = {'success': False, 'error': str(e)}
+                continue
+            valid_indices.append(index)
+            uploads.append(file.stream)
+        
+        # Load the detector service and predict everything in one pass
+        from app.services.detectors import get_emotion_detector
+        detector = get_emotion_detector('dog')
+        predictions = detector.predict_batch_from_bytes(uploads) if uploads else []
+        
+        from app.models import DogEmotionHistory
+        from app import db
+        import json
+        
+        records = []
+        for index, prediction in zip(valid_indices, predictions):
+            if not prediction['success']:
+                results[index] = {'success': False, 'error': prediction['error']}
+                continue
+            record = DogEmotionHistory(
+                pet_id=int(pet_id),
+                emotion=prediction['emotion'],
+                confidence=prediction['confidence'],
+                probabilities=json.dumps(prediction['all_probabilities']),
+                image_url=None,
+                model_version=prediction.get('model_version')
+            )
+            records.append((index, record, prediction))
+        
+        # One transaction for the whole session
+        if records:
+            try:
+                db.session.add_all([record for _, record, _ in records])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        
+        for index, record, prediction in records:
+            results[index] = {
+                'success': True,
+                'id': record.id,
+                'emotion': prediction['emotion'],
+                'confidence': prediction['confidence'],
+                'probabilities': prediction['all_probabilities'],
+                'model_version': record.model_version,
+                'created_at': record.created_at.isoformat()
+            }
+        
+        for index, file in enumerate(files):
+            results[index] = {'index': index, 'filename': file.filename, **results[index]}
+        
+        succeeded = sum(1 for result in results if result['success'])
+        return jsonify({
+            'success': True,
+            'data': {
+                'pet_id': int(pet_id),
+                'total': len(results),
+                'succeeded': succeeded,
+                'failed': len(results) - succeeded,
+                'results': results
+            }
+        }), 200
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@dog_emotion_bp.route('/detect-clip', methods=['POST'])
+def detect_dog_emotion_clip():
+    """
+    Detect dog emotions over a short clip and save the aggregate to history
+    
+    Expected: multipart/form-data with a 'clip' file (animated GIF, WebP or
+    PNG; mp4/mov/webm/mkv/avi when OpenCV is installed), a 'pet_id' field
+    and an optional 'fps' field (frames analysed per second of clip).
+    
+    Returns:
+        JSON response with the temporally aggregated emotion, the emotion
+        segments and one result entry per sampled frame
+    """
+    try:
+        if 'clip' not in request.files:
+            return jsonify({
+                'success': False,
+                'error': 'No clip file provided'
+            }), 400
+        
+        pet_id = request.form.get('pet_id')
+        if not pet_id:
+            return jsonify({
+                'success': False,
+                'error': 'pet_id is required'
+            }), 400
+        
+        file = request.files['clip']
+        try:
+            clip_format = check_upload(file, CLIP_FORMATS)
+        except UploadError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), e.status
+        
+        try:
+            sample_fps = float(request.form['fps']) if request.form.get('fps') else None
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'fps must be a number'
+            }), 400
+        
+        from app.services.clip_analysis import ClipError, analyze_clip
+        from app.services.detectors import get_emotion_detector
+        detector = get_emotion_detector('dog')
+        
+        try:
+            result = analyze_clip('dog', detector, file.stream, clip_format, sample_fps)
+        except ClipError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        if not result['success']:
+            return jsonify({
+                'success': False,
+                'error': result['error']
+            }), 500
+        
+        from app.models import DogEmotionHistory
+        from app.services.history_writer import record_history
+        import json
+        
+        # One history row for the clip, carrying the aggregated emotion
+        history_record = record_history(
+            DogEmotionHistory,
+            pet_id=int(pet_id),
+            emotion=result['emotion'],
+            confidence=result['confidence'],
+            probabilities=json.dumps(result['all_probabilities']),
+            image_url=None,
+            model_version=result.get('model_version')
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'id': history_record['id'],
+                'emotion': result['emotion'],
+                'confidence': result['confidence'],
+                'probabilities': result['all_probabilities'],
+                'model_version': result.get('model_version'),
+                'created_at': history_record['created_at'],
+                'duration_seconds': result['duration_seconds'],
+                'truncated': result['truncated'],
+                'frames_sampled': result['frames_sampled'],
+                'frames_analysed': result['frames_analysed'],
+                'duplicates_skipped': result['duplicates_skipped'],
+                'segments': result['segments'],
+                'frames': result['frames']
+            }
+        }), 200
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+def _submit_async_job(pet_id, image_bytes):
+    """Validate and queue a /detect?async=1 upload, returning 202 with the job id"""
+    from flask import url_for
+    from app.services.inference_jobs import JobQueueFull, submit_job
+    
+    if not current_app.config.get('JOBS_ENABLED', True):
+        return jsonify({
+            'success': False,
+            'error': 'Async detection is disabled'
+        }), 400
+    
+    try:
+        pet_id = int(pet_id)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'pet_id must be an integer'
+        }), 400
+    
+    try:
+        job_id = submit_job('dog', pet_id, image_bytes)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except JobQueueFull:
+        response = jsonify({
+            'success': False,
+            'error': 'Too many queued detections, try again shortly'
+        })
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    return jsonify({
+        'success': True,
+        'data': {
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': url_for('.get_job_status', job_id=job_id),
+            'events_url': url_for('.stream_job_events', job_id=job_id)
+        }
+    }), 202
+
+
+@dog_emotion_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """
+    Status of an async detection job
+    
+    Returns:
+        JSON with the job status ('queued', 'running', 'done' or 'failed')
+        and, once done, the same 'result' data /detect returns
+    """
+    from app.services.inference_jobs import get_job
+    
+    job = get_job(job_id, species='dog')
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': job
+    }), 200
+
+
+@dog_emotion_bp.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """
+    Server-sent events for an async detection job
+    
+    Sends a 'status' event on every status change and closes the stream
+    after the final 'done' / 'failed' event.
+    """
+    from flask import Response, stream_with_context
+    from app.services.inference_jobs import job_events
+    
+    events = job_events(job_id, species='dog', heartbeat_seconds=current_app.config.get('JOBS_SSE_HEARTBEAT_SECONDS', 15))
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@dog_emotion_bp.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """
+    Hit/miss counters of the dog prediction cache
+    """
+    from app.services.prediction_cache import get_prediction_cache
+    
+    return jsonify({
+        'success': True,
+        'enabled': bool(current_app.config.get('PREDICTION_CACHE_ENABLED')),
+        'data': get_prediction_cache('dog').stats()
+    }), 200
+
+
 @dog_emotion_bp.route('/history/<int:pet_id>', methods=['GET'])
 def get_emotion_history(pet_id):
     """
@@ -159,20 +565,16 @@ def get_emotion_history(pet_id):
 @dog_emotion_bp.route('/health', methods=['GET'])
 def health_check():
     """
-    Health check endpoint to verify model is loaded
+    Health check endpoint reporting whether the model is loaded
+    
+    Only reads the load state; it never loads the model itself.
     """
-    try:
-        from app.services.dog_emotion_service import get_dog_emotion_detector
-        detector = get_dog_emotion_detector()
-        
-        return jsonify({
-            'success': True,
-            'message': 'Dog emotion detector is ready',
-            'classes': detector.classes
-        }), 200
+    from app.services.model_preload import model_status
+    status = model_status('dog')
+    ready = status.get('state') == 'ready'
     
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return jsonify({
+        'success': ready,
+        'message': 'Dog emotion detector is ready' if ready else f"Dog emotion detector is {status.get('state')}",
+        'data': status
+    }), 200 if ready else 503
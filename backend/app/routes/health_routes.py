@@ -0,0 +1,27 @@
+from flask import Blueprint, jsonify
+from app.services.model_preload import is_ready, model_status
+from app.services.thread_budget import thread_budget_status
+
+health_bp = Blueprint("health", __name__)
+
+
+# ✅ Route: Liveness - the process is up and serving requests
+@health_bp.route('/live', methods=['GET'])
+def liveness():
+    return jsonify({'success': True, 'status': 'alive'}), 200
+
+
+# ✅ Route: Readiness - both emotion models are loaded and warmed up
+@health_bp.route('/ready', methods=['GET'])
+def readiness():
+    """
+    Reports load time and warmup latency per model. Never loads a model
+    itself; returns 503 until the startup preload has finished.
+    """
+    ready = is_ready()
+    return jsonify({
+        'success': ready,
+        'status': 'ready' if ready else 'not_ready',
+        'data': model_status(),
+        'cpu_budget': thread_budget_status()
+    }), 200 if ready else 503
@@ -0,0 +1,20 @@
+"""
+Model Registry Routes
+Read-only view of the registered emotion model versions and of what this
+worker is serving. Versions are changed with python -m app.services.model_registry.
+"""
+
+from flask import Blueprint, jsonify
+
+from app.services.model_registry import RegistryError, registry_status
+
+model_registry_bp = Blueprint('model_registry', __name__)
+
+
+# ✅ Route: Registered versions, the active one per species and this worker's swap state
+@model_registry_bp.route('', methods=['GET'])
+def list_models():
+    try:
+        return jsonify({'success': True, 'data': registry_status()}), 200
+    except RegistryError as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
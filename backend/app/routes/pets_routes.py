@@ -1,18 +1,12 @@
-import os
-import uuid
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
-from werkzeug.utils import secure_filename
+from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models import Pet
+from app.services.image_variants import delete_variants, schedule_variants, send_image, variant_urls
+from app.services.upload_store import get_upload_store
+from app.services.uploads import FORMAT_EXTENSIONS, PROFILE_IMAGE_FORMATS, UploadError, check_upload
 
 pet_bp = Blueprint("pets", __name__)
 
-# Allowed extensions
-ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
-
-def allowed_file(filename):
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
-
 
 # ✅ Route: Add new pet
 @pet_bp.route('/add', methods=['POST'])
@@ -30,17 +24,14 @@ def add_pet():
         image_file = request.files.get("image_file")
         image_filename = None
 
-        if image_file and allowed_file(image_file.filename):
-            ext = os.path.splitext(image_file.filename)[1]
-            unique_filename = f"{uuid.uuid4().hex}{ext}"    
-            filename = secure_filename(unique_filename)
-
-            upload_folder = current_app.config["UPLOAD_FOLDER"]
-            os.makedirs(upload_folder, exist_ok=True)
-
-            image_path = os.path.join(upload_folder, filename)
-            image_file.save(image_path)
-            image_filename = filename  # store only filename in DB
+        if image_file and image_file.filename:
+            try:
+                image_format = check_upload(image_file, PROFILE_IMAGE_FORMATS)
+            except UploadError as e:
+                return jsonify({"error": str(e)}), e.status
+            # Stored by content hash; the same photo uploaded twice is kept once
+            store = get_upload_store(current_app.config["UPLOAD_FOLDER"])
+            image_filename = store.put(image_file.stream, FORMAT_EXTENSIONS[image_format])
 
         new_pet = Pet(
             user_id=user_id,
@@ -55,7 +46,16 @@ def add_pet():
         )
 
         db.session.add(new_pet)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except Exception:
+            # the row was never saved: drop the reference put() added for it
+            db.session.rollback()
+            if image_filename:
+                store.release(image_filename, cleanup=delete_variants)
+            raise
+        if image_filename:
+            schedule_variants(store.path(image_filename))
 
         return jsonify({"message": "Pet added successfully!"}), 201
 
@@ -89,6 +89,7 @@ def get_pets():
             "breed": pet.breed,
             "pet_type": pet.pet_type,
             "image_url": image_url,
+            "image_variants": variant_urls(image_url),
             "device_mac_id": pet.device_mac_id,
         })
 
@@ -117,6 +118,7 @@ def get_pet_by_id(pet_id):
         "breed": pet.breed,
         "pet_type": pet.pet_type,
         "image_url": image_url,
+        "image_variants": variant_urls(image_url),
         "device_mac_id": pet.device_mac_id,
     }
 
@@ -124,10 +126,10 @@ def get_pet_by_id(pet_id):
 
 
 # ✅ Route: Serve pet images
-@pet_bp.route("/uploads/pets_data/<filename>")
+@pet_bp.route("/uploads/pets_data/<path:filename>")
 def uploaded_file(filename):
     upload_folder = current_app.config["UPLOAD_FOLDER"]
-    return send_from_directory(upload_folder, filename)
+    return send_image(upload_folder, filename, request.args.get("variant"))
 
 # ✅ Route: Delete a pet
 @pet_bp.route("/<int:pet_id>", methods=["DELETE"])
@@ -137,16 +139,15 @@ def delete_pet(pet_id):
         if not pet:
             return jsonify({"error": "Pet not found"}), 404
 
-        # delete image file if exists
-        if pet.image_url:
-            upload_folder = current_app.config["UPLOAD_FOLDER"]
-            image_path = os.path.join(upload_folder, pet.image_url)
-            if os.path.exists(image_path):
-                os.remove(image_path)
-
+        image_url = pet.image_url
         db.session.delete(pet)
         db.session.commit()
 
+        # delete image file if exists (once the row no longer points at it)
+        if image_url:
+            store = get_upload_store(current_app.config["UPLOAD_FOLDER"])
+            store.release(image_url, cleanup=delete_variants)
+
         return jsonify({"message": "Pet deleted successfully"}), 200
 
     except Exception as e:
@@ -170,24 +171,30 @@ def update_pet(pet_id):
         pet.device_mac_id = request.form.get("device_mac_id", pet.device_mac_id)
 
         image_file = request.files.get("image_file")
-        if image_file and allowed_file(image_file.filename):
-            ext = os.path.splitext(image_file.filename)[1]
-            unique_filename = f"{uuid.uuid4().hex}{ext}"
-            filename = secure_filename(unique_filename)
-            upload_folder = current_app.config["UPLOAD_FOLDER"]
-            os.makedirs(upload_folder, exist_ok=True)
-            image_path = os.path.join(upload_folder, filename)
-            image_file.save(image_path)
-
-            # delete old image
-            if pet.image_url:
-                old_path = os.path.join(upload_folder, pet.image_url)
-                if os.path.exists(old_path):
-                    os.remove(old_path)
-
+        filename = None
+        if image_file and image_file.filename:
+            try:
+                image_format = check_upload(image_file, PROFILE_IMAGE_FORMATS)
+            except UploadError as e:
+                return jsonify({"error": str(e)}), e.status
+            store = get_upload_store(current_app.config["UPLOAD_FOLDER"])
+            filename = store.put(image_file.stream, FORMAT_EXTENSIONS[image_format])
+            old_image_url = pet.image_url
             pet.image_url = filename
 
-        db.session.commit()
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if filename:
+                store.release(filename, cleanup=delete_variants)
+            raise
+
+        if filename:
+            schedule_variants(store.path(filename))
+            # release the old image (deleted once no other record uses it)
+            if old_image_url:
+                store.release(old_image_url, cleanup=delete_variants)
         return jsonify({"message": "Pet updated successfully!"}), 200
 
     except Exception as e:
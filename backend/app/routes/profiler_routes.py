@@ -0,0 +1,69 @@
+"""
+Profiler Admin Routes
+Switch request sampling on/off and download collected profiles.
+Registered only when PROFILER_ENABLED; every call needs an
+X-Profile-Signature header signed for its own path.
+"""
+
+from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from werkzeug.utils import secure_filename
+
+from app.services.profiler import SIGNATURE_HEADER, get_sampling_toggle, list_profiles, verify_signature
+
+profiler_bp = Blueprint('profiler', __name__)
+
+
+@profiler_bp.before_request
+def require_signature():
+    if not verify_signature(current_app.config.get('PROFILER_SECRET'), request.path,
+                            request.headers.get(SIGNATURE_HEADER)):
+        return jsonify({
+            'success': False,
+            'error': f'Missing or invalid {SIGNATURE_HEADER} header'
+        }), 403
+    return None
+
+
+# ✅ Route: Sampling state and the newest profiles
+@profiler_bp.route('', methods=['GET'])
+def profiler_status():
+    return jsonify({
+        'success': True,
+        'data': {
+            'sampling': get_sampling_toggle().read(),
+            'profiles': list_profiles(current_app.config['PROFILER_DIR'])
+        }
+    }), 200
+
+
+# ✅ Route: Sample a fraction of all requests for a while (every worker picks it up within a second)
+@profiler_bp.route('', methods=['POST'])
+def set_sampling():
+    """
+    Expected JSON: {"sample_rate": 0.05, "duration_seconds": 600}
+    A sample_rate of 0 switches sampling off.
+    """
+    payload = request.get_json(silent=True) or {}
+    try:
+        sample_rate = float(payload.get('sample_rate', 0))
+        duration_seconds = float(payload.get('duration_seconds', 600))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'sample_rate and duration_seconds must be numbers'}), 400
+
+    if not 0 <= sample_rate <= 1 or duration_seconds <= 0:
+        return jsonify({
+            'success': False,
+            'error': 'sample_rate must be within [0, 1] and duration_seconds positive'
+        }), 400
+
+    return jsonify({
+        'success': True,
+        'data': get_sampling_toggle().set(sample_rate, duration_seconds)
+    }), 200
+
+
+# ✅ Route: Download one profile (collapsed stacks, for flamegraph.pl / speedscope)
+@profiler_bp.route('/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    return send_from_directory(current_app.config['PROFILER_DIR'], secure_filename(name),
+                               mimetype='text/plain')
@@ -209,21 +209,15 @@
 #         return jsonify({"error": str(e)}), 500
 
 
-import os
-import uuid
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
-from werkzeug.utils import secure_filename
+from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models import Veterinarian
+from app.services.image_variants import delete_variants, schedule_variants, send_image, variant_urls
+from app.services.upload_store import get_upload_store
+from app.services.uploads import FORMAT_EXTENSIONS, PROFILE_IMAGE_FORMATS, UploadError, check_upload
 
 veteri_bp = Blueprint("veterinarians", __name__)
 
-# Allowed image extensions
-ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
-
-
-def allowed_file(filename):
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
 # ✅ Route: Add new veterinarian
@@ -243,17 +237,14 @@ def add_veterinarian():
         image_file = request.files.get("image_file")
         image_filename = None
 
-        if image_file and allowed_file(image_file.filename):
-            ext = os.path.splitext(image_file.filename)[1]
-            unique_filename = f"{uuid.uuid4().hex}{ext}"
-            filename = secure_filename(unique_filename)
-
-            upload_folder = current_app.config["UPLOAD_FOLDER_VETS"]
-            os.makedirs(upload_folder, exist_ok=True)
-
-            image_path = os.path.join(upload_folder, filename)
-            image_file.save(image_path)
-            image_filename = filename
+        if image_file and image_file.filename:
+            try:
+                image_format = check_upload(image_file, PROFILE_IMAGE_FORMATS)
+            except UploadError as e:
+                return jsonify({"error": str(e)}), e.status
+            # Stored by content hash; the same photo uploaded twice is kept once
+            store = get_upload_store(current_app.config["UPLOAD_FOLDER_VETS"])
+            image_filename = store.put(image_file.stream, FORMAT_EXTENSIONS[image_format])
 
         new_vet = Veterinarian(
             user_id=user_id,
@@ -269,7 +260,16 @@ def add_veterinarian():
         )
 
         db.session.add(new_vet)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except Exception:
+            # the row was never saved: drop the reference put() added for it
+            db.session.rollback()
+            if image_filename:
+                store.release(image_filename, cleanup=delete_variants)
+            raise
+        if image_filename:
+            schedule_variants(store.path(image_filename))
 
         return jsonify({"message": "Veterinarian added successfully!"}), 201
 
@@ -307,6 +307,7 @@ def get_veterinarians():
                 "gender": vet.gender,
                 "user_id": vet.user_id,
                 "image_url": image_url,
+                "image_variants": variant_urls(image_url),
             })
 
         return jsonify(vets_list), 200
@@ -340,16 +341,17 @@ def get_veterinarian_by_id(vet_id):
         "gender": vet.gender,
         "user_id": vet.user_id,
         "image_url": image_url,
+        "image_variants": variant_urls(image_url),
     }
 
     return jsonify(vet_data), 200
 
 
 # ✅ Route: Serve vet images
-@veteri_bp.route("/uploads/vets/<filename>")
+@veteri_bp.route("/uploads/vets/<path:filename>")
 def serve_vet_image(filename):
     upload_folder = current_app.config["UPLOAD_FOLDER_VETS"]
-    return send_from_directory(upload_folder, filename)
+    return send_image(upload_folder, filename, request.args.get("variant"))
 
 
 # ✅ Route: Delete veterinarian
@@ -360,16 +362,15 @@ def delete_veterinarian(vet_id):
         if not vet:
             return jsonify({"error": "Veterinarian not found"}), 404
 
-        # delete image if exists
-        if vet.image_url:
-            upload_folder = current_app.config["UPLOAD_FOLDER_VETS"]
-            image_path = os.path.join(upload_folder, vet.image_url)
-            if os.path.exists(image_path):
-                os.remove(image_path)
-
+        image_url = vet.image_url
         db.session.delete(vet)
         db.session.commit()
 
+        # delete image file if exists (once the row no longer points at it)
+        if image_url:
+            store = get_upload_store(current_app.config["UPLOAD_FOLDER_VETS"])
+            store.release(image_url, cleanup=delete_variants)
+
         return jsonify({"message": "Veterinarian deleted successfully!"}), 200
 
     except Exception as e:
@@ -395,25 +396,30 @@ def update_veterinarian(vet_id):
         vet.gender = request.form.get("gender", vet.gender)
 
         image_file = request.files.get("image_file")
-        if image_file and allowed_file(image_file.filename):
-            ext = os.path.splitext(image_file.filename)[1]
-            unique_filename = f"{uuid.uuid4().hex}{ext}"
-            filename = secure_filename(unique_filename)
-
-            upload_folder = current_app.config["UPLOAD_FOLDER_VETS"]
-            os.makedirs(upload_folder, exist_ok=True)
-            image_path = os.path.join(upload_folder, filename)
-            image_file.save(image_path)
-
-            # delete old image
-            if vet.image_url:
-                old_path = os.path.join(upload_folder, vet.image_url)
-                if os.path.exists(old_path):
-                    os.remove(old_path)
-
+        filename = None
+        if image_file and image_file.filename:
+            try:
+                image_format = check_upload(image_file, PROFILE_IMAGE_FORMATS)
+            except UploadError as e:
+                return jsonify({"error": str(e)}), e.status
+            store = get_upload_store(current_app.config["UPLOAD_FOLDER_VETS"])
+            filename = store.put(image_file.stream, FORMAT_EXTENSIONS[image_format])
+            old_image_url = vet.image_url
             vet.image_url = filename
 
-        db.session.commit()
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if filename:
+                store.release(filename, cleanup=delete_variants)
+            raise
+
+        if filename:
+            schedule_variants(store.path(filename))
+            # release the old image (deleted once no other record uses it)
+            if old_image_url:
+                store.release(old_image_url, cleanup=delete_variants)
         return jsonify({"message": "Veterinarian updated successfully!"}), 200
 
     except Exception as e:
@@ -0,0 +1,212 @@
+"""
+Prefork Server
+Production entry point for the web app (replaces app.run(debug=True)).
+
+The master process loads the cat model weights once, before forking, so
+every worker shares the same physical weight pages copy-on-write (bundles
+from build_model_bundles.py are additionally file-backed mmaps, shared
+through the page cache). Workers only warm up their own thread pools,
+which makes their cold start much shorter than importing torch and
+reading the weights from scratch. TensorFlow cannot be forked once it
+has loaded a model, so every worker loads the dog model itself (from the
+dog bundle when there is one).
+
+The master never runs a forward pass: framework thread pools do not
+survive fork(), so anything that starts threads (warmup, the cat
+batching scheduler, the decode pool) happens inside the workers.
+
+Run from the backend/ folder:
+    python -m app.main                       # WEB_WORKERS workers on port 8000
+    python -m app.server --workers 4 --port 8000
+    python -m app.main --dev                 # Flask debug server with reloader
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger("PreforkServer")
+
+
+# Models whose framework survives fork() after loading. TensorFlow does
+# not: its runtime threads and locks are created with the first model, and
+# a worker forked after that deadlocks on its first op. The dog model is
+# therefore always loaded inside each worker.
+FORK_SAFE_SPECIES = ("cat",)
+
+# Every worker holds its own TensorFlow dog model, so memory grows with the
+# worker count: a small fixed default, not one per core
+DEFAULT_WORKERS = 2
+
+
+def load_models_in_master(app, species_list):
+    """Load (but do not run) the fork-safe detectors so forked workers inherit them"""
+    with app.app_context():
+        if app.config.get("INFERENCE_SERVER_SOCKET"):
+            return  # the inference server owns the models
+        if app.config.get("INFERENCE_BACKEND", "native") != "native":
+            return  # ONNX Runtime sessions are created per worker
+
+        for species in species_list:
+            if species not in FORK_SAFE_SPECIES:
+                print(f"ℹ️  {species} model is loaded in each worker (framework is not fork-safe)")
+                continue
+            started = time.perf_counter()
+            try:
+                from app.services.cat_emotion_service import get_cat_emotion_detector
+                get_cat_emotion_detector()
+                print(f"✅ {species} model loaded in master in {time.perf_counter() - started:.2f}s")
+            except Exception as e:
+                # Workers retry the load themselves and report it through /api/health/ready
+                print(f"❌ Could not load the {species} model in the master: {e}")
+
+
+def run_worker(app, listener, species_list, preload):
+    """Worker process body: warm up, then serve requests on the shared socket"""
+    from werkzeug.serving import make_server
+    from app.services.inference_jobs import start_job_workers
+    from app.services.model_preload import preload_models
+    from app.services.model_registry import start_registry_watcher
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if preload:
+        preload_models(app, species_list, background=False)
+    start_job_workers(app)
+    start_registry_watcher(app)
+
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+    print(f"✅ Worker {os.getpid()} ready")
+    server.serve_forever()
+
+
+def spawn_worker(app, listener, species_list, preload):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(app, listener, species_list, preload)
+        except SystemExit as e:
+            code = e.code or 0
+        except BaseException:
+            logger.exception("Worker crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(host="0.0.0.0", port=8000, workers=DEFAULT_WORKERS, species_list=("cat", "dog"), preload="master"):
+    """
+    Bind the socket, load the models and keep `workers` children alive
+    
+    Args:
+        preload (str): "master" loads the fork-safe weights once before
+            forking and warms up in each worker; "worker" has every worker load its own
+            copy after the fork; "none" loads lazily on the first request
+    """
+    from app import create_app, db
+    from app.services.thread_budget import configure_thread_budget
+
+    app = create_app(preload_models=False)
+    # Budget the cores for this many workers before torch / TF are imported
+    app.config["CPU_BUDGET_WORKERS"] = workers
+    configure_thread_budget(app)
+    with app.app_context():
+        try:
+            db.create_all()  # create tables if not exist
+        except Exception as e:
+            print(f"⚠️  Could not create database tables: {e}")
+        finally:
+            # Do not hand pooled DB connections down to the forked workers
+            db.engine.dispose()
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(1024)
+
+    if preload == "master":
+        load_models_in_master(app, species_list)
+
+    children = {}
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        pid = spawn_worker(app, listener, species_list, preload != "none")
+        children[pid] = time.time()
+    print(f"✅ Serving on http://{host}:{port} with {workers} workers (master {os.getpid()})")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        started = children.pop(pid, 0)
+        if stopping:
+            continue
+
+        # Replace crashed workers, but do not spin if they die right away
+        if time.time() - started < 1:
+            time.sleep(1)
+        logger.warning(f"Worker {pid} exited with status {status}, restarting")
+        new_pid = spawn_worker(app, listener, species_list, preload != "none")
+        children[new_pid] = time.time()
+
+    listener.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pet monitoring prefork web server")
+    parser.add_argument("--host", default=os.environ.get("WEB_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("WEB_PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", DEFAULT_WORKERS)),
+                        help=f"Worker processes (default {DEFAULT_WORKERS}); each loads its own dog model")
+    parser.add_argument("--species", default="cat,dog", help="Emotion models to preload")
+    parser.add_argument("--preload", choices=["master", "worker", "none"], default="master",
+                        help="Where the model weights are loaded (default: once, in the master)")
+    parser.add_argument("--dev", action="store_true", help="Run the Flask debug server with the reloader")
+    args = parser.parse_args(argv)
+
+    if args.dev or not hasattr(os, "fork"):
+        if not args.dev:
+            # Windows has no fork(): serve from one process instead of prefork workers
+            print("⚠️ os.fork() is not available on this platform, running a single-process server")
+        from app import create_app, db
+        app = create_app()
+        with app.app_context():
+            db.create_all()  # create tables if not exist
+        app.run(host=args.host, port=args.port, debug=args.dev, threaded=True)
+        return
+
+    serve(
+        host=args.host,
+        port=args.port,
+        workers=max(1, args.workers),
+        species_list=tuple(s.strip() for s in args.species.split(",") if s.strip()),
+        preload=args.preload,
+    )
+
+
+if __name__ == "__main__":
+    main()
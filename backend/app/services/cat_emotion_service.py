@@ -3,16 +3,29 @@ Cat Emotion Detection Service
 Uses EfficientNet-B0 model to predict cat emotions from images
 """
 
-from PIL import Image
+import numpy as np
 import os
+import queue
+import threading
+import time
 import logging
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from traceback import format_exc
 
+from app.services.onnx_backend import resolve_model_path, softmax
+from app.services.parallel_decode import decode_into_batch
+from app.services.metrics import BATCH_SIZE, STAGE_SECONDS
+from app.services.model_bundle import is_bundle, load_bundle
+from app.services.model_preload import mark_loading, record_load
+from app.services.prediction_cache import model_fingerprint
+from app.services.preprocessing import get_input_pool, input_shape, load_image, resize_image, write_input
+from app.services.settings import get_setting
+from app.services.thread_budget import apply_torch_threads, inference_slot, species_threads
+
 # Lazy-import placeholders for torch/torchvision to avoid DLL init crashes
 _TORCH_IMPORT_ERROR = None
 _TORCH = None
 _TORCH_NN = None
-_TORCH_TRANSFORMS = None
 
 # ==========================
 # LOGGING CONFIGURATION
@@ -23,29 +36,87 @@ logging.basicConfig(
 )
 logger = logging.getLogger("CatEmotionDetector")
 
+_DECODE_SECONDS = STAGE_SECONDS.labels("cat", "decode")
+_PREPROCESS_SECONDS = STAGE_SECONDS.labels("cat", "preprocess")
+_FORWARD_SECONDS = STAGE_SECONDS.labels("cat", "forward")
+_BATCH_SIZE = BATCH_SIZE.labels("cat")
+
+# Cascade stages reported in each prediction's "stage" field
+STAGE_FAST = "resnet18"
+STAGE_ACCURATE = "efficientnet_b0"
+
 
 class CatEmotionDetector:
     """Service class for detecting cat emotions using EfficientNet-B0"""
     
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, backend="native", cascade_model_path=None, cascade_threshold=0.7,
+                 classes=None, version=None):
+        """
+        Args:
+            model_path (str): Weights (.pth or .bundle folder for native,
+                .onnx for onnx). Defaults to app/trained/cat_resnet18.bundle
+                when it exists, else cat_resnet18.pth
+            backend (str): "native" runs PyTorch, "onnx" runs ONNX Runtime
+                and never imports torch
+            cascade_model_path (str): EfficientNet-B0 weights (.pth). When
+                set, predictions whose ResNet18 top-1 confidence is below
+                cascade_threshold are re-run through EfficientNet-B0
+                (native backend only)
+            cascade_threshold (float): Top-1 softmax confidence needed to
+                answer from the ResNet18 stage
+            classes (list): Output class names, in model output order
+                (default: angry, happy, sad; bundles carry their own)
+            version (str): Model registry version, reported with every
+                prediction. Defaults to the weights' fingerprint
+        """
         logger.debug("Initializing CatEmotionDetector service...")
         
         self.device = "cpu"
         logger.debug(f"Selected device: {self.device}")
 
-        self.classes = ["angry", "happy", "sad"]
+        self.classes = list(classes) if classes else ["angry", "happy", "sad"]
+        self.backend = backend
+        self.input_pool = get_input_pool("cat")
+        
+        self.cascade_model = None
+        self.cascade_model_path = cascade_model_path
+        self.cascade_threshold = float(cascade_threshold)
+        self._cascade_lock = threading.Lock()
+        self.reset_cascade_stats()
 
         try:
             if model_path is None:
                 base_dir = os.path.dirname(os.path.abspath(__file__))
                 app_dir = os.path.dirname(base_dir)
-                model_path = os.path.join(app_dir, "trained", "cat_resnet18.pth")
+                filename = "cat_resnet18.onnx" if backend == "onnx" else "cat_resnet18.pth"
+                model_path = os.path.join(app_dir, "trained", filename)
+                bundle_path = os.path.join(app_dir, "trained", "cat_resnet18.bundle")
+                if backend == "native" and is_bundle(bundle_path):
+                    model_path = bundle_path
 
             self.model_path = model_path
             logger.debug(f"Model path resolved to: {self.model_path}")
 
-            # model and transforms are created during lazy import in _load_model
-            self.model = self._load_model()
+            if backend == "onnx":
+                self.model = self._load_onnx_model()
+            elif backend == "native":
+                # model is created during lazy import in _load_model
+                self.model = self._load_model()
+            else:
+                raise ValueError(f"Unknown inference backend: {backend}")
+
+            if cascade_model_path:
+                if backend != "native":
+                    raise ValueError("The cat model cascade needs the native (PyTorch) backend")
+                self.cascade_model = self._load_cascade_model(cascade_model_path)
+
+            # Identifies these exact weights, e.g. for prediction cache keys
+            self.model_version = model_fingerprint(self.model_path)
+            if self.cascade_model is not None:
+                self.model_version = (
+                    f"{self.model_version}+{model_fingerprint(cascade_model_path)}@{self.cascade_threshold:g}"
+                )
+            self.version = version or self.model_version
 
         except Exception as e:
             logger.error("❌ Error during initialization")
@@ -60,32 +131,29 @@ class CatEmotionDetector:
 
             # Lazy import torch/torchvision here so the module can be imported
             # without triggering Windows DLL initialization failures.
-            global _TORCH_IMPORT_ERROR, _TORCH, _TORCH_NN, _TORCH_TRANSFORMS
+            global _TORCH_IMPORT_ERROR, _TORCH, _TORCH_NN
             try:
                 import torch as _t
                 import torch.nn as _nn
-                from torchvision import models, transforms as _transforms
+                from torchvision import models
                 _TORCH = _t
                 _TORCH_NN = _nn
-                _TORCH_TRANSFORMS = _transforms
+                apply_torch_threads(_TORCH)
             except Exception as imp_err:
                 _TORCH_IMPORT_ERROR = imp_err
                 logger.critical(f"PyTorch import failed: {imp_err}")
                 raise
 
-            # Build model
-            model = models.resnet18(weights=None)
-            model.fc = _TORCH_NN.Linear(model.fc.in_features, 3)
-
             # Set device now that torch is imported
             self.device = "cuda" if _TORCH.cuda.is_available() else "cpu"
             logger.debug(f"Resolved device after torch import: {self.device}")
 
-            # Create transforms
-            self.transform = _TORCH_TRANSFORMS.Compose([
-                _TORCH_TRANSFORMS.Resize((224, 224)),
-                _TORCH_TRANSFORMS.ToTensor(),
-            ])
+            if is_bundle(self.model_path):
+                return self._load_bundle_model(models)
+
+            # Build model
+            model = models.resnet18(weights=None)
+            model.fc = _TORCH_NN.Linear(model.fc.in_features, len(self.classes))
 
             if not os.path.exists(self.model_path):
                 logger.critical(f"Model file does not exist: {self.model_path}")
@@ -107,6 +175,59 @@ class CatEmotionDetector:
             raise e
     
     
+    def _load_bundle_model(self, models):
+        """
+        Build ResNet18 directly on top of a memory-mapped weight bundle
+        
+        The module is created on the meta device (no random init, no
+        allocation) and its parameters are then assigned tensors that
+        alias the mapped file. On CPU the weights are never copied, so
+        processes loading the same bundle share its pages.
+        """
+        manifest, arrays = load_bundle(self.model_path, verify=get_setting("MODEL_BUNDLE_VERIFY", True))
+        self.classes = manifest.get("classes", self.classes)
+        
+        with _TORCH.device("meta"):
+            model = models.resnet18(weights=None)
+            model.fc = _TORCH_NN.Linear(model.fc.in_features, len(self.classes))
+        
+        state_dict = {name: _TORCH.from_numpy(array) for name, array in arrays.items()}
+        model.load_state_dict(state_dict, assign=True)
+        
+        model.eval()
+        model.to(self.device)
+        
+        logger.info(f"Model bundle {manifest['version']} mapped successfully ✔")
+        return model
+    
+    
+    def _load_cascade_model(self, path):
+        """Load the EfficientNet-B0 second stage (same inputs as the ResNet18)"""
+        from efficientnet_pytorch import EfficientNet
+        
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Cascade model missing at: {path}")
+        
+        logger.info(f"Loading cascade model from: {path}")
+        # from_name builds the architecture without downloading ImageNet weights
+        model = EfficientNet.from_name("efficientnet-b0", num_classes=len(self.classes))
+        model.load_state_dict(_TORCH.load(path, map_location=self.device))
+        model.eval()
+        model.to(self.device)
+        
+        logger.info(f"Cascade model loaded, escalating below {self.cascade_threshold:.2f} confidence ✔")
+        return model
+    
+    
+    def _load_onnx_model(self):
+        """Load the exported ResNet18 graph into ONNX Runtime (no torch import)"""
+        logger.info(f"Loading ONNX model from: {self.model_path}")
+        from app.services.onnx_backend import OnnxModel
+        model = OnnxModel(self.model_path, *species_threads("cat"))
+        logger.info("ONNX model loaded successfully ✔")
+        return model
+    
+    
     def predict(self, image_path):
         logger.debug(f"Starting prediction for image: {image_path}")
         
@@ -115,35 +236,16 @@ class CatEmotionDetector:
             return {"success": False, "error": "Image file not found"}
         
         try:
-            img = Image.open(image_path).convert("RGB")
+            img = self._decode(image_path)
             logger.debug("Image loaded successfully.")
             
-            img_tensor = self.transform(img).unsqueeze(0).to(self.device)
-            logger.debug("Image preprocessing completed.")
-            
-            with _TORCH.no_grad():
-                outputs = self.model(img_tensor)
-
-            probabilities = _TORCH.softmax(outputs, dim=1)
-            predicted_idx = _TORCH.argmax(probabilities, dim=1).item()
-            confidence = probabilities[0][predicted_idx].item()
+            result = self.predict_images([img])[0]
             
             logger.info(
-                f"Prediction completed - Emotion: {self.classes[predicted_idx]}, "
-                f"Confidence: {confidence:.4f}"
+                f"Prediction completed - Emotion: {result['emotion']}, "
+                f"Confidence: {result['confidence']:.4f}"
             )
-            
-            all_probabilities = {
-                self.classes[i]: float(probabilities[0][i].item())
-                for i in range(len(self.classes))
-            }
-            
-            return {
-                "success": True,
-                "emotion": self.classes[predicted_idx],
-                "confidence": float(confidence),
-                "all_probabilities": all_probabilities
-            }
+            return result
         
         except Exception as e:
             logger.error("❌ Prediction failed due to an exception.")
@@ -155,65 +257,509 @@ class CatEmotionDetector:
         logger.debug("Starting prediction from image bytes stream...")
         
         try:
-            from io import BytesIO
+            result = self.predict_images([self._decode(image_bytes)])[0]
             
-            img = Image.open(BytesIO(image_bytes)).convert("RGB")
-            img_tensor = self.transform(img).unsqueeze(0).to(self.device)
-
-            with _TORCH.no_grad():
-                outputs = self.model(img_tensor)
-
-            probabilities = _TORCH.softmax(outputs, dim=1)
-            predicted_idx = _TORCH.argmax(probabilities, dim=1).item()
-            confidence = probabilities[0][predicted_idx].item()
+            logger.info(f"Predicted from bytes: {result['emotion']} ({result['confidence']:.4f})")
+            return result
+        
+        except Exception as e:
+            logger.error("❌ Error predicting from bytes")
+            logger.debug(format_exc())
+            return {"success": False, "error": str(e)}
+    
+    
+    def predict_batch_from_bytes(self, images_bytes):
+        """
+        Predict emotions for several uploads with one forward pass
+        
+        Images are decoded in parallel straight into a pooled input batch;
+        an image that fails to decode gets its own error entry and does not
+        affect the rest of the batch.
+        
+        Args:
+            images_bytes (list): Raw image data or binary file-like objects (upload streams), one per image
             
-            logger.info(f"Predicted from bytes: {self.classes[predicted_idx]} ({confidence:.4f})")
+        Returns:
+            list: One prediction dict per input, in the same order
+        """
+        with self.input_pool.batch(len(images_bytes)) as batch:
+            errors = decode_into_batch("cat", self._decode, images_bytes, batch)
+            results = [{"success": False, "error": error} if error else None for error in errors]
+            ok_indices = [i for i, error in enumerate(errors) if error is None]
             
-            all_probabilities = {
-                self.classes[i]: float(probabilities[0][i].item())
-                for i in range(len(self.classes))
-            }
+            if ok_indices:
+                try:
+                    # Only a batch with failed images needs its good rows gathered (copied)
+                    inputs = batch if len(ok_indices) == len(batch) else batch[ok_indices]
+                    predictions = self.predict_preprocessed(inputs)
+                    for i, prediction in zip(ok_indices, predictions):
+                        results[i] = prediction
+                except Exception as e:
+                    logger.error("❌ Batched prediction failed")
+                    logger.debug(format_exc())
+                    for i in ok_indices:
+                        results[i] = {"success": False, "error": str(e)}
+        
+        logger.info(f"Predicted batch of {len(images_bytes)} ({len(ok_indices)} decoded)")
+        return results
+    
+    
+    def predict_images(self, images):
+        """
+        Run a single forward pass over decoded images
+        
+        Each image is resized and written into a row of a pooled input
+        batch, which the model reads in place.
+        
+        Args:
+            images (list): RGB PIL images (or (3, 224, 224) float32 arrays)
             
-            return {
-                "success": True,
-                "emotion": self.classes[predicted_idx],
-                "confidence": float(confidence),
-                "all_probabilities": all_probabilities
-            }
+        Returns:
+            list: One prediction dict per input, in the same order
+        """
+        with self.input_pool.batch(len(images)) as batch:
+            started = time.perf_counter()
+            for image, row in zip(images, batch):
+                if isinstance(image, np.ndarray):
+                    row[...] = image
+                else:
+                    write_input("cat", resize_image("cat", image), row)
+            _PREPROCESS_SECONDS.observe(time.perf_counter() - started)
+            return self.predict_preprocessed(batch)
+    
+    
+    def predict_preprocessed(self, batch):
+        """
+        Predict from a float32 NumPy batch laid out like
+        app.services.preprocessing builds it for "cat" (N, 3, 224, 224)
+        
+        The array is wrapped without copying, so callers may pass a view
+        into shared memory.
+        """
+        stages = None
+        with inference_slot("cat"):
+            started = time.perf_counter()
+            if self.backend == "onnx":
+                probabilities = softmax(self.model.run(batch))
+            elif self.cascade_model is not None:
+                probabilities, stages = self._forward_cascade(batch)
+            else:
+                probabilities = self._forward_torch(batch)
+            _FORWARD_SECONDS.observe(time.perf_counter() - started)
+        _BATCH_SIZE.observe(len(batch))
+        
+        if stages is None:
+            stages = [STAGE_FAST] * len(probabilities)
+        return [self._build_result(row, stage) for row, stage in zip(probabilities, stages)]
+    
+    
+    def _forward_torch(self, batch, model=None):
+        """Forward a (N, 3, 224, 224) array through PyTorch, returning softmax probabilities"""
+        inputs = _TORCH.from_numpy(batch).to(self.device)
+        
+        with _TORCH.no_grad():
+            outputs = (model or self.model)(inputs)
+        
+        return _TORCH.softmax(outputs, dim=1).cpu().numpy()
+    
+    
+    def _forward_cascade(self, batch, threshold=None):
+        """
+        Run ResNet18 on the whole batch, then EfficientNet-B0 on the rows
+        whose top-1 confidence is below the threshold
+        
+        Both models were trained on the same Resize + ToTensor inputs, so
+        the escalated rows are gathered from the already preprocessed batch.
+        
+        Returns:
+            tuple: (probabilities array, list of the stage that answered each row)
+        """
+        threshold = self.cascade_threshold if threshold is None else threshold
+        
+        started = time.perf_counter()
+        probabilities = self._forward_torch(batch)
+        fast_seconds = time.perf_counter() - started
+        
+        escalate = np.flatnonzero(probabilities.max(axis=1) < threshold)
+        stages = [STAGE_FAST] * len(probabilities)
+        accurate_seconds = 0.0
+        
+        if len(escalate):
+            started = time.perf_counter()
+            with self.input_pool.batch(len(escalate)) as hard:
+                np.take(batch, escalate, axis=0, out=hard)
+                probabilities[escalate] = self._forward_torch(hard, self.cascade_model)
+            accurate_seconds = time.perf_counter() - started
+            for i in escalate:
+                stages[i] = STAGE_ACCURATE
+        
+        with self._cascade_lock:
+            stats = self._cascade_stats
+            stats["images"] += len(probabilities)
+            stats["escalated"] += len(escalate)
+            stats["fast_seconds"] += fast_seconds
+            stats["accurate_seconds"] += accurate_seconds
+        
+        return probabilities, stages
+    
+    
+    def warm_up_cascade(self, batch_sizes=(1,)):
+        """Warm the EfficientNet-B0 stage too (zero inputs may never escalate), then clear the stats"""
+        if self.cascade_model is None:
+            return
+        for size in batch_sizes:
+            with self.input_pool.batch(int(size)) as batch:
+                batch.fill(0)
+                self._forward_cascade(batch, threshold=1.01)
+        self.reset_cascade_stats()
+    
+    
+    def reset_cascade_stats(self):
+        with self._cascade_lock:
+            self._cascade_stats = {"images": 0, "escalated": 0, "fast_seconds": 0.0, "accurate_seconds": 0.0}
+    
+    
+    def cascade_stats(self):
+        """
+        Escalation rate and average compute cost of the cascade
+        
+        Costs are forward-pass milliseconds per image; relative_cost is the
+        average cost in units of one ResNet18 pass (1.0 = never escalates).
+        """
+        with self._cascade_lock:
+            stats = dict(self._cascade_stats)
+        
+        images = stats["images"]
+        escalated = stats["escalated"]
+        fast_ms = stats["fast_seconds"] * 1000.0 / images if images else 0.0
+        accurate_ms = stats["accurate_seconds"] * 1000.0 / escalated if escalated else 0.0
+        avg_cost_ms = (stats["fast_seconds"] + stats["accurate_seconds"]) * 1000.0 / images if images else 0.0
+        
+        return {
+            "enabled": self.cascade_model is not None,
+            "threshold": self.cascade_threshold,
+            "stages": [STAGE_FAST, STAGE_ACCURATE] if self.cascade_model is not None else [STAGE_FAST],
+            "images": images,
+            "escalated": escalated,
+            "escalation_rate": escalated / images if images else 0.0,
+            "fast_ms_per_image": round(fast_ms, 3),
+            "accurate_ms_per_image": round(accurate_ms, 3),
+            "avg_cost_ms_per_image": round(avg_cost_ms, 3),
+            "relative_cost": round(avg_cost_ms / fast_ms, 3) if fast_ms else None,
+        }
+    
+    
+    def _decode(self, image_bytes):
+        """Decode raw upload bytes, an upload stream or a file path into an upright RGB PIL image"""
+        started = time.perf_counter()
+        img = load_image(image_bytes)
+        _DECODE_SECONDS.observe(time.perf_counter() - started)
+        return img
+    
+    
+    def _build_result(self, probabilities, stage=STAGE_FAST):
+        """Turn one row of softmax probabilities into the API result dict"""
+        predicted_idx = int(np.argmax(probabilities))
+        confidence = probabilities[predicted_idx]
+        
+        all_probabilities = {
+            self.classes[i]: float(probabilities[i])
+            for i in range(len(self.classes))
+        }
         
+        return {
+            "success": True,
+            "emotion": self.classes[predicted_idx],
+            "confidence": float(confidence),
+            "all_probabilities": all_probabilities,
+            "stage": stage,
+            "model_version": self.version
+        }
+
+
+class CatInferenceScheduler:
+    """
+    Dynamic micro-batching queue in front of CatEmotionDetector
+    
+    Request threads decode their own image, then park it on a bounded
+    queue. A single scheduler thread drains the queue
+    into one batch, flushing as soon as it holds max_batch_size images or
+    the oldest image has waited max_wait_ms, and hands every caller back
+    its own result.
+    """
+    
+    def __init__(self, detector, max_batch_size=16, max_wait_ms=5, queue_depth=256):
+        self.detector = detector
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.queue_depth = int(queue_depth)
+        
+        self._queue = queue.Queue(maxsize=self.queue_depth)
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._images = 0
+        
+        self._thread = threading.Thread(
+            target=self._run, name="cat-emotion-scheduler", daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"Cat inference scheduler started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={max_wait_ms}, queue_depth={self.queue_depth})"
+        )
+    
+    @property
+    def device(self):
+        return self.detector.device
+    
+    @property
+    def classes(self):
+        return self.detector.classes
+    
+    @property
+    def model_version(self):
+        return self.detector.model_version
+    
+    @property
+    def version(self):
+        return self.detector.version
+    
+    def predict(self, image_path):
+        return self.detector.predict(image_path)
+    
+    def predict_from_bytes(self, image_bytes, timeout=30):
+        """
+        Same contract as CatEmotionDetector.predict_from_bytes, but the
+        forward pass is shared with any other requests in flight
+        
+        Decoding, resizing and the float32 conversion run here, in the
+        request thread, so concurrent requests prepare their inputs in
+        parallel and the scheduler thread only batches forward passes.
+        """
+        try:
+            img = self.detector._decode(image_bytes)
+            started = time.perf_counter()
+            row = np.empty(input_shape("cat", 1)[1:], dtype=np.float32)
+            write_input("cat", resize_image("cat", img), row)
+            _PREPROCESS_SECONDS.observe(time.perf_counter() - started)
         except Exception as e:
-            logger.error("❌ Error predicting from bytes")
+            logger.error("❌ Error decoding image bytes")
             logger.debug(format_exc())
             return {"success": False, "error": str(e)}
+        
+        return self.predict_array(row, timeout=timeout)
+    
+    def predict_array(self, image, timeout=30):
+        """
+        Queue one decoded image and wait for its result
+        
+        Args:
+            image: RGB PIL image, or an already preprocessed
+                (3, 224, 224) float32 array
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((image, future))
+        except queue.Full:
+            logger.warning("Cat inference queue is full, rejecting request")
+            return {"success": False, "error": "Inference queue is full, please retry"}
+        
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return {"success": False, "error": "Timed out waiting for inference"}
+    
+    def stats(self):
+        with self._stats_lock:
+            batches, images = self._batches, self._images
+        return {
+            "batches": batches,
+            "images": images,
+            "avg_batch_size": (images / batches) if batches else 0.0,
+            "queue_size": self._queue.qsize(),
+        }
+    
+    def _collect_batch(self):
+        """Block for the first item, then gather more until full or the deadline passes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            
+            try:
+                results = self.detector.predict_images([item[0] for item in batch])
+            except Exception as e:
+                logger.error("❌ Batched prediction failed")
+                logger.debug(format_exc())
+                results = [{"success": False, "error": str(e)}] * len(batch)
+            
+            with self._stats_lock:
+                self._batches += 1
+                self._images += len(batch)
+            
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            
+            logger.debug(f"Flushed cat inference batch of {len(batch)}")
 
 
 # Singleton pattern
 _detector_instance = None
+_detector_lock = threading.Lock()
 
 def get_cat_emotion_detector():
+    """
+    Get or create the global cat detector
+    
+    Thread-safe: concurrent first callers wait for a single load instead
+    of each loading their own copy of the model.
+    """
     global _detector_instance
-    if _detector_instance is None:
-        logger.debug("Creating new global CatEmotionDetector instance.")
-        try:
-            _detector_instance = CatEmotionDetector()
-        except Exception as e:
-            # If initialization failed (e.g., PyTorch DLL error), return a
-            # dummy detector that surfaces the error in API responses.
-            err = str(e)
-            if _TORCH_IMPORT_ERROR is not None:
-                err = f"PyTorch import error: {_TORCH_IMPORT_ERROR}"
-            logger.error(f"Falling back to DummyDetector due to: {err}")
-            class DummyDetector:
-                def __init__(self, message):
-                    self.device = "cpu"
-                    self.classes = ["angry", "happy", "sad"]
-                    self._error = message
-
-                def predict(self, image_path):
-                    return {"success": False, "error": f"Model not available: {self._error}"}
-
-                def predict_from_bytes(self, image_bytes):
-                    return {"success": False, "error": f"Model not available: {self._error}"}
-
-            _detector_instance = DummyDetector(err)
+    if _detector_instance is not None:
+        return _detector_instance
+    
+    with _detector_lock:
+        if _detector_instance is None:
+            _detector_instance = _create_cat_emotion_detector()
     return _detector_instance
+
+
+def build_cat_emotion_detector(model_path=None, classes=None, version=None):
+    """
+    Create a CatEmotionDetector from the app config (backend, cascade)
+    
+    Args:
+        model_path (str): Weights to load instead of the configured ones,
+            e.g. a model registry version
+        classes (list): Class names for those weights
+        version (str): Registry version reported with every prediction
+        
+    Raises:
+        Exception: Whatever the model load raised
+    """
+    backend = get_setting("INFERENCE_BACKEND", "native")
+    if model_path is None:
+        from app.services.model_registry import active_model
+        entry = active_model("cat", backend)
+        if entry is not None:
+            model_path, classes, version = entry["artifact_path"], entry["classes"], entry["version"]
+    if model_path is None:
+        model_path = get_setting("CAT_MODEL_PATH")
+        if backend == "onnx":
+            model_path = resolve_model_path(
+                "cat_resnet18",
+                get_setting("CAT_ONNX_MODEL_PATH"),
+                get_setting("ONNX_MODEL_VARIANT", "fp32"),
+            )
+    return CatEmotionDetector(
+        model_path=model_path, backend=backend, classes=classes, version=version, **_cascade_settings(backend)
+    )
+
+
+def swap_cat_emotion_detector(detector):
+    """
+    Make `detector` the global cat detector (and the scheduler's model)
+    
+    Requests already holding the old detector finish on it; the next
+    batch and the next request use the new one.
+    
+    Returns:
+        The previous detector (None if none was loaded)
+    """
+    global _detector_instance
+    with _detector_lock:
+        previous, _detector_instance = _detector_instance, detector
+        if _scheduler_instance is not None:
+            _scheduler_instance.detector = detector
+    return previous
+
+
+def _create_cat_emotion_detector():
+    logger.debug("Creating new global CatEmotionDetector instance.")
+    mark_loading("cat")
+    started = time.perf_counter()
+    try:
+        detector = build_cat_emotion_detector()
+        record_load("cat", time.perf_counter() - started)
+        return detector
+    except Exception as e:
+        # If initialization failed (e.g., PyTorch DLL error), return a
+        # dummy detector that surfaces the error in API responses.
+        err = str(e)
+        if _TORCH_IMPORT_ERROR is not None:
+            err = f"PyTorch import error: {_TORCH_IMPORT_ERROR}"
+        logger.error(f"Falling back to DummyDetector due to: {err}")
+        record_load("cat", time.perf_counter() - started, error=err)
+        class DummyDetector:
+            def __init__(self, message):
+                self.device = "cpu"
+                self.classes = ["angry", "happy", "sad"]
+                self._error = message
+
+            def predict(self, image_path):
+                return {"success": False, "error": f"Model not available: {self._error}"}
+
+            def predict_from_bytes(self, image_bytes):
+                return {"success": False, "error": f"Model not available: {self._error}"}
+
+            def predict_batch_from_bytes(self, images_bytes):
+                return [self.predict_from_bytes(data) for data in images_bytes]
+
+        return DummyDetector(err)
+
+
+def _cascade_settings(backend):
+    """Constructor arguments for the ResNet18 -> EfficientNet-B0 cascade (CAT_CASCADE_* config)"""
+    if not get_setting("CAT_CASCADE_ENABLED", False):
+        return {}
+    
+    path = get_setting("CAT_CASCADE_MODEL_PATH") or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trained", "cat_efficientnet.pth"
+    )
+    if backend != "native" or not os.path.exists(path):
+        # Serve the fast model alone rather than no cat model at all
+        logger.warning(f"Cat cascade disabled: needs the native backend and EfficientNet-B0 weights at {path}")
+        return {}
+    return {"cascade_model_path": path, "cascade_threshold": get_setting("CAT_CASCADE_THRESHOLD", 0.7)}
+
+
+_scheduler_instance = None
+_scheduler_lock = threading.Lock()
+
+def get_cat_inference_scheduler():
+    """
+    Get or create the global micro-batching scheduler
+    
+    Batch size, wait time and queue depth come from the Flask config
+    (CAT_BATCH_MAX_SIZE, CAT_BATCH_MAX_WAIT_MS, CAT_BATCH_QUEUE_DEPTH).
+    Falls back to the plain detector when the model could not be loaded.
+    """
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        with _scheduler_lock:
+            if _scheduler_instance is None:
+                detector = get_cat_emotion_detector()
+                if not hasattr(detector, "predict_images"):
+                    return detector
+                
+                _scheduler_instance = CatInferenceScheduler(
+                    detector,
+                    max_batch_size=get_setting("CAT_BATCH_MAX_SIZE", 16),
+                    max_wait_ms=get_setting("CAT_BATCH_MAX_WAIT_MS", 5),
+                    queue_depth=get_setting("CAT_BATCH_QUEUE_DEPTH", 256),
+                )
+    return _scheduler_instance
@@ -0,0 +1,283 @@
+"""
+Clip Analysis
+Emotion detection over short clips: animated GIF / WebP / PNG uploads, and
+video files when OpenCV is installed.
+
+Frames are decoded one at a time and sampled at CLIP_SAMPLE_FPS. A sampled
+frame that barely differs from the last analysed one (mean absolute pixel
+difference of 16x16 RGB thumbnails below CLIP_DUPLICATE_THRESHOLD)
+reuses that frame's prediction instead of running the model. The rest are
+resized as they arrive and predicted CLIP_BATCH_SIZE at a time, so memory
+holds one partial batch of 224x224 frames no matter how long the clip is.
+CLIP_MAX_SECONDS and CLIP_MAX_FRAMES cap the work done per request.
+
+The clip-level emotion is the duration-weighted mean of the per-frame
+probabilities: every sampled frame counts for the time until the next one.
+"""
+
+import logging
+import shutil
+import tempfile
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from app.services.preprocessing import resize_image
+from app.services.settings import get_setting
+from app.services.uploads import FORMAT_EXTENSIONS, VIDEO_FORMATS
+
+logger = logging.getLogger("ClipAnalysis")
+
+# Browsers show GIF frames without (or with a 0 ms) delay for 100 ms
+DEFAULT_FRAME_SECONDS = 0.1
+SIGNATURE_SIZE = 16
+
+
+class ClipError(ValueError):
+    """The upload cannot be decoded as a clip"""
+
+
+# ==========================
+# Frame sources
+# ==========================
+def _animation_frames(stream):
+    """Yield (timestamp, seconds, get_rgb) for each frame of an animated image"""
+    try:
+        img = Image.open(stream)
+    except Exception as e:
+        raise ClipError(f"Could not decode clip: {e}")
+
+    timestamp = 0.0
+    for frame in ImageSequence.Iterator(img):
+        seconds = (frame.info.get("duration") or 0) / 1000.0 or DEFAULT_FRAME_SECONDS
+        yield timestamp, seconds, lambda: frame.convert("RGB")
+        timestamp += seconds
+
+
+def _video_frames(path):
+    """Yield (timestamp, seconds, get_rgb) for each frame of a video file"""
+    try:
+        import cv2
+    except ImportError:
+        raise ClipError("Video clips need OpenCV (pip install opencv-python-headless); "
+                        "animated GIF, WebP and PNG work without it")
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ClipError("Could not decode clip")
+
+    def retrieve():
+        ok, pixels = capture.retrieve()
+        if not ok:
+            raise ClipError("Could not decode video frame")
+        return Image.fromarray(cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB))
+
+    seconds = 1.0 / (capture.get(cv2.CAP_PROP_FPS) or 25.0)
+    index = 0
+    try:
+        # grab() only demuxes; frames that are not sampled are never converted
+        while capture.grab():
+            yield index * seconds, seconds, retrieve
+            index += 1
+    finally:
+        capture.release()
+
+
+def _sampled_frames(frames, sample_fps, max_seconds, max_frames):
+    """
+    Pick the frames shown at each 1 / sample_fps tick
+
+    Returns:
+        (generator of (frame_index, timestamp, get_rgb), state dict whose
+        "duration" and "truncated" are filled in as the generator runs)
+    """
+    state = {"duration": 0.0, "truncated": False}
+
+    def generate():
+        interval = 1.0 / sample_fps
+        next_tick = 0.0
+        sampled = 0
+        for frame_index, (timestamp, seconds, get_rgb) in enumerate(frames):
+            if timestamp >= max_seconds or sampled >= max_frames:
+                state["truncated"] = True
+                break
+            state["duration"] = timestamp + seconds
+            if timestamp + seconds <= next_tick:
+                continue
+            yield frame_index, timestamp, get_rgb
+            sampled += 1
+            # A frame shown across several ticks is sampled once
+            while next_tick < timestamp + seconds:
+                next_tick += interval
+
+    return generate(), state
+
+
+def _signature(img):
+    thumb = img.resize((SIGNATURE_SIZE, SIGNATURE_SIZE), Image.BILINEAR)
+    return np.asarray(thumb, dtype=np.float32)
+
+
+# ==========================
+# Analysis
+# ==========================
+def analyze_clip(species, detector, stream, clip_format, sample_fps=None):
+    """
+    Predict emotions over a clip and aggregate them over time
+
+    Args:
+        species (str): "cat" or "dog"
+        detector: Emotion detector exposing predict_images
+        stream: Binary file-like object with the upload
+        clip_format (str): Sniffed upload format (app.services.uploads.CLIP_FORMATS)
+        sample_fps (float): Frames analysed per second of clip
+            (defaults to CLIP_SAMPLE_FPS, capped at CLIP_MAX_SAMPLE_FPS)
+
+    Returns:
+        dict: {"success", "emotion", "confidence", "all_probabilities",
+        "segments", "frames", ...} or {"success": False, "error"}
+
+    Raises:
+        ClipError: The upload is not a clip that can be decoded
+    """
+    max_fps = float(get_setting("CLIP_MAX_SAMPLE_FPS", 10.0))
+    sample_fps = min(float(sample_fps or get_setting("CLIP_SAMPLE_FPS", 2.0)), max_fps)
+    if sample_fps <= 0:
+        raise ClipError("fps must be positive")
+
+    if clip_format not in VIDEO_FORMATS:
+        return _analyze_frames(species, detector, _animation_frames(stream), sample_fps)
+
+    # OpenCV only reads from a path: stream the upload to a temporary file
+    with tempfile.NamedTemporaryFile(suffix=f".{FORMAT_EXTENSIONS[clip_format]}") as spooled:
+        shutil.copyfileobj(stream, spooled, 1024 * 1024)
+        spooled.flush()
+        return _analyze_frames(species, detector, _video_frames(spooled.name), sample_fps)
+
+
+def _analyze_frames(species, detector, frames, sample_fps):
+    batch_size = int(get_setting("CLIP_BATCH_SIZE", 16))
+    threshold = float(get_setting("CLIP_DUPLICATE_THRESHOLD", 2.0))
+    sampled, state = _sampled_frames(
+        frames,
+        sample_fps,
+        float(get_setting("CLIP_MAX_SECONDS", 60)),
+        int(get_setting("CLIP_MAX_FRAMES", 120)),
+    )
+
+    entries = []          # one per sampled frame, in clip order
+    predictions = []      # one per analysed (non-duplicate) frame
+    pending = []          # resized frames waiting for the next forward pass
+    last_signature = None
+    last_analysed = None
+
+    def flush():
+        try:
+            predictions.extend(detector.predict_images(pending))
+        except Exception as e:
+            predictions.extend({"success": False, "error": str(e)} for _ in pending)
+        pending.clear()
+
+    for frame_index, timestamp, get_rgb in sampled:
+        try:
+            img = resize_image(species, get_rgb())
+        except Exception as e:
+            if not entries:
+                raise ClipError(f"Could not decode clip: {e}")
+            logger.warning(f"Stopping at undecodable frame {frame_index}: {e}")
+            state["truncated"] = True
+            state["duration"] = timestamp
+            break
+
+        signature = _signature(img)
+        entry = {"frame": frame_index, "timestamp": round(timestamp, 3)}
+        if last_signature is not None and np.abs(signature - last_signature).mean() < threshold:
+            entry["duplicate_of"] = last_analysed
+        else:
+            last_signature = signature
+            last_analysed = len(entries)
+            entry["prediction"] = len(predictions) + len(pending)
+            pending.append(img)
+            if len(pending) >= batch_size:
+                flush()
+        entries.append(entry)
+
+    if not entries:
+        raise ClipError("Clip has no frames")
+    if pending:
+        flush()
+
+    return _aggregate(entries, predictions, state)
+
+
+def _aggregate(entries, predictions, state):
+    """Fill in per-frame results and the duration-weighted clip emotion"""
+    analysed = {}
+    frames = []
+    totals = None
+    total_weight = 0.0
+    classes = None
+    model_version = None
+
+    for position, entry in enumerate(entries):
+        end = entries[position + 1]["timestamp"] if position + 1 < len(entries) else state["duration"]
+        weight = max(end - entry["timestamp"], 1e-6)
+
+        if "prediction" in entry:
+            result = predictions[entry.pop("prediction")]
+            analysed[position] = result
+        else:
+            result = analysed[entry["duplicate_of"]]
+
+        if not result.get("success"):
+            frames.append({**entry, "success": False, "error": result.get("error")})
+            continue
+
+        probabilities = result["all_probabilities"]
+        if totals is None:
+            classes = list(probabilities)
+            totals = np.zeros(len(classes))
+            model_version = result.get("model_version")
+        totals += weight * np.array([probabilities[name] for name in classes])
+        total_weight += weight
+        frames.append({
+            **entry,
+            "success": True,
+            "emotion": result["emotion"],
+            "confidence": result["confidence"],
+            "probabilities": probabilities,
+        })
+
+    if totals is None:
+        return {"success": False, "error": frames[0]["error"] or "Prediction failed"}
+
+    mean = totals / total_weight
+    best = int(np.argmax(mean))
+    return {
+        "success": True,
+        "emotion": classes[best],
+        "confidence": float(mean[best]),
+        "all_probabilities": {name: float(value) for name, value in zip(classes, mean)},
+        "model_version": model_version,
+        "duration_seconds": round(state["duration"], 3),
+        "truncated": state["truncated"],
+        "frames_sampled": len(entries),
+        "frames_analysed": len(analysed),
+        "duplicates_skipped": len(entries) - len(analysed),
+        "segments": _segments(frames, state["duration"]),
+        "frames": frames,
+    }
+
+
+def _segments(frames, duration):
+    """Runs of consecutive frames with the same emotion, as [start, end) spans"""
+    segments = []
+    for position, frame in enumerate(frames):
+        if not frame["success"]:
+            continue
+        end = frames[position + 1]["timestamp"] if position + 1 < len(frames) else duration
+        if segments and segments[-1]["emotion"] == frame["emotion"]:
+            segments[-1]["end"] = round(end, 3)
+        else:
+            segments.append({"emotion": frame["emotion"], "start": frame["timestamp"], "end": round(end, 3)})
+    return segments
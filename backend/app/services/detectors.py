@@ -0,0 +1,53 @@
+"""
+Detector Selection
+Single place the routes ask for an emotion detector. Depending on the
+config this is the in-process model, the cat micro-batching scheduler,
+or a thin client for the shared inference server.
+"""
+
+from app.services.settings import get_setting
+
+
+def get_emotion_detector(species, batched=False):
+    """
+    Return the detector to use for a request, behind the prediction
+    cache when PREDICTION_CACHE_ENABLED is set
+    
+    Args:
+        species (str): "cat" or "dog"
+        batched (bool): Allow merging with concurrent requests (single-image /detect)
+        
+    Returns:
+        Object exposing predict, predict_from_bytes, predict_batch_from_bytes,
+        classes and device
+    """
+    detector = _select_detector(species, batched)
+    
+    if get_setting("PREDICTION_CACHE_ENABLED", False) and hasattr(detector, "model_version"):
+        from app.services.prediction_cache import CachedDetector, get_prediction_cache
+        return CachedDetector(species, detector, get_prediction_cache(species))
+    
+    return detector
+
+
+def _select_detector(species, batched):
+    """Pick the remote client, the cat scheduler or the in-process model"""
+    socket_path = get_setting("INFERENCE_SERVER_SOCKET")
+    if socket_path:
+        from app.services.inference_client import get_remote_detector
+        return get_remote_detector(species, socket_path)
+    
+    if species == "cat":
+        from app.services.cat_emotion_service import (
+            get_cat_emotion_detector,
+            get_cat_inference_scheduler,
+        )
+        if batched and get_setting("CAT_BATCHING_ENABLED", False):
+            return get_cat_inference_scheduler()
+        return get_cat_emotion_detector()
+    
+    if species == "dog":
+        from app.services.dog_emotion_service import get_dog_emotion_detector
+        return get_dog_emotion_detector()
+    
+    raise ValueError(f"Unknown species: {species}")
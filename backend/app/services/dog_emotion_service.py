@@ -3,45 +3,108 @@ Dog Emotion Detection Service
 Uses EfficientNet-B0 (Keras) model to predict dog emotions from images
 """
 
-import tensorflow as tf
 import numpy as np
-from PIL import Image
 import os
-from io import BytesIO
+import threading
+import time
+
+from app.services.metrics import BATCH_SIZE, STAGE_SECONDS
+from app.services.model_bundle import is_bundle, load_bundle
+from app.services.model_preload import mark_loading, record_load
+from app.services.parallel_decode import decode_into_batch
+from app.services.prediction_cache import model_fingerprint
+from app.services.preprocessing import get_input_pool, load_image, resize_image, write_input
+from app.services.settings import get_setting
+from app.services.thread_budget import apply_tensorflow_threads, inference_slot, species_threads
+
+# TensorFlow is imported on first use so the ONNX backend never loads it
+tf = None
+
+# Fixed batch shapes the serving function is traced for. Every batch is
+# zero-padded up to the nearest bucket so tf.function never retraces.
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+_DECODE_SECONDS = STAGE_SECONDS.labels("dog", "decode")
+_PREPROCESS_SECONDS = STAGE_SECONDS.labels("dog", "preprocess")
+_FORWARD_SECONDS = STAGE_SECONDS.labels("dog", "forward")
+_BATCH_SIZE = BATCH_SIZE.labels("dog")
 
 
 class DogEmotionDetector:
     """Service class for detecting dog emotions using EfficientNet-B0 (Keras)"""
     
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, backend="native", classes=None, version=None):
         """
         Initialize the dog emotion detector
         
         Args:
-            model_path (str): Path to the .h5 model file
+            model_path (str): Path to the .h5 model file or .bundle folder
+                (.onnx for the onnx backend). Defaults to app/trained/dog.bundle
+                when it exists, else dog.h5
+            backend (str): "native" runs Keras, "onnx" runs ONNX Runtime
+                and never imports tensorflow
+            classes (list): Output class names, in model output order
+                (default: angry, happy, relaxed, sad; bundles carry their own)
+            version (str): Model registry version, reported with every
+                prediction. Defaults to the weights' fingerprint
         """
-        self.classes = ["angry", "happy", "relaxed", "sad"]
+        self.classes = list(classes) if classes else ["angry", "happy", "relaxed", "sad"]
         self.img_size = 224
+        self.backend = backend
+        self.input_pool = get_input_pool("dog")
         
         # Set default model path if not provided
         if model_path is None:
             # Point to the model in backend/app/trained folder
             base_dir = os.path.dirname(os.path.abspath(__file__))  # app/services/
             app_dir = os.path.dirname(base_dir)  # app/
-            model_path = os.path.join(app_dir, "trained", "dog.h5")
+            filename = "dog.onnx" if backend == "onnx" else "dog.h5"
+            model_path = os.path.join(app_dir, "trained", filename)
+            bundle_path = os.path.join(app_dir, "trained", "dog.bundle")
+            if backend == "native" and is_bundle(bundle_path):
+                model_path = bundle_path
         
         self.model_path = model_path
         
+        # Identifies these exact weights, e.g. for prediction cache keys
+        self.model_version = model_fingerprint(self.model_path) if os.path.exists(self.model_path) else None
+        self.version = version or self.model_version
+        
+        if backend == "onnx":
+            from app.services.onnx_backend import OnnxModel
+            self.model = OnnxModel(self.model_path, *species_threads("dog"))
+            print(f"✅ Dog emotion ONNX model loaded successfully from: {self.model_path}")
+            return
+        if backend != "native":
+            raise ValueError(f"Unknown inference backend: {backend}")
+        
         # Load the model
         self.model = self._load_model()
+        outputs = self.model.output_shape[-1]
+        if outputs != len(self.classes):
+            raise ValueError(f"Dog model has {outputs} outputs but {len(self.classes)} classes are configured")
+        
+        # Compiled serving signature, one concrete function per batch bucket
+        self._serve = tf.function(lambda images: self.model(images, training=False))
+        self._concrete_fns = {}
+        self._trace_lock = threading.Lock()
     
     def _load_model(self):
         """Load the EfficientNet-B0 Keras model with trained weights"""
+        global tf
         try:
             # Load the trained model
             if not os.path.exists(self.model_path):
                 raise FileNotFoundError(f"Model file not found at: {self.model_path}")
             
+            if tf is None:
+                import tensorflow
+                tf = tensorflow
+                apply_tensorflow_threads(tf)
+            
+            if is_bundle(self.model_path):
+                return self._load_bundle_model()
+            
             model = tf.keras.models.load_model(self.model_path)
             
             print(f"✅ Dog emotion model loaded successfully from: {self.model_path}")
@@ -50,29 +113,100 @@ class DogEmotionDetector:
         except Exception as e:
             raise Exception(f"Error loading model: {str(e)}")
     
-    def _preprocess_image(self, img):
+    def _load_bundle_model(self):
         """
-        Preprocess image for EfficientNet-B0
+        Rebuild the Keras model from a bundle's architecture and mapped weights
+        
+        TF variables own their memory, so the weights are copied once into
+        them; in the prefork server that copy happens in the master and is
+        shared copy-on-write by the workers.
+        """
+        manifest, arrays = load_bundle(self.model_path, verify=get_setting("MODEL_BUNDLE_VERIFY", True))
+        self.classes = manifest.get("classes", self.classes)
+        
+        model = tf.keras.models.model_from_json(manifest["architecture"])
+        model.set_weights([arrays[name] for name in manifest["weight_order"]])
+        
+        print(f"✅ Dog emotion model bundle {manifest['version']} loaded from: {self.model_path}")
+        return model
+    
+    def _predict_image(self, img):
+        """
+        Preprocess one image for EfficientNet-B0 and run it
+        
+        Done in NumPy rather than eager TF ops. Keras' EfficientNet
+        preprocess_input is a pass-through (rescaling lives inside the
+        model), so the resized pixels are written as float32 straight into
+        a pooled (1, 224, 224, 3) input batch.
         
         Args:
             img: PIL Image
             
         Returns:
-            Preprocessed numpy array
+            dict: Prediction result
         """
-        # Resize image
-        img = img.resize((self.img_size, self.img_size))
+        with self.input_pool.batch(1) as batch:
+            started = time.perf_counter()
+            write_input("dog", resize_image("dog", img), batch[0])
+            _PREPROCESS_SECONDS.observe(time.perf_counter() - started)
+            predictions = self._run_model(batch)
+        return self._build_result(predictions[0])
+    
+    def _get_serving_fn(self, bucket):
+        """Return the concrete function traced for one batch bucket, tracing it once"""
+        fn = self._concrete_fns.get(bucket)
+        if fn is None:
+            with self._trace_lock:
+                fn = self._concrete_fns.get(bucket)
+                if fn is None:
+                    spec = tf.TensorSpec([bucket, self.img_size, self.img_size, 3], tf.float32)
+                    fn = self._serve.get_concrete_function(spec)
+                    self._concrete_fns[bucket] = fn
+        return fn
+    
+    def _run_model(self, batch):
+        """
+        Forward a (N, 224, 224, 3) float32 batch through the compiled model
         
-        # Convert to array
-        img_array = tf.keras.preprocessing.image.img_to_array(img)
+        Batches are padded to the nearest bucket and larger ones are split
+        into chunks of the biggest bucket, so only len(BATCH_BUCKETS)
+        graphs ever exist.
         
-        # Add batch dimension
-        img_array = tf.expand_dims(img_array, 0)
+        Returns:
+            numpy array of shape (N, num_classes)
+        """
+        _BATCH_SIZE.observe(len(batch))
+        with inference_slot("dog"):
+            started = time.perf_counter()
+            if self.backend == "onnx":
+                # ONNX Runtime takes the dynamic batch dimension as-is
+                outputs = self.model.run(batch)
+            else:
+                outputs = self._run_buckets(batch)
+            _FORWARD_SECONDS.observe(time.perf_counter() - started)
+        return outputs
+    
+    def _run_buckets(self, batch):
+        """Run a batch through the traced bucket graphs (native backend)"""
+        outputs = []
+        max_bucket = BATCH_BUCKETS[-1]
         
-        # Preprocess for EfficientNet
-        img_array = tf.keras.applications.efficientnet.preprocess_input(img_array)
+        for start in range(0, len(batch), max_bucket):
+            chunk = batch[start:start + max_bucket]
+            size = len(chunk)
+            bucket = next(b for b in BATCH_BUCKETS if b >= size)
+            
+            if size < bucket:
+                # Pad in a pooled buffer rather than allocating a new one per call
+                with self.input_pool.batch(bucket) as padded:
+                    padded[:size] = chunk
+                    padded[size:] = 0
+                    result = self._get_serving_fn(bucket)(tf.constant(padded, dtype=tf.float32))
+            else:
+                result = self._get_serving_fn(bucket)(tf.constant(chunk, dtype=tf.float32))
+            outputs.append(result.numpy()[:size])
         
-        return img_array
+        return np.concatenate(outputs, axis=0)
     
     def predict(self, image_path):
         """
@@ -85,27 +219,9 @@ class DogEmotionDetector:
             dict: Contains predicted emotion and confidence scores
         """
         try:
-            # Load and preprocess the image
-            img = Image.open(image_path).convert("RGB")
-            img_array = self._preprocess_image(img)
-            
-            # Make prediction
-            predictions = self.model.predict(img_array, verbose=0)
-            class_id = np.argmax(predictions[0])
-            confidence = float(np.max(predictions[0]))
-            
-            # Get all class probabilities
-            all_probabilities = {
-                self.classes[i]: float(predictions[0][i])
-                for i in range(len(self.classes))
-            }
-            
-            return {
-                "success": True,
-                "emotion": self.classes[class_id],
-                "confidence": confidence,
-                "all_probabilities": all_probabilities
-            }
+            # Load the image, then preprocess and predict
+            img = self._decode(image_path)
+            return self._predict_image(img)
             
         except Exception as e:
             return {
@@ -118,53 +234,170 @@ class DogEmotionDetector:
         Predict emotion from image bytes (useful for API uploads)
         
         Args:
-            image_bytes: Image data in bytes
+            image_bytes: Image data in bytes, or a binary file-like object (upload stream)
             
         Returns:
             dict: Contains predicted emotion and confidence scores
         """
         try:
             # Load image from bytes
-            img = Image.open(BytesIO(image_bytes)).convert("RGB")
-            img_array = self._preprocess_image(img)
-            
-            # Make prediction
-            predictions = self.model.predict(img_array, verbose=0)
-            class_id = np.argmax(predictions[0])
-            confidence = float(np.max(predictions[0]))
-            
-            # Get all class probabilities
-            all_probabilities = {
-                self.classes[i]: float(predictions[0][i])
-                for i in range(len(self.classes))
-            }
-            
-            return {
-                "success": True,
-                "emotion": self.classes[class_id],
-                "confidence": confidence,
-                "all_probabilities": all_probabilities
-            }
+            img = self._decode(image_bytes)
+            return self._predict_image(img)
             
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e)
             }
+    
+    def predict_batch_from_bytes(self, images_bytes):
+        """
+        Predict emotions for several uploads with one forward pass
+        
+        Images are decoded in parallel straight into a pooled input batch;
+        an image that fails to decode gets its own error entry and does not
+        affect the rest of the batch.
+        
+        Args:
+            images_bytes (list): Image data in bytes or binary file-like objects, one per image
+            
+        Returns:
+            list: One prediction dict per input, in the same order
+        """
+        with self.input_pool.batch(len(images_bytes)) as batch:
+            errors = decode_into_batch("dog", self._decode, images_bytes, batch)
+            results = [{"success": False, "error": error} if error else None for error in errors]
+            ok_indices = [i for i, error in enumerate(errors) if error is None]
+            
+            if ok_indices:
+                try:
+                    # Only a batch with failed images needs its good rows gathered (copied)
+                    inputs = batch if len(ok_indices) == len(batch) else batch[ok_indices]
+                    predictions = self._run_model(inputs)
+                    for i, row in zip(ok_indices, predictions):
+                        results[i] = self._build_result(row)
+                except Exception as e:
+                    for i in ok_indices:
+                        results[i] = {"success": False, "error": str(e)}
+        
+        return results
+
+    def predict_images(self, images):
+        """
+        Run a single forward pass over decoded RGB PIL images
+
+        Each image is resized and written into a row of a pooled input
+        batch, which the model reads in place.
+        """
+        with self.input_pool.batch(len(images)) as batch:
+            started = time.perf_counter()
+            for image, row in zip(images, batch):
+                write_input("dog", resize_image("dog", image), row)
+            _PREPROCESS_SECONDS.observe(time.perf_counter() - started)
+            return self.predict_preprocessed(batch)
+
+    def predict_preprocessed(self, batch):
+        """
+        Predict from a float32 NumPy batch laid out like
+        app.services.preprocessing builds it for "dog" (N, 224, 224, 3)
+        """
+        return [self._build_result(row) for row in self._run_model(batch)]
+    
+    def _decode(self, source):
+        """Decode upload bytes, an upload stream or a file path into an upright RGB PIL image"""
+        started = time.perf_counter()
+        img = load_image(source)
+        _DECODE_SECONDS.observe(time.perf_counter() - started)
+        return img
+    
+    def _build_result(self, probabilities):
+        """Turn one row of model output into the API result dict"""
+        class_id = int(np.argmax(probabilities))
+        
+        # Get all class probabilities
+        all_probabilities = {
+            self.classes[i]: float(probabilities[i])
+            for i in range(len(self.classes))
+        }
+        
+        return {
+            "success": True,
+            "emotion": self.classes[class_id],
+            "confidence": float(np.max(probabilities)),
+            "all_probabilities": all_probabilities,
+            "model_version": self.version
+        }
 
 
 # Global instance (singleton pattern)
 _detector_instance = None
+_detector_lock = threading.Lock()
 
 
 def get_dog_emotion_detector():
     """
     Get or create the global dog emotion detector instance
     
+    Thread-safe: concurrent first callers wait for a single load. A failed
+    load raises and is retried by the next caller.
+    
     Returns:
         DogEmotionDetector: Singleton instance
     """
     global _detector_instance
-    if _detector_instance is None:
-        _detector_instance = DogEmotionDetector()
+    if _detector_instance is not None:
+        return _detector_instance
+    
+    with _detector_lock:
+        if _detector_instance is None:
+            mark_loading("dog")
+            started = time.perf_counter()
+            try:
+                _detector_instance = build_dog_emotion_detector()
+            except Exception as e:
+                record_load("dog", time.perf_counter() - started, error=e)
+                raise
+            record_load("dog", time.perf_counter() - started)
     return _detector_instance
+
+
+def build_dog_emotion_detector(model_path=None, classes=None, version=None):
+    """
+    Create a DogEmotionDetector from the app config
+    
+    Args:
+        model_path (str): Weights to load instead of the configured ones,
+            e.g. a model registry version
+        classes (list): Class names for those weights
+        version (str): Registry version reported with every prediction
+    """
+    backend = get_setting("INFERENCE_BACKEND", "native")
+    if model_path is None:
+        from app.services.model_registry import active_model
+        entry = active_model("dog", backend)
+        if entry is not None:
+            model_path, classes, version = entry["artifact_path"], entry["classes"], entry["version"]
+    if model_path is None:
+        model_path = get_setting("DOG_MODEL_PATH")
+        if backend == "onnx":
+            from app.services.onnx_backend import resolve_model_path
+            model_path = resolve_model_path(
+                "dog",
+                get_setting("DOG_ONNX_MODEL_PATH"),
+                get_setting("ONNX_MODEL_VARIANT", "fp32"),
+            )
+    return DogEmotionDetector(model_path=model_path, backend=backend, classes=classes, version=version)
+
+
+def swap_dog_emotion_detector(detector):
+    """
+    Make `detector` the global dog detector; requests already holding
+    the old one finish on it
+    
+    Returns:
+        The previous detector (None if none was loaded)
+    """
+    global _detector_instance
+    with _detector_lock:
+        previous, _detector_instance = _detector_instance, detector
+    return previous
@@ -0,0 +1,312 @@
+"""
+History Writer
+Group commit for CatEmotionHistory / DogEmotionHistory rows.
+
+Without it every detection pays its own INSERT + COMMIT, i.e. a database
+round trip and a log flush per request. Here request threads park their
+row on a bounded queue; one writer thread per process drains it and
+flushes everything waiting as one multi-row INSERT per table and a
+single COMMIT, as soon as HISTORY_BATCH_MAX_SIZE rows are queued or the
+oldest has waited HISTORY_BATCH_MAX_WAIT_MS.
+
+Durability (HISTORY_COMMIT_WAIT):
+- True: the request waits for the commit of its batch and gets the row id
+- False: the request is answered as soon as the row is queued ("id": None).
+  Rows still queued when the process dies are lost; a normal exit flushes.
+
+A batch that fails (e.g. one row with an unknown pet_id) is rolled back
+and retried row by row, so only the bad rows fail. When the queue is full
+the row is inserted directly by the request thread.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+from traceback import format_exc
+
+from flask import current_app
+from sqlalchemy import insert, text
+
+from app.services.settings import get_setting
+
+logger = logging.getLogger("HistoryWriter")
+
+# Labels the db_commit stage metric of a batch (app/services/metrics.py)
+_SPECIES = {"CatEmotionHistory": "cat", "DogEmotionHistory": "dog"}
+
+
+def _now():
+    # DATETIME columns keep whole seconds: use the value that will be stored
+    return datetime.now().replace(microsecond=0)
+
+
+# Engine -> whether a multi-row INSERT gets consecutive ids (MySQL only)
+_consecutive_ids = {}
+
+
+def _has_consecutive_ids(session):
+    """
+    True when the ids of a multi-row INSERT are LAST_INSERT_ID(), +1, +2, ...
+
+    InnoDB hands a "simple insert" (row count known up front) one block of
+    ids under every innodb_autoinc_lock_mode, but they step by
+    auto_increment_increment, which Galera / group replication / multi-primary
+    setups raise above 1. Checked once per engine.
+    """
+    bind = session.get_bind()
+    consecutive = _consecutive_ids.get(bind)
+    if consecutive is None:
+        increment, offset = session.execute(
+            text("SELECT @@auto_increment_increment, @@auto_increment_offset")
+        ).one()
+        consecutive = _consecutive_ids[bind] = int(increment) == 1 and int(offset) == 1
+        if not consecutive:
+            logger.info(
+                f"auto_increment_increment={increment}, auto_increment_offset={offset}: "
+                "history rows are inserted one statement per row"
+            )
+    return consecutive
+
+
+def _insert_rows(session, model, rows):
+    """
+    One multi-row INSERT for a list of column dicts
+
+    Returns:
+        list: Primary keys, in the order of rows
+    """
+    table = model.__table__
+    columns = {key for values in rows for key in values}
+    rows = [{key: values.get(key) for key in columns} for values in rows]
+    dialect = session.get_bind().dialect
+    # SQLAlchemy < 2.0 has no sorted executemany RETURNING
+    if getattr(dialect, "insert_executemany_returning_sort_by_parameter_order", False):
+        # SQLite, MariaDB, PostgreSQL: batched VALUES with RETURNING, ids matched to rows
+        result = session.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows)
+        return [row[0] for row in result]
+
+    if dialect.name == "mysql" and _has_consecutive_ids(session):
+        # MySQL has no RETURNING. LAST_INSERT_ID() of a multi-row INSERT is the
+        # first row's id and the others follow it (see _has_consecutive_ids)
+        result = session.execute(insert(table).values(rows))
+        first_id = result.lastrowid
+        return [first_id + offset for offset in range(len(rows))]
+
+    # Ids cannot be told apart: one INSERT per row, still a single COMMIT
+    return [session.execute(insert(table).values(values)).inserted_primary_key[0] for values in rows]
+
+
+def _insert_one(model, values):
+    """Plain ORM insert + commit for one row (queue full, or group commit off)"""
+    from app import db
+
+    record = model(**values)
+    db.session.add(record)
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return record.id
+
+
+class HistoryWriter:
+    """Background group-commit writer shared by every request thread of a process"""
+
+    def __init__(self, app, max_batch_size=64, max_wait_ms=5, queue_depth=1024):
+        self.app = app
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.queue_depth = int(queue_depth)
+
+        self._queue = queue.Queue(maxsize=self.queue_depth)
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._rows = 0
+        self._failed = 0
+        self._overflow = 0
+
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"History writer started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={max_wait_ms}, queue_depth={self.queue_depth})"
+        )
+
+    def submit(self, model, values):
+        """
+        Queue one row
+
+        Args:
+            model: CatEmotionHistory or DogEmotionHistory
+            values (dict): Column values (created_at is filled in when missing)
+
+        Returns:
+            Future resolving to the row id, or None when the queue is full
+        """
+        values.setdefault("created_at", _now())
+        future = Future()
+        try:
+            self._queue.put_nowait((model, values, future))
+        except queue.Full:
+            with self._stats_lock:
+                self._overflow += 1
+            return None
+        return future
+
+    def flush(self, timeout=10):
+        """Block until every row queued so far is committed (or timeout)"""
+        marker = Future()
+        self._queue.put((None, None, marker))
+        try:
+            marker.result(timeout=timeout)
+        except FutureTimeoutError:
+            logger.warning("Timed out flushing emotion history rows")
+
+    def stats(self):
+        with self._stats_lock:
+            batches, rows = self._batches, self._rows
+            failed, overflow = self._failed, self._overflow
+        return {
+            "batches": batches,
+            "rows": rows,
+            "avg_batch_size": (rows / batches) if batches else 0.0,
+            "failed": failed,
+            "overflow": overflow,
+            "queue_size": self._queue.qsize(),
+        }
+
+    def _collect_batch(self):
+        """Block for the first row, then gather more until full or the deadline passes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            rows = [item for item in batch if item[0] is not None]
+            if rows:
+                with self.app.app_context():
+                    self._write(rows)
+            for model, _, future in batch:
+                if model is None:
+                    future.set_result(None)
+
+    def _write(self, batch):
+        from flask import g
+        from app import db
+
+        by_model = {}
+        for item in batch:
+            by_model.setdefault(item[0], []).append(item)
+        if len(by_model) == 1:
+            g.inference_species = _SPECIES.get(next(iter(by_model)).__name__)
+
+        try:
+            ids = {}
+            for model, items in by_model.items():
+                ids[model] = _insert_rows(db.session, model, [values for _, values, _ in items])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.warning(f"Group commit of {len(batch)} history rows failed, retrying one by one")
+            logger.debug(format_exc())
+            self._write_each(batch)
+            return
+
+        with self._stats_lock:
+            self._batches += 1
+            self._rows += len(batch)
+        for model, items in by_model.items():
+            for (_, _, future), row_id in zip(items, ids[model]):
+                future.set_result(row_id)
+        logger.debug(f"Committed {len(batch)} history rows")
+
+    def _write_each(self, batch):
+        for model, values, future in batch:
+            try:
+                row_id = _insert_one(model, values)
+            except Exception as e:
+                logger.error(f"❌ Could not save {model.__name__} row: {e}")
+                with self._stats_lock:
+                    self._failed += 1
+                future.set_exception(e)
+                continue
+            with self._stats_lock:
+                self._batches += 1
+                self._rows += 1
+            future.set_result(row_id)
+
+
+_writer_instance = None
+_writer_lock = threading.Lock()
+_writer_pid = None
+
+
+def get_history_writer():
+    """Process-wide writer (a forked worker gets its own thread and queue)"""
+    global _writer_instance, _writer_pid
+    if _writer_instance is None or _writer_pid != os.getpid():
+        with _writer_lock:
+            if _writer_instance is None or _writer_pid != os.getpid():
+                _writer_instance = HistoryWriter(
+                    current_app._get_current_object(),
+                    max_batch_size=get_setting("HISTORY_BATCH_MAX_SIZE", 64),
+                    max_wait_ms=get_setting("HISTORY_BATCH_MAX_WAIT_MS", 5),
+                    queue_depth=get_setting("HISTORY_QUEUE_DEPTH", 1024),
+                )
+                _writer_pid = os.getpid()
+                atexit.register(_writer_instance.flush)
+    return _writer_instance
+
+
+def record_history(model, **values):
+    """
+    Save one emotion history row
+
+    Goes through the group-commit writer when HISTORY_GROUP_COMMIT is on,
+    otherwise inserts and commits right away.
+
+    Args:
+        model: CatEmotionHistory or DogEmotionHistory
+        **values: Column values (pet_id, emotion, confidence, ...)
+
+    Returns:
+        dict: {"id", "created_at"}; "id" is None when HISTORY_COMMIT_WAIT
+        is off and the row has only been queued
+
+    Raises:
+        Exception: The row could not be saved (only when waiting for it)
+    """
+    values.setdefault("created_at", _now())
+    record = {"id": None, "created_at": values["created_at"].isoformat()}
+
+    if not get_setting("HISTORY_GROUP_COMMIT", True):
+        record["id"] = _insert_one(model, values)
+        return record
+
+    future = get_history_writer().submit(model, values)
+    if future is None:
+        # Queue full: write it here rather than drop it or fail the request
+        record["id"] = _insert_one(model, values)
+    elif get_setting("HISTORY_COMMIT_WAIT", True):
+        record["id"] = future.result(timeout=get_setting("HISTORY_COMMIT_TIMEOUT", 30))
+    return record
@@ -0,0 +1,219 @@
+"""
+Image Variants
+Resized WebP copies of pet and veterinarian photos, made at upload time by
+a small background pool so the upload request does not wait for them.
+
+Each original "<name>.<ext>" gets, next to it in the same folder:
+- <name>.thumb.webp   160 px on the long edge, for lists
+- <name>.card.webp    480 px, for cards and detail headers
+- <name>.full.webp   1280 px, for full-screen viewing
+
+The original is decoded once (JPEG DCT scaling keeps that cheap) and each
+smaller variant is resized from the previous one. Files are written to a
+temporary name and renamed, so a variant is either complete or absent.
+
+Listings return one URL per variant (the image URL with ?variant=...).
+Until a variant exists, e.g. for photos uploaded before variants did, the
+image route serves the original and queues the variants.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import abort
+from PIL import Image
+from werkzeug.security import safe_join
+
+from app.services.preprocessing import load_image
+from app.services.settings import get_setting
+from app.services.static_files import send_upload
+
+logger = logging.getLogger("ImageVariants")
+
+# Variant name -> (longest edge in px, WebP quality), largest first
+VARIANTS = {
+    "full": (1280, 82),
+    "card": (480, 80),
+    "thumb": (160, 75),
+}
+VARIANT_SUFFIXES = tuple(f".{variant}.webp" for variant in VARIANTS)
+
+
+def variant_filename(filename, variant):
+    """File name of one variant of an original upload"""
+    stem = filename.rsplit(".", 1)[0]
+    return f"{stem}.{variant}.webp"
+
+
+def variant_urls(image_url):
+    """{variant: URL} for an original image URL (None when there is no image)"""
+    if not image_url:
+        return None
+    return {variant: f"{image_url}?variant={variant}" for variant in VARIANTS}
+
+
+# ==========================
+# Generation
+# ==========================
+def generate_variants(image_path):
+    """
+    Write every variant of one original, largest first
+
+    Returns:
+        list: Paths of the variants written
+    """
+    folder, filename = os.path.split(image_path)
+    full_edge = VARIANTS["full"][0]
+    img = load_image(image_path, min_size=full_edge)
+
+    written = []
+    for variant, (edge, quality) in VARIANTS.items():
+        if max(img.size) > edge:
+            img.thumbnail((edge, edge), Image.LANCZOS)
+        path = os.path.join(folder, variant_filename(filename, variant))
+        # A unique temp name per writer: prefork workers may make the same variant at once
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                img.save(out, format="WEBP", quality=quality, method=4)
+            os.chmod(tmp_path, 0o644)  # mkstemp makes it owner-only; the proxy may serve it
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove([tmp_path])
+            raise
+        written.append(path)
+
+    if not os.path.exists(image_path):
+        # The photo was replaced or deleted while its variants were being made
+        _remove(written)
+        return []
+    return written
+
+
+def has_variants(image_path):
+    """Every variant of an original exists (e.g. a deduplicated upload)"""
+    folder, filename = os.path.split(image_path)
+    return all(os.path.exists(os.path.join(folder, variant_filename(filename, v))) for v in VARIANTS)
+
+
+def delete_variants(image_path):
+    """Remove the variants of an original (the original itself is left alone)"""
+    folder, filename = os.path.split(image_path)
+    _remove(os.path.join(folder, variant_filename(filename, variant)) for variant in VARIANTS)
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class VariantPool:
+    """Background workers generating variants; an original is queued at most once at a time"""
+
+    def __init__(self, workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-variants")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, image_path):
+        with self._lock:
+            if image_path in self._pending:
+                return None
+            self._pending.add(image_path)
+        return self._executor.submit(self._run, image_path)
+
+    def _run(self, image_path):
+        try:
+            return generate_variants(image_path)
+        except Exception as e:
+            logger.warning(f"Could not make variants of {image_path}: {e}")
+            return []
+        finally:
+            with self._lock:
+                self._pending.discard(image_path)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_pid = None
+
+
+def get_variant_pool():
+    """Process-wide variant pool (a forked worker gets its own)"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = VariantPool(get_setting("IMAGE_VARIANT_WORKERS", 1))
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def schedule_variants(image_path):
+    """Queue variant generation for a freshly stored original"""
+    if not get_setting("IMAGE_VARIANTS_ENABLED", True) or has_variants(image_path):
+        return None
+    return get_variant_pool().submit(image_path)
+
+
+# ==========================
+# Serving
+# ==========================
+def send_image(folder, filename, variant=None):
+    """
+    Response for an uploaded image or one of its variants
+
+    A variant that does not exist yet is answered with the original and
+    queued, so old uploads get their variants on first request. That
+    stand-in is not cached as immutable, the real variant replaces it.
+    """
+    if not variant:
+        return send_upload(folder, filename)
+    if variant not in VARIANTS:
+        abort(404)
+
+    name = variant_filename(filename, variant)
+    variant_path = safe_join(folder, name)
+    if variant_path is not None and os.path.isfile(variant_path):
+        return send_upload(folder, name)
+
+    image_path = safe_join(folder, filename)
+    if image_path is not None and os.path.isfile(image_path):
+        schedule_variants(image_path)
+    return send_upload(folder, filename, immutable=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image variant tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("backfill", help="Make missing variants for every stored pet and vet photo")
+    parser.parse_args()
+
+    from app import create_app
+    app = create_app(preload_models=False)
+    made = 0
+    for key in ("UPLOAD_FOLDER", "UPLOAD_FOLDER_VETS"):
+        for directory, subdirs, filenames in os.walk(app.config[key]):
+            # Shard directories of the upload store; skip its .tmp
+            subdirs[:] = [d for d in subdirs if not d.startswith(".")]
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if filename.endswith(VARIANT_SUFFIXES + (".tmp",)) or has_variants(path):
+                    continue
+                try:
+                    generate_variants(path)
+                    made += 1
+                except Exception as e:
+                    print(f"❌ {path}: {e}")
+    print(f"✅ Made variants for {made} photos")
+
+
+if __name__ == "__main__":
+    main()
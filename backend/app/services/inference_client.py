@@ -0,0 +1,255 @@
+"""
+Inference Client
+Thin, torch/tensorflow-free stand-in for the emotion detectors that
+forwards predictions to the inference server (see inference_server.py).
+
+Each request thread keeps one socket connection. Shared memory segments
+belong to the process: a request borrows one from a small pool, writes the
+decoded pixels straight into it and the server reads them in place. (The
+web server starts a thread per request, so per-thread segments would leave
+one /dev/shm entry behind per request.)
+"""
+
+import atexit
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from app.services.inference_server import recv_message, send_message
+from app.services.metrics import STAGE_SECONDS
+from app.services.parallel_decode import decode_in_parallel
+from app.services.preprocessing import input_shape, load_image, resize_image, write_input
+
+
+class InferenceClient:
+    """Per-thread connections and a process-wide shared memory pool for one server socket"""
+
+    def __init__(self, socket_path, timeout=30, max_idle_segments=4):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.max_idle_segments = max(1, int(max_idle_segments))
+        # Bumped whenever a broken connection is replaced (server restarted?)
+        self.reconnects = 0
+        self._local = threading.local()
+
+        self._idle_segments = []
+        self._segments_lock = threading.Lock()
+        self._segments_pid = os.getpid()
+        atexit.register(self.close_segments)
+
+    def call(self, message):
+        """Send one request and return the server's response, reconnecting once on failure"""
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                send_message(conn, message)
+                response = recv_message(conn)
+                if response is None:
+                    raise ConnectionError("Inference server closed the connection")
+                return response
+            except (OSError, ConnectionError):
+                self._drop_connection()
+                self.reconnects += 1
+                if attempt:
+                    raise
+
+    @contextmanager
+    def buffer(self, nbytes):
+        """
+        Borrow a shared memory segment of at least nbytes for one call
+
+        The segment goes back to the pool when the block exits normally. If it
+        raises, the server may still be reading the segment, so it is unlinked
+        instead of reused.
+        """
+        segment = self._take_segment(nbytes)
+        try:
+            yield segment
+        except BaseException:
+            _destroy_segment(segment)
+            raise
+        self._return_segment(segment)
+
+    def close_segments(self):
+        """Unlink every idle segment (at exit)"""
+        with self._segments_lock:
+            segments = self._idle_segments if self._segments_pid == os.getpid() else []
+            self._idle_segments = []
+        for segment in segments:
+            _destroy_segment(segment)
+
+    def _take_segment(self, nbytes):
+        with self._segments_lock:
+            if self._segments_pid != os.getpid():
+                # Forked: the inherited segments are the parent's to unlink
+                self._idle_segments = []
+                self._segments_pid = os.getpid()
+            for i, segment in enumerate(self._idle_segments):
+                if segment.size >= nbytes:
+                    return self._idle_segments.pop(i)
+        return shared_memory.SharedMemory(create=True, size=nbytes)
+
+    def _return_segment(self, segment):
+        with self._segments_lock:
+            if self._segments_pid == os.getpid():
+                self._idle_segments.append(segment)
+                # Keep the largest ones: a small segment cannot serve a big batch
+                self._idle_segments.sort(key=lambda idle: idle.size)
+                evicted = self._idle_segments[:-self.max_idle_segments]
+                del self._idle_segments[:-self.max_idle_segments]
+            else:
+                evicted = [segment]
+        for idle in evicted:
+            _destroy_segment(idle)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            try:
+                conn.close()
+            finally:
+                self._local.conn = None
+
+
+def _destroy_segment(segment):
+    try:
+        segment.unlink()
+    except OSError:
+        pass
+    try:
+        segment.close()
+    except BufferError:
+        pass  # still viewed by a failed call; unmapped with the last view
+
+
+class RemoteEmotionDetector:
+    """Drop-in replacement for Cat/DogEmotionDetector backed by the inference server"""
+
+    def __init__(self, species, client):
+        self.species = species
+        self.client = client
+        self._info = None
+        self._info_reconnects = 0
+
+    @property
+    def classes(self):
+        return self._detector_info().get("classes", [])
+
+    @property
+    def device(self):
+        return self._detector_info().get("device", "remote")
+
+    @property
+    def model_version(self):
+        return self._detector_info().get("model_version")
+
+    def predict(self, image_path):
+        if not os.path.exists(image_path):
+            return {"success": False, "error": "Image file not found"}
+        with open(image_path, "rb") as f:
+            return self.predict_from_bytes(f.read())
+
+    def predict_from_bytes(self, image_bytes):
+        return self.predict_batch_from_bytes([image_bytes])[0]
+
+    def predict_batch_from_bytes(self, images_bytes):
+        decoded = decode_in_parallel(self._decode, images_bytes)
+        results = [
+            {"success": False, "error": error} if error else None
+            for _, error in decoded
+        ]
+        ok_indices = [i for i, (_, error) in enumerate(decoded) if error is None]
+        if not ok_indices:
+            return results
+
+        predictions = self.predict_images([decoded[i][0] for i in ok_indices])
+        for i, prediction in zip(ok_indices, predictions):
+            results[i] = prediction
+        return results
+
+    def predict_images(self, images):
+        """One server round trip for RGB PIL images already passed through resize_image"""
+        try:
+            shape = input_shape(self.species, len(images))
+            with self.client.buffer(int(np.prod(shape)) * 4) as segment:
+                batch = np.ndarray(shape, dtype=np.float32, buffer=segment.buf)
+                for image, row in zip(images, batch):
+                    write_input(self.species, image, row)
+                del batch
+
+                response = self.client.call({
+                    "op": "predict",
+                    "species": self.species,
+                    "shm": segment.name,
+                    "batch_size": len(images),
+                })
+            if not response.get("ok"):
+                raise RuntimeError(response.get("error", "Inference server error"))
+            self._check_version(response["results"])
+            return response["results"]
+
+        except Exception as e:
+            return [{"success": False, "error": f"Inference server unavailable: {e}"} for _ in images]
+
+    def _decode(self, image_bytes):
+        # The forward pass is timed by the inference server process
+        started = time.perf_counter()
+        img = load_image(image_bytes)
+        decoded = time.perf_counter()
+        img = resize_image(self.species, img)
+        STAGE_SECONDS.labels(self.species, "decode").observe(decoded - started)
+        STAGE_SECONDS.labels(self.species, "preprocess").observe(time.perf_counter() - decoded)
+        return img
+
+    def _check_version(self, results):
+        # The server swapped its model (or was replaced): refetch info, so
+        # model_version (part of the prediction cache key) follows it
+        info = self._info
+        if info is not None and any(
+            result.get("model_version", info.get("model_version")) != info.get("model_version")
+            for result in results
+        ):
+            self._info = None
+
+    def _detector_info(self):
+        if self._info is not None and self._info_reconnects != self.client.reconnects:
+            self._info = None  # reconnected, possibly to a restarted server
+        if self._info is None:
+            self._info_reconnects = self.client.reconnects
+            response = self.client.call({"op": "info"})
+            info = response.get("detectors", {}).get(self.species)
+            if info is None:
+                raise RuntimeError(f"Inference server has no {self.species} model loaded")
+            self._info = info
+        return self._info
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_remote_detector(species, socket_path):
+    """Get or create the process-wide remote detector for a species"""
+    key = (species, socket_path)
+    detector = _clients.get(key)
+    if detector is None:
+        with _clients_lock:
+            detector = _clients.get(key)
+            if detector is None:
+                detector = RemoteEmotionDetector(species, InferenceClient(socket_path))
+                _clients[key] = detector
+    return detector
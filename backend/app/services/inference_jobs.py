@@ -0,0 +1,421 @@
+"""
+Asynchronous Inference Jobs
+Backs POST /detect?async=1 on the cat and dog blueprints.
+
+The request only validates the upload and stores it as a job; a small
+pool of worker threads runs the model, writes the emotion history row
+and records the result. Clients poll GET /jobs/<id> or subscribe to
+GET /jobs/<id>/events (server-sent events).
+
+Jobs live in a local SQLite file (JOBS_DB_PATH), not in memory:
+
+- every web worker process of the prefork server shares the same store,
+  and a job can be claimed by whichever process has a free worker thread
+- queued jobs, and jobs whose worker process died mid-run, are picked up
+  again after a restart
+- the number of queued jobs is capped (JOBS_QUEUE_CAPACITY); beyond that
+  submit_job raises JobQueueFull and the route answers 503
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from io import BytesIO
+
+logger = logging.getLogger("InferenceJobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+# A job whose worker process died this many times is failed instead of requeued
+MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inference_jobs (
+    id TEXT PRIMARY KEY,
+    species TEXT NOT NULL,
+    pet_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    payload BLOB,
+    result TEXT,
+    error TEXT,
+    owner INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_inference_jobs_status ON inference_jobs (status, created_at);
+"""
+
+
+class JobQueueFull(Exception):
+    """Raised when JOBS_QUEUE_CAPACITY jobs are already waiting"""
+
+
+class JobStore:
+    """SQLite-backed job table, safe to share between threads and processes"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call: cheap for SQLite, and never shared across threads.
+        # Autocommit mode; closing mid-transaction rolls it back.
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def add(self, species, pet_id, payload, capacity):
+        """Insert a queued job unless `capacity` jobs are already queued"""
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            (queued,) = conn.execute("SELECT COUNT(*) FROM inference_jobs WHERE status = ?", (QUEUED,)).fetchone()
+            if queued >= capacity:
+                conn.execute("ROLLBACK")
+                raise JobQueueFull(f"{queued} jobs are already queued")
+            conn.execute(
+                "INSERT INTO inference_jobs (id, species, pet_id, status, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, species, pet_id, QUEUED, sqlite3.Binary(payload), time.time()),
+            )
+            conn.execute("COMMIT")
+        return job_id
+
+    def claim(self, owner):
+        """Atomically move the oldest queued job to running; returns the row or None"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM inference_jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE inference_jobs SET status = ?, owner = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, owner, time.time(), row["id"]),
+                )
+            conn.execute("COMMIT")
+            return row
+
+    def finish(self, job_id, result=None, error=None):
+        """Record the outcome and drop the stored image"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE inference_jobs SET status = ?, result = ?, error = ?, payload = NULL, finished_at = ? WHERE id = ?",
+                (FAILED if error else DONE, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, species, pet_id, status, result, error, created_at, started_at, finished_at "
+                "FROM inference_jobs WHERE id = ?", (job_id,),
+            ).fetchone()
+        return _job_to_dict(row) if row else None
+
+    def requeue_orphans(self, stale_seconds=600):
+        """
+        Put back running jobs whose worker process no longer exists (or that
+        have been running for longer than stale_seconds, in case the pid was
+        reused). Jobs that already took MAX_ATTEMPTS tries are failed.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, owner, attempts, started_at FROM inference_jobs WHERE status = ?", (RUNNING,)
+            ).fetchall()
+            orphans = [
+                row for row in rows
+                if not _process_alive(row["owner"]) or (row["started_at"] or 0) < now - stale_seconds
+            ]
+            for row in orphans:
+                if row["attempts"] >= MAX_ATTEMPTS:
+                    conn.execute(
+                        "UPDATE inference_jobs SET status = ?, error = ?, payload = NULL, finished_at = ? "
+                        "WHERE id = ? AND status = ?",
+                        (FAILED, "Worker process died while running this job", now, row["id"], RUNNING),
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE inference_jobs SET status = ?, owner = NULL, started_at = NULL WHERE id = ? AND status = ?",
+                        (QUEUED, row["id"], RUNNING),
+                    )
+        return len(orphans)
+
+    def purge(self, older_than_seconds):
+        """Delete finished jobs older than the retention window"""
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM inference_jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, FAILED, time.time() - older_than_seconds),
+            )
+
+    def counts(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM inference_jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+def _process_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _job_to_dict(row):
+    return {
+        "job_id": row["id"],
+        "species": row["species"],
+        "pet_id": row["pet_id"],
+        "status": row["status"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+    }
+
+
+class JobRunner:
+    """Worker threads that claim jobs from the store and run them"""
+
+    def __init__(self, app, store, workers=2, poll_interval=1.0, retention_seconds=86400):
+        self.app = app
+        self.store = store
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._wakeup = threading.Event()
+        self._changed = threading.Condition()
+        self._threads = []
+        self._pid = None
+        self._last_purge = 0.0
+
+    def start(self):
+        # Threads do not survive fork(), so a forked worker starts its own pool
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        requeued = self.store.requeue_orphans()
+        if requeued:
+            print(f"♻️  Requeued {requeued} interrupted inference jobs")
+        self._threads = [
+            threading.Thread(target=self._loop, name=f"inference-job-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def notify(self):
+        """Wake an idle worker thread (a job was just queued in this process)"""
+        self._wakeup.set()
+
+    def wait_for_change(self, timeout):
+        """Block until a job finished in this process, or timeout"""
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def _loop(self):
+        while True:
+            try:
+                job = self.store.claim(os.getpid())
+            except Exception as e:
+                logger.error(f"Could not claim a job: {e}")
+                job = None
+
+            if job is None:
+                self._maybe_purge()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            self._run(job)
+            with self._changed:
+                self._changed.notify_all()
+
+    def _run(self, job):
+        try:
+            with self.app.app_context():
+                result = run_job(job["species"], job["pet_id"], bytes(job["payload"]))
+            self.store.finish(job["id"], result=result)
+        except Exception as e:
+            logger.error(f"Inference job {job['id']} failed: {e}")
+            self.store.finish(job["id"], error=str(e))
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge > 60:
+            self._last_purge = now
+            try:
+                self.store.purge(self.retention_seconds)
+            except Exception as e:
+                logger.warning(f"Could not purge finished jobs: {e}")
+
+
+def run_job(species, pet_id, image_bytes):
+    """
+    Predict and write the history row, exactly like the synchronous /detect
+
+    Returns:
+        dict: The same 'data' payload /detect returns
+    """
+    from flask import g
+    from app.models import CatEmotionHistory, DogEmotionHistory
+    from app.services.detectors import get_emotion_detector
+    from app.services.history_writer import record_history
+
+    g.inference_species = species  # labels the db_commit stage metric
+    detector = get_emotion_detector(species, batched=True)
+    result = detector.predict_from_bytes(image_bytes)
+    if not result["success"]:
+        raise RuntimeError(result["error"])
+
+    history_model = CatEmotionHistory if species == "cat" else DogEmotionHistory
+    history_record = record_history(
+        history_model,
+        pet_id=pet_id,
+        emotion=result["emotion"],
+        confidence=result["confidence"],
+        probabilities=json.dumps(result["all_probabilities"]),
+        image_url=None,
+        model_version=result.get("model_version"),
+    )
+
+    data = {
+        "id": history_record["id"],
+        "emotion": result["emotion"],
+        "confidence": result["confidence"],
+        "probabilities": result["all_probabilities"],
+        "model_version": result.get("model_version"),
+        "created_at": history_record["created_at"],
+    }
+    if "stage" in result:
+        data["stage"] = result["stage"]
+    return data
+
+
+def validate_image(image_bytes):
+    """Raise ValueError unless the bytes parse as an image (header check, no full decode)"""
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(image_bytes)) as img:
+            img.verify()
+    except Exception as e:
+        raise ValueError(f"Invalid image: {e}")
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner(app=None):
+    """Return the process-wide job runner, creating and starting it on first use"""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                from flask import current_app
+                app = app or current_app._get_current_object()
+                store = JobStore(app.config["JOBS_DB_PATH"])
+                _runner = JobRunner(
+                    app,
+                    store,
+                    workers=app.config.get("JOBS_WORKERS", 2),
+                    poll_interval=app.config.get("JOBS_POLL_INTERVAL_SECONDS", 1.0),
+                    retention_seconds=app.config.get("JOBS_RETENTION_SECONDS", 86400),
+                )
+    _runner.start()
+    return _runner
+
+
+def start_job_workers(app):
+    """Start this process's job worker threads (if async jobs are enabled)"""
+    if app.config.get("JOBS_ENABLED", True):
+        return get_job_runner(app)
+    return None
+
+
+def submit_job(species, pet_id, image_bytes):
+    """
+    Validate an upload and queue it for the worker pool
+
+    Returns:
+        str: The job id
+
+    Raises:
+        ValueError: The bytes are not an image
+        JobQueueFull: JOBS_QUEUE_CAPACITY jobs are already waiting
+    """
+    from flask import current_app
+
+    validate_image(image_bytes)
+    runner = get_job_runner()
+    job_id = runner.store.add(species, pet_id, image_bytes, current_app.config.get("JOBS_QUEUE_CAPACITY", 256))
+    runner.notify()
+    return job_id
+
+
+def get_job(job_id, species=None):
+    """Job dict for a blueprint, or None if unknown (or queued for the other species)"""
+    job = get_job_runner().store.get(job_id)
+    if job is None or (species and job["species"] != species):
+        return None
+    return job
+
+
+def job_events(job_id, species=None, heartbeat_seconds=15.0):
+    """
+    Generator of server-sent events for one job
+
+    Emits a "status" event whenever the status changes and ends after the
+    "done" / "failed" event. Jobs may finish in another worker process, so
+    the store is re-read at least every second.
+    """
+    runner = get_job_runner()
+    last_status = None
+    last_sent = time.monotonic()
+
+    while True:
+        job = runner.store.get(job_id)
+        if job is None or (species and job["species"] != species):
+            yield _sse("error", {"job_id": job_id, "error": "Job not found"})
+            return
+
+        if job["status"] != last_status:
+            last_status = job["status"]
+            last_sent = time.monotonic()
+            yield _sse("status", job)
+            if last_status in FINISHED:
+                return
+        elif time.monotonic() - last_sent >= heartbeat_seconds:
+            last_sent = time.monotonic()
+            yield ": keep-alive\n\n"
+
+        runner.wait_for_change(timeout=1.0)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
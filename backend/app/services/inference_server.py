@@ -0,0 +1,218 @@
+"""
+Inference Server
+Standalone daemon that owns the cat (PyTorch) and dog (TensorFlow) models
+so web workers do not each keep a private copy in memory.
+
+Workers talk to it over a Unix domain socket. Control messages are small
+length-prefixed JSON frames; the image tensors themselves travel through
+a shared memory segment owned by the calling worker, so pixel data is
+never pickled or copied through the socket.
+
+Run from the backend/ folder:
+    python -m app.services.inference_server --socket /tmp/pet-inference.sock
+and start the web app with INFERENCE_SERVER_SOCKET pointing at the same path.
+"""
+
+import argparse
+import json
+import logging
+import os
+import socketserver
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from traceback import format_exc
+
+import numpy as np
+
+from app.services.model_preload import warm_up
+from app.services.thread_budget import configure_thread_budget
+from app.services.preprocessing import input_shape
+
+logger = logging.getLogger("InferenceServer")
+
+DEFAULT_SOCKET_PATH = "/tmp/pet-inference.sock"
+
+_HEADER = struct.Struct("!I")
+
+
+def send_message(sock, message):
+    """Send one length-prefixed JSON frame"""
+    payload = json.dumps(message).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(sock):
+    """Receive one length-prefixed JSON frame, or None when the peer closed"""
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    payload = _recv_exactly(sock, length)
+    if payload is None:
+        return None
+    return json.loads(payload.decode("utf-8"))
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def attach_shared_memory(name):
+    """
+    Attach to a segment created by a client without taking ownership
+
+    On Python < 3.13 attaching registers the segment with this process'
+    resource tracker, which would unlink it when the server exits.
+    """
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception:
+        pass
+    return segment
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded Unix socket server dispatching requests to the loaded detectors"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, detectors):
+        """
+        Args:
+            socket_path (str): Filesystem path of the Unix socket
+            detectors (dict): species -> detector exposing predict_preprocessed()
+        """
+        self.detectors = detectors
+        self.cat_scheduler = None
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, InferenceRequestHandler)
+        os.chmod(socket_path, 0o660)
+
+    def dispatch(self, message, attachments):
+        op = message.get("op")
+
+        if op == "ping":
+            return {"ok": True}
+
+        if op == "info":
+            return {
+                "ok": True,
+                "detectors": {
+                    species: {
+                        "classes": detector.classes,
+                        "device": getattr(detector, "device", "cpu"),
+                        "model_version": getattr(detector, "model_version", None),
+                    }
+                    for species, detector in self.detectors.items()
+                },
+            }
+
+        if op == "predict":
+            species = message["species"]
+            detector = self.detectors.get(species)
+            if detector is None:
+                return {"ok": False, "error": f"No {species} model loaded in inference server"}
+
+            name = message["shm"]
+            segment = attachments.get(name)
+            if segment is None:
+                segment = attach_shared_memory(name)
+                attachments[name] = segment
+
+            batch_size = int(message["batch_size"])
+            batch = np.ndarray(input_shape(species, batch_size), dtype=np.float32, buffer=segment.buf)
+
+            # Single images from different workers are merged by the cat scheduler.
+            # Queue a copy: after a timeout the client reuses its segment while
+            # the scheduler may still read the queued row
+            if species == "cat" and batch_size == 1 and self.cat_scheduler is not None:
+                results = [self.cat_scheduler.predict_array(batch[0].copy())]
+            else:
+                results = detector.predict_preprocessed(batch)
+            del batch
+            return {"ok": True, "results": results}
+
+        return {"ok": False, "error": f"Unknown op: {op}"}
+
+
+class InferenceRequestHandler(socketserver.BaseRequestHandler):
+    """One connection per client thread; handles requests until it closes"""
+
+    def handle(self):
+        attachments = {}
+        try:
+            while True:
+                message = recv_message(self.request)
+                if message is None:
+                    break
+                try:
+                    response = self.server.dispatch(message, attachments)
+                except Exception as e:
+                    logger.error(f"❌ Inference request failed: {e}")
+                    logger.debug(format_exc())
+                    response = {"ok": False, "error": str(e)}
+                send_message(self.request, response)
+        finally:
+            for segment in attachments.values():
+                segment.close()
+
+
+def load_detectors(species_list):
+    """Load the requested detectors once, in this process"""
+    detectors = {}
+    if "cat" in species_list:
+        from app.services.cat_emotion_service import get_cat_emotion_detector
+        detector = get_cat_emotion_detector()
+        if hasattr(detector, "predict_preprocessed"):
+            detectors["cat"] = detector
+        else:
+            logger.error("Cat model failed to load, cat requests will be rejected")
+    if "dog" in species_list:
+        from app.services.dog_emotion_service import get_dog_emotion_detector
+        detectors["dog"] = get_dog_emotion_detector()
+    return detectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pet emotion inference server")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="Unix socket path to listen on")
+    parser.add_argument("--species", default="cat,dog", help="Comma separated models to load")
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app(preload_models=False)
+    # Every forward pass of every web worker runs here, so this process gets all the cores
+    app.config["CPU_BUDGET_WORKERS"] = 1
+    configure_thread_budget(app)
+    with app.app_context():
+        detectors = load_detectors([s.strip() for s in args.species.split(",") if s.strip()])
+        for species, detector in detectors.items():
+            warm_up(species, detector, app.config["MODEL_WARMUP_BATCH_SIZES"], app.config["MODEL_WARMUP_ITERATIONS"])
+        server = InferenceServer(args.socket, detectors)
+        if "cat" in detectors and app.config.get("CAT_BATCHING_ENABLED"):
+            from app.services.cat_emotion_service import get_cat_inference_scheduler
+            server.cat_scheduler = get_cat_inference_scheduler()
+
+    logger.info(f"Inference server listening on {args.socket} ({', '.join(detectors)})")
+    print(f"✅ Inference server listening on {args.socket} ({', '.join(detectors)})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,488 @@
+"""
+Metrics
+Prometheus text-format metrics shared by every worker process.
+
+Observations stay in plain Python lists, one shard per thread, so the hot
+path is a dict lookup, a bisect and two additions (a few hundred
+nanoseconds, no lock). A background thread writes each process's totals
+to METRICS_DIR/metrics-<pid>.json once per METRICS_FLUSH_SECONDS, and
+GET /metrics merges the files of all processes:
+
+- counters and histograms are summed over every file, including those of
+  workers that have exited, so totals only go up while the server runs
+- gauges only count live processes, summed or maxed per metric
+
+Gauges that are cheap to read at flush time (cache hit counters, queue
+depths, DB pool usage, model load times) are filled by collector
+callbacks instead of being updated on the request path.
+
+Usage:
+    FORWARD_SECONDS = STAGE_SECONDS.labels("cat", "forward")
+    started = perf_counter()
+    ...
+    FORWARD_SECONDS.observe(perf_counter() - started)
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from threading import get_ident
+
+logger = logging.getLogger("Metrics")
+
+# Latency buckets in seconds, from sub-millisecond decode to multi-second batches
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+_registry = {}
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+class _Child:
+    """One label combination; each thread writes to its own shard"""
+
+    __slots__ = ("_bounds", "_shards", "_size", "_lock")
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        # Histogram: one slot per bucket plus +Inf, then the sum. Counter: [value]
+        self._size = len(bounds) + 2 if bounds is not None else 1
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def _new_shard(self):
+        shard = [0] * self._size
+        with self._lock:
+            self._shards[get_ident()] = shard
+        return shard
+
+    def observe(self, value):
+        shard = self._shards.get(get_ident()) or self._new_shard()
+        shard[bisect_left(self._bounds, value)] += 1
+        shard[-1] += value
+
+    def inc(self, amount=1):
+        shard = self._shards.get(get_ident()) or self._new_shard()
+        shard[0] += amount
+
+    def total(self):
+        with self._lock:
+            shards = list(self._shards.values())
+        totals = [0] * self._size
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._shards = {}
+
+
+class _Metric:
+    def __init__(self, kind, name, documentation, labelnames=(), buckets=None, mode="sum"):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets is not None else None
+        self.mode = mode
+        self._children = {}
+        self._gauge_values = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Child for these label values; keep a reference to it on hot paths"""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, _Child(self.buckets if self.kind == "histogram" else None))
+        return child
+
+    def set(self, values, value):
+        """Gauge (or collected counter) value for one label combination"""
+        self._gauge_values[tuple(str(v) for v in values)] = value
+
+    def snapshot(self):
+        if self.kind in ("gauge", "collected_counter"):
+            values = [[list(labels), value] for labels, value in self._gauge_values.items()]
+        else:
+            with self._lock:
+                children = list(self._children.items())
+            values = [[list(labels), child.total()] for labels, child in children]
+        return {
+            "kind": self.kind,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "buckets": list(self.buckets) if self.buckets is not None else None,
+            "mode": self.mode,
+            "values": values,
+        }
+
+    def reset(self):
+        with self._lock:
+            for child in self._children.values():
+                child.reset()
+            self._gauge_values = {}
+
+
+def _register(metric):
+    with _registry_lock:
+        return _registry.setdefault(metric.name, metric)
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _register(_Metric("histogram", name, documentation, labelnames, buckets))
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(_Metric("counter", name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), mode="sum"):
+    """Gauge filled by a collector; mode is how live processes combine ("sum" or "max")"""
+    return _register(_Metric("gauge", name, documentation, labelnames, mode=mode))
+
+
+def collected_counter(name, documentation, labelnames=()):
+    """Counter whose per-process total is read by a collector (e.g. cache hits)"""
+    return _register(_Metric("collected_counter", name, documentation, labelnames))
+
+
+def register_collector(fn):
+    """Call fn() before every flush to refresh gauges / collected counters"""
+    _collectors.append(fn)
+    return fn
+
+
+# ==========================
+# Metric definitions
+# ==========================
+REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("blueprint", "route", "method", "status")
+)
+STAGE_SECONDS = histogram(
+    "inference_stage_duration_seconds",
+    "Time spent in one stage of the emotion pipeline (decode, preprocess, forward, db_commit)",
+    ("species", "stage"),
+)
+BATCH_SIZE = histogram(
+    "inference_batch_size", "Images per model forward pass", ("species",), buckets=BATCH_SIZE_BUCKETS
+)
+MODEL_LOAD_SECONDS = gauge("model_load_seconds", "Time the emotion model took to load", ("species",), mode="max")
+MODEL_READY = gauge("model_ready", "Processes whose emotion model is loaded and warmed up", ("species",))
+CACHE_LOOKUPS = collected_counter(
+    "prediction_cache_lookups_total", "Prediction cache lookups by outcome", ("species", "outcome")
+)
+CACHE_ENTRIES = gauge("prediction_cache_entries", "Predictions held in the cache", ("species",))
+QUEUE_DEPTH = gauge("inference_queue_depth", "Requests waiting in the cat micro-batching queue", ("species",))
+JOBS = gauge("inference_jobs", "Async detection jobs by status (shared store)", ("status",), mode="max")
+DB_POOL_CONNECTIONS = gauge("db_pool_connections", "SQLAlchemy pool connections by state", ("state",))
+ERRORS = counter("http_request_errors_total", "Responses with a 5xx status by route", ("blueprint", "route"))
+
+
+# ==========================
+# Per-process files
+# ==========================
+class _Flusher:
+    def __init__(self):
+        self.directory = None
+        self.interval = 1.0
+        self._pid = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._loop, name="metrics-flush", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Could not write metrics: {e}")
+
+    def flush(self):
+        if not self.directory:
+            return
+        for collect in list(_collectors):
+            try:
+                collect()
+            except Exception as e:
+                logger.debug(f"Metrics collector {getattr(collect, '__name__', collect)} failed: {e}")
+
+        with _registry_lock:
+            metrics = list(_registry.values())
+        data = {"pid": os.getpid(), "metrics": {metric.name: metric.snapshot() for metric in metrics}}
+
+        path = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+
+
+_flusher = _Flusher()
+
+
+def _reset_after_fork():
+    """A forked worker starts from zero; the parent's totals are already in its own file"""
+    global _registry_lock
+    # The parent's flush thread may have held any of these locks at fork time
+    _registry_lock = threading.Lock()
+    _flusher._lock = threading.Lock()
+    for metric in _registry.values():
+        metric._lock = threading.Lock()
+        for child in metric._children.values():
+            child._lock = threading.Lock()
+        metric.reset()
+    _flusher._pid = None
+    if _flusher.directory:
+        _flusher.start(_flusher.directory, _flusher.interval)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def start_metrics(directory, interval=1.0, clear_dead=False):
+    """
+    Start writing this process's metrics to `directory`
+
+    Args:
+        clear_dead (bool): Delete files left by processes that no longer
+            exist (on server start, so totals do not carry over restarts)
+    """
+    os.makedirs(directory, exist_ok=True)
+    if clear_dead:
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            try:
+                pid = int(os.path.basename(path)[len("metrics-"):-len(".json")])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _process_alive(pid):
+                os.remove(path)
+    _flusher.start(directory, interval)
+
+
+# ==========================
+# Exposition
+# ==========================
+def _merge(directory):
+    merged = {}
+    for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # being replaced right now
+        alive = _process_alive(data.get("pid", 0))
+
+        for name, metric in data["metrics"].items():
+            entry = merged.setdefault(name, {**metric, "values": {}})
+            for labels, value in metric["values"]:
+                key = tuple(labels)
+                if metric["kind"] == "gauge":
+                    if not alive:
+                        continue
+                    if key in entry["values"]:
+                        current = entry["values"][key]
+                        value = max(current, value) if metric["mode"] == "max" else current + value
+                    entry["values"][key] = value
+                elif metric["kind"] == "histogram":
+                    current = entry["values"].get(key)
+                    entry["values"][key] = [a + b for a, b in zip(current, value)] if current else list(value)
+                else:
+                    entry["values"][key] = entry["values"].get(key, 0) + (value[0] if isinstance(value, list) else value)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics(directory):
+    """Merge every process's file and render the Prometheus text format"""
+    _flusher.flush()  # include this process's latest observations
+    lines = []
+    for name, metric in sorted(_merge(directory).items()):
+        kind = "counter" if metric["kind"] == "collected_counter" else metric["kind"]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {kind}")
+        labelnames = metric["labelnames"]
+
+        for labels, value in sorted(metric["values"].items()):
+            if kind == "histogram":
+                cumulative = 0
+                for bound, count in zip(metric["buckets"] + ["+Inf"], value[:-1]):
+                    cumulative += count
+                    le = bound if bound == "+Inf" else repr(float(bound))
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, labels, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{_format_labels(labelnames, labels)} {cumulative}")
+            else:
+                suffix = "" if kind == "gauge" or name.endswith("_total") else "_total"
+                lines.append(f"{name}{suffix}{_format_labels(labelnames, labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ==========================
+# Flask integration
+# ==========================
+def _commit_species():
+    """Species a DB commit belongs to: the async job being run, else the blueprint"""
+    from flask import g, has_app_context, has_request_context, request
+
+    if has_app_context() and g.get("inference_species"):
+        return g.inference_species
+    if has_request_context() and request.blueprint:
+        for species in ("cat", "dog"):
+            if request.blueprint.startswith(species):
+                return species
+    return "other"
+
+
+def _instrument_db_commits(app):
+    from sqlalchemy import event
+    from app import db
+
+    def before_commit(session):
+        session.info["metrics_commit_started"] = time.perf_counter()
+
+    def after_commit(session):
+        started = session.info.pop("metrics_commit_started", None)
+        if started is not None:
+            STAGE_SECONDS.labels(_commit_species(), "db_commit").observe(time.perf_counter() - started)
+
+    def after_rollback(session):
+        session.info.pop("metrics_commit_started", None)
+
+    event.listen(db.session, "before_commit", before_commit)
+    event.listen(db.session, "after_commit", after_commit)
+    event.listen(db.session, "after_rollback", after_rollback)
+
+
+def _instrument_requests(app):
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_request_started = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        started = g.pop("metrics_request_started", None)
+        if started is not None:
+            # The URL rule, not the path, so ids do not blow up the label set
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            blueprint = request.blueprint or "app"
+            REQUEST_SECONDS.labels(blueprint, route, request.method, response.status_code).observe(
+                time.perf_counter() - started
+            )
+            if response.status_code >= 500:
+                ERRORS.labels(blueprint, route).inc()
+        return response
+
+
+def _register_collectors(app):
+    @register_collector
+    def collect_models():
+        from app.services.model_preload import model_status
+
+        for species, entry in model_status().items():
+            if "load_seconds" in entry:
+                MODEL_LOAD_SECONDS.set((species,), entry["load_seconds"])
+            MODEL_READY.set((species,), 1 if entry.get("state") == "ready" else 0)
+
+    @register_collector
+    def collect_caches():
+        from app.services.prediction_cache import cache_stats
+
+        for species, stats in cache_stats().items():
+            for outcome, key in (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced")):
+                CACHE_LOOKUPS.set((species, outcome), stats[key])
+            CACHE_ENTRIES.set((species,), stats["entries"])
+
+    @register_collector
+    def collect_queues():
+        from app.services import cat_emotion_service, inference_jobs
+
+        # Only report what already exists; collecting must never create a scheduler or runner
+        scheduler = cat_emotion_service._scheduler_instance
+        if scheduler is not None:
+            QUEUE_DEPTH.set(("cat",), scheduler.stats()["queue_size"])
+        runner = inference_jobs._runner
+        if runner is not None:
+            counts = runner.store.counts()
+            for status in (inference_jobs.QUEUED, inference_jobs.RUNNING, inference_jobs.DONE, inference_jobs.FAILED):
+                JOBS.set((status,), counts.get(status, 0))
+
+    @register_collector
+    def collect_db_pool():
+        from app import db
+
+        with app.app_context():
+            pool = db.engine.pool
+        if hasattr(pool, "checkedout"):
+            DB_POOL_CONNECTIONS.set(("checked_out",), pool.checkedout())
+            DB_POOL_CONNECTIONS.set(("idle",), pool.checkedin())
+            DB_POOL_CONNECTIONS.set(("overflow",), max(pool.overflow(), 0))
+
+
+def init_metrics(app):
+    """
+    Instrument the app and start writing this process's metrics file
+
+    Forked workers (app.server) restart the writer after fork on their own.
+    No-op unless METRICS_ENABLED.
+    """
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+
+    from flask import Response, current_app
+
+    _instrument_requests(app)
+    _instrument_db_commits(app)
+    _register_collectors(app)
+    start_metrics(app.config["METRICS_DIR"], app.config.get("METRICS_FLUSH_SECONDS", 1.0), clear_dead=True)
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render_metrics(current_app.config["METRICS_DIR"]), mimetype="text/plain; version=0.0.4")
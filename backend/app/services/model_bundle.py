@@ -0,0 +1,177 @@
+"""
+Model Bundles
+Memory-mappable model weights: a safetensors-layout weight file plus a
+manifest, stored together in a "<name>.bundle" folder:
+
+    cat_resnet18.bundle/
+        manifest.json        format, model name, version, classes, sha256
+        weights.safetensors  8-byte header length, JSON header, raw tensors
+
+The weight file follows the safetensors layout, so any safetensors reader
+can open it. It is read here with plain mmap + NumPy, without an extra
+dependency. The arrays returned by load_bundle are views of the mapping
+itself. Every process that loads the same bundle (and every worker
+forked from a master that loaded it) shares one copy of the weight
+pages through the page cache instead of holding a private heap copy.
+
+Build bundles with build_model_bundles.py.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+BUNDLE_FORMAT = "pet-emotion-bundle/1"
+MANIFEST_NAME = "manifest.json"
+WEIGHTS_NAME = "weights.safetensors"
+
+# safetensors dtype names <-> NumPy dtypes
+_DTYPES = {
+    "F64": np.float64,
+    "F32": np.float32,
+    "F16": np.float16,
+    "I64": np.int64,
+    "I32": np.int32,
+    "I16": np.int16,
+    "I8": np.int8,
+    "U8": np.uint8,
+    "BOOL": np.bool_,
+}
+_DTYPE_NAMES = {np.dtype(dtype): name for name, dtype in _DTYPES.items()}
+
+
+class BundleError(Exception):
+    """Raised for missing, corrupt or mismatched model bundles"""
+
+
+def is_bundle(path):
+    return bool(path) and os.path.isfile(os.path.join(path, MANIFEST_NAME))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_bundle(path, tensors, model, version, metadata=None):
+    """
+    Write a bundle folder
+
+    Args:
+        path (str): Bundle folder to create (e.g. app/trained/cat_resnet18.bundle)
+        tensors (dict): name -> NumPy array
+        model (str): Model identifier, e.g. "cat_resnet18"
+        version (str): Version recorded in the manifest
+        metadata (dict): Extra manifest fields (classes, architecture, ...)
+
+    Returns:
+        dict: The manifest that was written
+    """
+    os.makedirs(path, exist_ok=True)
+
+    # Widest dtypes first so every tensor stays aligned to its item size
+    ordered = sorted(tensors.items(), key=lambda item: -np.asarray(item[1]).dtype.itemsize)
+
+    header = {}
+    offset = 0
+    for name, array in ordered:
+        array = np.asarray(array)
+        if array.dtype not in _DTYPE_NAMES:
+            raise BundleError(f"Unsupported dtype {array.dtype} for tensor {name}")
+        header[name] = {
+            "dtype": _DTYPE_NAMES[array.dtype],
+            "shape": list(array.shape),
+            "data_offsets": [offset, offset + array.nbytes],
+        }
+        offset += array.nbytes
+    header["__metadata__"] = {"format": BUNDLE_FORMAT, "model": model, "version": str(version)}
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    # Pad with spaces (allowed by the format) so the data section starts 64-byte aligned
+    header_bytes += b" " * (-(8 + len(header_bytes)) % 64)
+
+    weights_path = os.path.join(path, WEIGHTS_NAME)
+    tmp_path = weights_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for _, array in ordered:
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, weights_path)
+
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "model": model,
+        "version": str(version),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "weights": WEIGHTS_NAME,
+        "sha256": file_sha256(weights_path),
+        "size_bytes": os.path.getsize(weights_path),
+        "tensors": len(ordered),
+    }
+    manifest.update(metadata or {})
+
+    with open(os.path.join(path, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BundleError(f"Cannot read bundle manifest in {path}: {e}")
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format')!r} in {path}")
+    return manifest
+
+
+def load_bundle(path, verify=False):
+    """
+    Map a bundle's weights into memory
+
+    Args:
+        path (str): Bundle folder
+        verify (bool): Check the weight file against the manifest sha256
+            (reads the whole file once, which also warms the page cache)
+
+    Returns:
+        tuple: (manifest dict, dict of name -> NumPy array backed by the mapping)
+    """
+    manifest = read_manifest(path)
+    weights_path = os.path.join(path, manifest.get("weights", WEIGHTS_NAME))
+
+    if verify:
+        actual = file_sha256(weights_path)
+        if actual != manifest.get("sha256"):
+            raise BundleError(f"Checksum mismatch for {weights_path}: expected {manifest.get('sha256')}, got {actual}")
+
+    with open(weights_path, "rb") as f:
+        # Private (copy-on-write) mapping: pages come from the shared page
+        # cache and only a page that is actually written gets copied. The
+        # mapping stays valid after the file is closed.
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    (header_len,) = struct.unpack("<Q", mapped[:8])
+    header = json.loads(mapped[8:8 + header_len].decode("utf-8"))
+    header.pop("__metadata__", None)
+    data_start = 8 + header_len
+
+    buffer = memoryview(mapped)
+    tensors = {}
+    for name, info in header.items():
+        begin, end = info["data_offsets"]
+        dtype = np.dtype(_DTYPES[info["dtype"]])
+        tensors[name] = np.frombuffer(
+            buffer, dtype=dtype, count=(end - begin) // dtype.itemsize, offset=data_start + begin
+        ).reshape(info["shape"])
+    return manifest, tensors
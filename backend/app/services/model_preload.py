@@ -0,0 +1,187 @@
+"""
+Model Preload
+Loads and warms up the emotion detectors in a background thread when the
+app starts, so the first /detect request does not pay for importing
+torch / tensorflow, reading the weights and tracing graphs.
+
+Also keeps the per-species load state that the readiness and /health
+endpoints report. Reading the state never triggers a model load.
+"""
+
+import logging
+import threading
+import time
+from traceback import format_exc
+
+logger = logging.getLogger("ModelPreload")
+
+SPECIES = ("cat", "dog")
+
+_status = {species: {"state": "not_loaded"} for species in SPECIES}
+_status_lock = threading.Lock()
+# Species being preloaded: loading them ends at "loaded", warming up at "ready"
+_warmup_pending = set()
+
+
+def mark_loading(species):
+    with _status_lock:
+        _status[species] = {"state": "loading", "started_at": time.time()}
+
+
+def record_load(species, seconds, error=None):
+    """Record the outcome of a model load (called by the detector getters)"""
+    with _status_lock:
+        entry = _status.setdefault(species, {})
+        entry["load_seconds"] = round(seconds, 3)
+        if error is None:
+            # A lazy load (no preload) is ready as soon as the weights are in
+            entry["state"] = "loaded" if species in _warmup_pending else "ready"
+            entry.pop("error", None)
+        else:
+            _warmup_pending.discard(species)
+            entry["state"] = "failed"
+            entry["error"] = str(error)
+
+
+def expect_warmup(species):
+    """Hold readiness until record_warmup, also for a model loaded before (e.g. in the prefork master)"""
+    with _status_lock:
+        _warmup_pending.add(species)
+        entry = _status.setdefault(species, {"state": "not_loaded"})
+        if entry.get("state") == "ready":
+            entry["state"] = "loaded"
+
+
+def mark_warming(species):
+    with _status_lock:
+        _status.setdefault(species, {})["state"] = "warming_up"
+
+
+def record_warmup(species, warmup):
+    with _status_lock:
+        entry = _status.setdefault(species, {})
+        _warmup_pending.discard(species)
+        entry["warmup"] = warmup
+        entry["state"] = "ready"
+
+
+def model_status(species=None):
+    """Snapshot of the load state, for one species or all of them"""
+    with _status_lock:
+        if species is not None:
+            return dict(_status.get(species, {"state": "not_loaded"}))
+        return {name: dict(entry) for name, entry in _status.items()}
+
+
+def is_ready(species_list=SPECIES):
+    status = model_status()
+    return all(status.get(species, {}).get("state") == "ready" for species in species_list)
+
+
+def warm_up(species, detector, batch_sizes=(1,), iterations=3):
+    """
+    Run dummy forward passes so lazy initialisation (oneDNN kernels,
+    tf.function tracing, ORT memory arenas) happens before real traffic
+
+    Args:
+        species (str): "cat" or "dog"
+        detector: Loaded detector exposing predict_preprocessed and input_pool
+        batch_sizes: Batch sizes to warm, e.g. (1, 8)
+        iterations (int): Passes per batch size
+
+    Returns:
+        dict: batch size -> {"first_ms", "warm_ms"} latencies
+    """
+    report = {}
+    for size in batch_sizes:
+        timings = []
+        with detector.input_pool.batch(int(size)) as batch:
+            batch.fill(0)
+            for _ in range(max(1, iterations)):
+                t0 = time.perf_counter()
+                detector.predict_preprocessed(batch)
+                timings.append((time.perf_counter() - t0) * 1000.0)
+        report[str(size)] = {"first_ms": round(timings[0], 2), "warm_ms": round(timings[-1], 2)}
+        logger.info(f"Warmed up {species} model at batch {size}: {timings[0]:.1f} ms -> {timings[-1]:.1f} ms")
+
+    # The second stage of a model cascade only runs on low-confidence inputs
+    warm_up_cascade = getattr(detector, "warm_up_cascade", None)
+    if warm_up_cascade is not None:
+        warm_up_cascade(batch_sizes)
+    return report
+
+
+def _load_local(species):
+    if species == "cat":
+        from app.services.cat_emotion_service import get_cat_emotion_detector, get_cat_inference_scheduler
+        detector = get_cat_emotion_detector()
+        # Starts the scheduler thread too (no-op when the model failed to load)
+        get_cat_inference_scheduler()
+        return detector
+    from app.services.dog_emotion_service import get_dog_emotion_detector
+    return get_dog_emotion_detector()
+
+
+def _preload(species, batch_sizes, iterations):
+    from app.services.settings import get_setting
+
+    if get_setting("INFERENCE_SERVER_SOCKET"):
+        # The inference server owns (and warms) the models; just check it answers
+        from app.services.inference_client import get_remote_detector
+        mark_loading(species)
+        t0 = time.perf_counter()
+        try:
+            get_remote_detector(species, get_setting("INFERENCE_SERVER_SOCKET")).classes
+            record_load(species, time.perf_counter() - t0)
+        except Exception as e:
+            record_load(species, time.perf_counter() - t0, error=f"Inference server unavailable: {e}")
+        return
+
+    expect_warmup(species)
+    detector = _load_local(species)
+    if not hasattr(detector, "predict_preprocessed"):
+        with _status_lock:
+            _warmup_pending.discard(species)
+        return  # load failed, already recorded by the getter
+    mark_warming(species)
+    record_warmup(species, warm_up(species, detector, batch_sizes, iterations))
+
+
+def preload_models(app, species_list=SPECIES, background=True):
+    """
+    Load and warm the given detectors
+
+    Batch sizes and passes come from MODEL_WARMUP_BATCH_SIZES and
+    MODEL_WARMUP_ITERATIONS.
+
+    Args:
+        app: Flask app whose config and context are used
+        species_list: Models to preload
+        background (bool): Run in a daemon thread (False blocks until done)
+
+    Returns:
+        threading.Thread: The started preload thread, or None when run inline
+    """
+    def run():
+        with app.app_context():
+            batch_sizes = app.config.get("MODEL_WARMUP_BATCH_SIZES", (1,))
+            iterations = app.config.get("MODEL_WARMUP_ITERATIONS", 3)
+            for species in species_list:
+                try:
+                    _preload(species, batch_sizes, iterations)
+                except Exception as e:
+                    logger.error(f"❌ Preloading the {species} model failed: {e}")
+                    logger.debug(format_exc())
+                    with _status_lock:
+                        _warmup_pending.discard(species)
+                        if _status.get(species, {}).get("state") != "failed":
+                            _status[species] = {"state": "failed", "error": str(e)}
+            logger.info(f"Model preload finished: {model_status()}")
+
+    if not background:
+        run()
+        return None
+
+    thread = threading.Thread(target=run, name="model-preload", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,431 @@
+"""
+Model Registry
+Versioned emotion models that can be swapped under live traffic.
+
+The registry is a JSON file (MODEL_REGISTRY_PATH, default
+app/trained/registry.json) shared by every process. Each species lists
+its registered versions (architecture, artifact path, class list,
+preprocessing spec, backend) and which one is active:
+
+    {"species": {"cat": {"active": "v2", "history": ["v1", "v2"],
+                         "versions": {"v1": {...}, "v2": {...}}}}}
+
+Changing the active version does not restart anything. A watcher thread
+in each process notices the change, loads the new version next to the
+one serving traffic, warms it up and swaps the global detector in one
+assignment. Requests already running finish on the old model. If the new
+version fails to load or warm up, the process keeps serving the old one
+and reports the error. The replaced detector is kept as a standby, so a
+rollback to it swaps straight back without reloading.
+
+Manage versions from the command line (GET /api/models lists them):
+    python -m app.services.model_registry register cat v2 app/trained/cat_v2.bundle
+    python -m app.services.model_registry activate cat v2
+    python -m app.services.model_registry rollback cat
+    python -m app.services.model_registry list
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from traceback import format_exc
+
+from app.services.preprocessing import PREPROCESSING_SPECS
+from app.services.settings import get_setting
+
+logger = logging.getLogger("ModelRegistry")
+
+DEFAULT_REGISTRY_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trained", "registry.json"
+)
+
+# Architectures each species' detector knows how to build
+SUPPORTED_ARCHITECTURES = {
+    "cat": ("resnet18",),
+    "dog": ("efficientnet_b0",),
+}
+BACKENDS = ("native", "onnx")
+
+
+class RegistryError(Exception):
+    """Raised for invalid registrations, unknown versions and impossible rollbacks"""
+
+
+class ModelRegistry:
+    """Reads and updates the registry file; updates are serialised with a file lock"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"species": {}}
+        except ValueError as e:
+            raise RegistryError(f"Registry file {self.path} is not valid JSON: {e}")
+
+    def active(self, species):
+        """Entry of the active version, or None"""
+        state = self.read()["species"].get(species) or {}
+        version = state.get("active")
+        return state["versions"][version] if version else None
+
+    def register(self, species, version, artifact_path, architecture, classes,
+                 preprocessing=None, backend="native"):
+        """
+        Add a version (inactive) after checking it can be served
+
+        Args:
+            species (str): "cat" or "dog"
+            version (str): Unique name within the species, e.g. "2026-10-18"
+            artifact_path (str): .pth / .h5 / .bundle (.onnx for the onnx backend)
+            architecture (str): One of SUPPORTED_ARCHITECTURES[species]
+            classes (list): Class names in model output order
+            preprocessing (dict): Must equal PREPROCESSING_SPECS[species];
+                defaults to it
+
+        Returns:
+            dict: The stored entry
+        """
+        if species not in SUPPORTED_ARCHITECTURES:
+            raise RegistryError(f"Unknown species: {species}")
+        if architecture not in SUPPORTED_ARCHITECTURES[species]:
+            raise RegistryError(
+                f"Unsupported {species} architecture {architecture!r} "
+                f"(supported: {', '.join(SUPPORTED_ARCHITECTURES[species])})"
+            )
+        if backend not in BACKENDS:
+            raise RegistryError(f"Unknown backend: {backend}")
+        if not classes or len(set(classes)) != len(classes):
+            raise RegistryError("classes must be a non-empty list of unique names")
+        preprocessing = dict(preprocessing or PREPROCESSING_SPECS[species])
+        if preprocessing != PREPROCESSING_SPECS[species]:
+            raise RegistryError(
+                f"Preprocessing {preprocessing} does not match the {species} pipeline {PREPROCESSING_SPECS[species]}"
+            )
+        artifact_path = os.path.abspath(artifact_path)
+        if not os.path.exists(artifact_path):
+            raise RegistryError(f"Model artifact not found: {artifact_path}")
+
+        entry = {
+            "species": species,
+            "version": version,
+            "architecture": architecture,
+            "artifact_path": artifact_path,
+            "classes": list(classes),
+            "preprocessing": preprocessing,
+            "backend": backend,
+            "registered_at": time.time(),
+        }
+        with self._update() as data:
+            state = data["species"].setdefault(species, {"active": None, "history": [], "versions": {}})
+            if version in state["versions"]:
+                raise RegistryError(f"{species} version {version} is already registered")
+            state["versions"][version] = entry
+        return entry
+
+    def activate(self, species, version):
+        """Make a registered version the active one; returns its entry"""
+        with self._update() as data:
+            state = data["species"].get(species)
+            if not state or version not in state["versions"]:
+                raise RegistryError(f"Unknown {species} version: {version}")
+            if state["active"] != version:
+                state["active"] = version
+                state["history"].append(version)
+            return state["versions"][version]
+
+    def rollback(self, species):
+        """Re-activate the version that was active before the current one"""
+        with self._update() as data:
+            state = data["species"].get(species)
+            if not state or len(state["history"]) < 2:
+                raise RegistryError(f"No earlier {species} version to roll back to")
+            state["history"].pop()
+            state["active"] = state["history"][-1]
+            return state["versions"][state["active"]]
+
+    @contextmanager
+    def _update(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock:
+            _lock_exclusive(lock)
+            data = self.read()
+            yield data
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def _lock_exclusive(lock_file):
+    """Block until this process holds the lock file (released when it is closed)"""
+    try:
+        import fcntl
+    except ImportError:
+        # Windows: lock the first byte; LK_LOCK retries for about 10 s, then raises
+        import msvcrt
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        return
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+
+def get_registry():
+    return ModelRegistry(get_setting("MODEL_REGISTRY_PATH") or DEFAULT_REGISTRY_PATH)
+
+
+def active_model(species, backend="native"):
+    """
+    Registry entry the detector getters should load, or None to use the
+    configured model paths (no registry, nothing active, other backend)
+    """
+    try:
+        entry = get_registry().active(species)
+    except RegistryError as e:
+        logger.error(f"Ignoring the model registry: {e}")
+        return None
+    if entry is not None and entry.get("backend", "native") != backend:
+        logger.warning(f"Active {species} version {entry['version']} is for the {entry['backend']} backend, "
+                       f"not {backend}; using the configured model")
+        return None
+    return entry
+
+
+# ==========================
+# Hot swapping (per process)
+# ==========================
+_swap_locks = {species: threading.Lock() for species in SUPPORTED_ARCHITECTURES}
+_swap_status = {}
+_standby = {}
+
+
+def _service(species):
+    """(module, build, swap) of a species' detector service"""
+    if species == "cat":
+        from app.services import cat_emotion_service as module
+        return module, module.build_cat_emotion_detector, module.swap_cat_emotion_detector
+    from app.services import dog_emotion_service as module
+    return module, module.build_dog_emotion_detector, module.swap_dog_emotion_detector
+
+
+def loaded_detector(species):
+    """The species' global detector if this process has loaded it (never triggers a load)"""
+    module, _, _ = _service(species)
+    return module._detector_instance
+
+
+def _set_status(species, **status):
+    _swap_status[species] = {**status, "at": time.time()}
+
+
+def swap_to(species, entry, batch_sizes=(1,), iterations=3):
+    """
+    Load, warm and swap in a registry version in this process
+
+    Blocks the calling thread only. Traffic keeps flowing to the current
+    detector until the new one is warm.
+
+    Returns:
+        bool: True when the version is now serving
+    """
+    from app.services.model_preload import warm_up
+
+    version = entry["version"]
+    with _swap_locks[species]:
+        current = loaded_detector(species)
+        if getattr(current, "version", None) == version:
+            return True
+
+        module, build, swap = _service(species)
+        standby = _standby.get(species)
+        try:
+            if getattr(standby, "version", None) == version:
+                # Rolling back to the model this process served before
+                detector = standby
+            else:
+                _set_status(species, state="loading", version=version)
+                started = time.perf_counter()
+                detector = build(model_path=entry["artifact_path"], classes=entry["classes"], version=version)
+                _set_status(species, state="warming_up", version=version)
+                warm_up(species, detector, batch_sizes, iterations)
+                logger.info(f"{species} version {version} loaded and warmed in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"❌ Could not load {species} version {version}, keeping {getattr(current, 'version', None)}: {e}")
+            logger.debug(format_exc())
+            _set_status(species, state="failed", version=version, error=str(e),
+                        serving=getattr(current, "version", None))
+            return False
+
+        previous = swap(detector)
+        if previous is not None and hasattr(previous, "version"):
+            _standby[species] = previous
+        _set_status(species, state="serving", version=version,
+                    replaced=getattr(previous, "version", None))
+        print(f"✅ {species} emotion model swapped to version {version} (pid {os.getpid()})")
+        return True
+
+
+class RegistryWatcher:
+    """Polls the registry file and swaps this process's detectors to the active versions"""
+
+    def __init__(self, app, poll_seconds=2.0):
+        self.app = app
+        self.poll_seconds = poll_seconds
+        self._pid = None
+        self._mtime = None
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._mtime = None
+        threading.Thread(target=self._loop, name="model-registry-watcher", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Model registry check failed: {e}")
+                logger.debug(format_exc())
+            time.sleep(self.poll_seconds)
+
+    def check(self):
+        registry = ModelRegistry(self.app.config.get("MODEL_REGISTRY_PATH") or DEFAULT_REGISTRY_PATH)
+        mtime = registry.mtime()
+        if mtime is None or mtime == self._mtime:
+            # Unchanged: a version that failed to load is not retried every poll
+            return
+        self._mtime = mtime
+
+        with self.app.app_context():
+            backend = self.app.config.get("INFERENCE_BACKEND", "native")
+            for species in SUPPORTED_ARCHITECTURES:
+                entry = active_model(species, backend)
+                current = loaded_detector(species)
+                if entry is None or current is None or getattr(current, "version", None) == entry["version"]:
+                    # Not loaded yet: the getter reads the registry when it loads
+                    continue
+                swap_to(
+                    species,
+                    entry,
+                    self.app.config.get("MODEL_WARMUP_BATCH_SIZES", (1,)),
+                    self.app.config.get("MODEL_WARMUP_ITERATIONS", 3),
+                )
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def start_registry_watcher(app):
+    """Start this process's registry watcher (if MODEL_REGISTRY_WATCH is on)"""
+    global _watcher
+    if not app.config.get("MODEL_REGISTRY_WATCH", True) or app.config.get("INFERENCE_SERVER_SOCKET"):
+        return None
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = RegistryWatcher(app, app.config.get("MODEL_REGISTRY_POLL_SECONDS", 2.0))
+    _watcher.start()
+    return _watcher
+
+
+def registry_status():
+    """Registry contents plus the versions this process is serving"""
+    serving = {}
+    for species in SUPPORTED_ARCHITECTURES:
+        detector = loaded_detector(species)
+        serving[species] = {
+            "version": getattr(detector, "version", None),
+            "standby": getattr(_standby.get(species), "version", None),
+            "swap": _swap_status.get(species),
+        }
+    return {"registry": get_registry().read()["species"], "process": {"pid": os.getpid(), "serving": serving}}
+
+
+# ==========================
+# Command line
+# ==========================
+def _check_version(species, entry):
+    """Load and warm a version in this process before activating it everywhere"""
+    from app.services.model_preload import warm_up
+
+    _, build, _ = _service(species)
+    detector = build(model_path=entry["artifact_path"], classes=entry["classes"], version=entry["version"])
+    warm_up(species, detector, (1,), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emotion model registry")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="Show registered and active versions")
+
+    register = subparsers.add_parser("register", help="Add a model version (inactive)")
+    register.add_argument("species", choices=sorted(SUPPORTED_ARCHITECTURES))
+    register.add_argument("version")
+    register.add_argument("artifact_path")
+    register.add_argument("--architecture", help="Default: the species' only supported architecture")
+    register.add_argument("--classes", help="Comma separated, in model output order")
+    register.add_argument("--backend", choices=BACKENDS, default="native")
+
+    activate = subparsers.add_parser("activate", help="Serve a version (running workers swap within seconds)")
+    activate.add_argument("species", choices=sorted(SUPPORTED_ARCHITECTURES))
+    activate.add_argument("version")
+    activate.add_argument("--no-check", action="store_true", help="Skip the test load before activating")
+
+    rollback = subparsers.add_parser("rollback", help="Re-activate the previously active version")
+    rollback.add_argument("species", choices=sorted(SUPPORTED_ARCHITECTURES))
+
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app(preload_models=False)
+    with app.app_context():
+        registry = get_registry()
+        try:
+            if args.command == "list":
+                print(json.dumps(registry.read(), indent=2))
+            elif args.command == "register":
+                default_classes = {"cat": "angry,happy,sad", "dog": "angry,happy,relaxed,sad"}[args.species]
+                entry = registry.register(
+                    args.species,
+                    args.version,
+                    args.artifact_path,
+                    args.architecture or SUPPORTED_ARCHITECTURES[args.species][0],
+                    (args.classes or default_classes).split(","),
+                    backend=args.backend,
+                )
+                print(f"✅ Registered {args.species} version {entry['version']}")
+            elif args.command == "activate":
+                state = registry.read()["species"].get(args.species) or {}
+                entry = state.get("versions", {}).get(args.version)
+                if entry is None:
+                    raise RegistryError(f"Unknown {args.species} version: {args.version}")
+                if not args.no_check:
+                    print(f"⏳ Test-loading {args.species} version {args.version} ...")
+                    _check_version(args.species, entry)
+                registry.activate(args.species, args.version)
+                print(f"✅ {args.species} version {args.version} is active")
+            elif args.command == "rollback":
+                entry = registry.rollback(args.species)
+                print(f"✅ {args.species} rolled back to version {entry['version']}")
+        except RegistryError as e:
+            parser.exit(1, f"❌ {e}\n")
+
+
+if __name__ == "__main__":
+    main()
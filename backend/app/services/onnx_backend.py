@@ -0,0 +1,84 @@
+"""
+ONNX Runtime Backend
+Runs the exported cat/dog emotion graphs (see export_onnx_models.py) so a
+deployment can serve both models from one runtime without importing
+torch or tensorflow.
+"""
+
+import os
+
+import numpy as np
+
+TRAINED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "trained")
+
+# Artifacts written by quantize_models.py next to the fp32 export
+MODEL_VARIANTS = ("fp32", "int8-dynamic", "int8-static")
+
+
+def model_variant_path(path, variant):
+    """
+    Path of a model variant stored next to the fp32 export
+    
+    e.g. ("trained/dog.onnx", "int8-static") -> "trained/dog.int8-static.onnx"
+    """
+    if not variant or variant == "fp32":
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{variant}{ext}"
+
+
+def resolve_model_path(name, configured_path=None, variant="fp32"):
+    """
+    Pick the .onnx file a detector should load
+    
+    Args:
+        name (str): Base file name in app/trained, e.g. "cat_resnet18"
+        configured_path (str): Explicit fp32 path from the config, if any
+        variant (str): One of MODEL_VARIANTS
+    """
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown ONNX model variant: {variant}")
+    path = configured_path or os.path.join(TRAINED_DIR, f"{name}.onnx")
+    return model_variant_path(path, variant)
+
+
+def softmax(logits):
+    """Row-wise softmax for a (N, C) array of logits"""
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class OnnxModel:
+    """Thin wrapper around an onnxruntime.InferenceSession with one input and one output"""
+    
+    def __init__(self, model_path, intra_op_threads=None, inter_op_threads=None):
+        """
+        Args:
+            model_path (str): Path to the .onnx file
+            intra_op_threads (int): Threads per operator (None = runtime default)
+            inter_op_threads (int): Operators run in parallel (None = runtime default)
+        """
+        import onnxruntime as ort
+        
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model not found at: {model_path}")
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = int(intra_op_threads)
+        if inter_op_threads:
+            options.inter_op_num_threads = int(inter_op_threads)
+        
+        self.model_path = model_path
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+    
+    def run(self, batch):
+        """Run a float32 batch and return the first output as a NumPy array"""
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run([self.output_name], {self.input_name: batch})[0]
@@ -0,0 +1,76 @@
+"""
+Parallel Image Decoding
+Shared thread pool used to decode/preprocess several uploads at once.
+PIL releases the GIL while decoding, so threads give a real speedup.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from app.services.thread_budget import decode_threads
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Sized by the CPU budget when one is set (see thread_budget.py)
+                workers = decode_threads() or min(8, os.cpu_count() or 1)
+                _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-decode")
+    return _pool
+
+
+def decode_in_parallel(decode_fn, items):
+    """
+    Run decode_fn over every item on the shared pool
+    
+    Args:
+        decode_fn: Callable taking one item (e.g. image bytes)
+        items (list): Inputs to decode
+        
+    Returns:
+        list: (value, error) tuples in input order; exactly one of the two is None
+    """
+    def safe(item):
+        try:
+            return decode_fn(item), None
+        except Exception as e:
+            return None, str(e)
+    
+    if len(items) <= 1:
+        return [safe(item) for item in items]
+    return list(_get_pool().map(safe, items))
+
+
+def decode_into_batch(species, load_fn, items, batch):
+    """
+    Decode items in parallel straight into the rows of a preallocated batch
+    
+    Args:
+        species (str): "cat" or "dog", selects resize and layout
+        load_fn: Callable turning one item into an RGB PIL image
+        items (list): Inputs to decode, len(items) == len(batch)
+        batch: float32 array from app.services.preprocessing.InputBufferPool
+        
+    Returns:
+        list: Error message per item, None where the row was written
+    """
+    from app.services.metrics import STAGE_SECONDS
+    from app.services.preprocessing import resize_image, write_input
+    
+    # load_fn times its own decode; this covers resize + layout
+    preprocess_seconds = STAGE_SECONDS.labels(species, "preprocess")
+    
+    def fill(index):
+        img = load_fn(items[index])
+        started = perf_counter()
+        write_input(species, resize_image(species, img), batch[index])
+        preprocess_seconds.observe(perf_counter() - started)
+    
+    return [error for _, error in decode_in_parallel(fill, list(range(len(items))))]
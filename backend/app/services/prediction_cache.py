@@ -0,0 +1,213 @@
+"""
+Prediction Cache
+Content-addressed cache in front of the emotion detectors. Mobile clients
+on flaky networks often upload the same photo several times; the cache
+key is a hash of the image bytes plus the model version, so a retry is
+answered without decoding or running the network again.
+
+Entries are bounded by count (LRU) and age (TTL). Concurrent requests for
+the same key are coalesced: only the first one runs inference, the rest
+wait for its result.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from app.services.model_bundle import is_bundle, read_manifest
+from app.services.settings import get_setting
+
+
+def model_fingerprint(path):
+    """Short content hash of a model artifact, used as its cache version"""
+    if is_bundle(path):
+        # Bundles carry the checksum of their weights in the manifest
+        return read_manifest(path)["sha256"][:16]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class PredictionCache:
+    """Thread-safe LRU + TTL cache with single-flight computation"""
+
+    def __init__(self, max_entries=2048, ttl_seconds=900):
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def lookup(self, key):
+        """Return the cached value for key, or None (counted as a miss)"""
+        with self._lock:
+            value = self._lookup_locked(key)
+            if value is None:
+                self.misses += 1
+            return value
+
+    def store(self, key, value):
+        """Cache a successful prediction"""
+        if not value.get("success"):
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value or run compute() exactly once for concurrent callers
+
+        Failed predictions ({"success": False}) are handed to every waiting
+        caller but never cached, so a retry gets a fresh attempt.
+        """
+        with self._lock:
+            value = self._lookup_locked(key)
+            if value is not None:
+                return value
+
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = compute()
+        except Exception as e:
+            value = {"success": False, "error": str(e)}
+
+        self.store(key, value)
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": ((self.hits + self.coalesced) / lookups) if lookups else 0.0,
+            }
+
+    def _lookup_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+
+def _content_digest(source):
+    """SHA-256 of raw bytes, or of a binary file-like object read in chunks and rewound"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(1 << 16), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+class CachedDetector:
+    """
+    Wraps a detector so predict_from_bytes / predict_batch_from_bytes go
+    through the cache. Everything else is passed straight through.
+    """
+
+    def __init__(self, species, detector, cache):
+        self.species = species
+        self.detector = detector
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.detector, name)
+
+    def cache_key(self, image_bytes):
+        version = getattr(self.detector, "model_version", None) or "unversioned"
+        return f"{self.species}:{version}:{_content_digest(image_bytes)}"
+
+    def predict_from_bytes(self, image_bytes):
+        return self.cache.get_or_compute(
+            self.cache_key(image_bytes),
+            lambda: self.detector.predict_from_bytes(image_bytes),
+        )
+
+    def predict_batch_from_bytes(self, images_bytes):
+        keys = [self.cache_key(data) for data in images_bytes]
+        results = [self.cache.lookup(key) for key in keys]
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            computed = self.detector.predict_batch_from_bytes([images_bytes[i] for i in missing])
+            for i, result in zip(missing, computed):
+                self.cache.store(keys[i], result)
+                results[i] = result
+
+        return results
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_prediction_cache(species):
+    """
+    Get or create the per-species cache
+
+    Sized by PREDICTION_CACHE_MAX_ENTRIES and PREDICTION_CACHE_TTL_SECONDS.
+    """
+    cache = _caches.get(species)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(species)
+            if cache is None:
+                cache = PredictionCache(
+                    max_entries=get_setting("PREDICTION_CACHE_MAX_ENTRIES", 2048),
+                    ttl_seconds=get_setting("PREDICTION_CACHE_TTL_SECONDS", 900),
+                )
+                _caches[species] = cache
+    return cache
+
+
+def cache_stats():
+    """Counters for every cache created so far, keyed by species"""
+    return {species: cache.stats() for species, cache in list(_caches.items())}
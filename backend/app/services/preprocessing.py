@@ -0,0 +1,179 @@
+"""
+Image Preprocessing
+Framework-free (NumPy + PIL) model input preparation, shared by the
+detectors and the out-of-process inference client so web workers can
+build model inputs without importing torch or tensorflow.
+
+Decoded pixels are written straight into pooled float32 batches
+(InputBufferPool), and the models are handed views of those buffers, so
+a request does not allocate a fresh input tensor.
+"""
+
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageOps
+
+INPUT_SIZE = 224
+
+# cat: torchvision ResNet18 -> Resize((224, 224)) + ToTensor(), NCHW in [0, 1]
+# dog: Keras EfficientNet-B0 -> PIL resize, NHWC raw 0-255 (rescaling is in the model)
+LAYOUTS = {
+    "cat": "NCHW",
+    "dog": "NHWC",
+}
+
+# What a model must have been trained on to be served by this pipeline,
+# checked when a version is added to the model registry
+PREPROCESSING_SPECS = {
+    "cat": {"input_size": INPUT_SIZE, "layout": "NCHW", "resize": "bilinear", "scale": "0-1"},
+    "dog": {"input_size": INPUT_SIZE, "layout": "NHWC", "resize": "bicubic", "scale": "0-255"},
+}
+
+
+def input_shape(species, batch_size):
+    """Shape of a float32 input batch for the given species' model"""
+    if LAYOUTS[species] == "NCHW":
+        return (batch_size, 3, INPUT_SIZE, INPUT_SIZE)
+    return (batch_size, INPUT_SIZE, INPUT_SIZE, 3)
+
+
+def load_image(source, min_size=INPUT_SIZE):
+    """
+    Open an upload as an upright RGB PIL image, decoding as little as possible
+    
+    JPEGs are decoded with DCT scaling (PIL draft mode) at the smallest
+    1/2, 1/4 or 1/8 scale that still covers min_size x min_size, so a
+    12 MP phone photo is never fully decoded just to be resized to 224.
+    The EXIF orientation is applied afterwards, on the small image.
+    
+    Args:
+        source: File path, raw bytes or a binary file-like object
+        min_size (int): Smallest edge the decoded image must keep
+        
+    Returns:
+        PIL.Image.Image: RGB image, at least min_size on both edges when
+        the original was
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    
+    img = Image.open(source)
+    # No-op for formats without reduced-resolution decoding
+    img.draft("RGB", (min_size, min_size))
+    img = ImageOps.exif_transpose(img)
+    
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img
+
+
+def resize_image(species, img):
+    """Resize an RGB PIL image exactly like the species' training pipeline did"""
+    if species == "cat":
+        # torchvision's Resize on PIL images is a bilinear PIL resize
+        return img.resize((INPUT_SIZE, INPUT_SIZE), Image.BILINEAR)
+    return img.resize((INPUT_SIZE, INPUT_SIZE))
+
+
+def write_input(species, img, out):
+    """
+    Write one resized RGB image into a preallocated float32 slot
+    
+    Args:
+        species (str): "cat" or "dog"
+        img: RGB PIL image already passed through resize_image
+        out: float32 array view of shape input_shape(species, 1)[1:]
+    """
+    pixels = np.asarray(img, dtype=np.uint8)
+    if LAYOUTS[species] == "NCHW":
+        np.divide(pixels.transpose(2, 0, 1), np.float32(255.0), out=out)
+    else:
+        out[...] = pixels
+
+
+# Batch sizes the pool keeps buffers for; a batch of n borrows the smallest one >= n
+POOL_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class InputBufferPool:
+    """
+    Reusable float32 input batches for one species' model
+    
+    Idle buffers are kept per bucket size up to max_idle_bytes in total,
+    so steady-state traffic reuses the same memory instead of allocating
+    (and page-faulting) a new input for every request.
+    """
+    
+    def __init__(self, species, max_idle_bytes=64 * 1024 * 1024):
+        self.species = species
+        self.max_idle_bytes = int(max_idle_bytes)
+        
+        self._idle = {size: [] for size in POOL_BUCKETS}
+        self._idle_bytes = 0
+        self._lock = threading.Lock()
+        
+        self.allocations = 0
+        self.reuses = 0
+    
+    @contextmanager
+    def batch(self, size):
+        """
+        Borrow a (size, ...) float32 batch for the duration of the block
+        
+        The yielded array is a view of a pooled buffer: the model must be
+        done with it (results copied out) before the block exits.
+        """
+        bucket = next((b for b in POOL_BUCKETS if b >= size), None)
+        if bucket is None:
+            with self._lock:
+                self.allocations += 1
+            yield np.empty(input_shape(self.species, size), dtype=np.float32)
+            return
+        
+        with self._lock:
+            idle = self._idle[bucket]
+            buffer = idle.pop() if idle else None
+            if buffer is None:
+                self.allocations += 1
+            else:
+                self._idle_bytes -= buffer.nbytes
+                self.reuses += 1
+        
+        if buffer is None:
+            buffer = np.empty(input_shape(self.species, bucket), dtype=np.float32)
+        
+        try:
+            yield buffer[:size]
+        finally:
+            with self._lock:
+                if self._idle_bytes + buffer.nbytes <= self.max_idle_bytes:
+                    self._idle[bucket].append(buffer)
+                    self._idle_bytes += buffer.nbytes
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "allocations": self.allocations,
+                "reuses": self.reuses,
+                "idle_buffers": sum(len(buffers) for buffers in self._idle.values()),
+                "idle_mb": self._idle_bytes / (1024 * 1024),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_input_pool(species):
+    """Get or create the process-wide input buffer pool for a species"""
+    pool = _pools.get(species)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(species)
+            if pool is None:
+                pool = InputBufferPool(species)
+                _pools[species] = pool
+    return pool
@@ -0,0 +1,348 @@
+"""
+Request Profiler
+On-demand statistical profiling of live requests.
+
+A profiled request registers its thread with a shared sampler thread,
+which reads the thread's Python stack every PROFILER_INTERVAL_MS via
+sys._current_frames(). The request itself runs untouched, so the cost is
+the sampler's stack walk (a few microseconds per sample) and only while a
+profiled request is in flight. With PROFILER_ENABLED off no hook is even
+installed.
+
+A request is profiled when:
+- it carries a valid X-Profile-Signature header (see sign_request), or
+- sampling is switched on (PROFILER_SAMPLE_RATE, or the admin toggle at
+  /api/admin/profiler, shared by all workers through PROFILER_DIR)
+
+Each profile is written to PROFILER_DIR as collapsed stacks, one line per
+unique stack ("frame;frame;frame count"), ready for flamegraph.pl or
+speedscope. The first two frames tag the route and the pipeline stage
+(decode, preprocess, forward, batch_wait, db, other) the sample was taken
+in. Only the newest PROFILER_MAX_FILES profiles are kept.
+
+Signing a request (the secret is PROFILER_SECRET):
+    python -m app.services.profiler sign /api/dog-emotion/detect
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from itertools import count
+
+logger = logging.getLogger("Profiler")
+
+SIGNATURE_HEADER = "X-Profile-Signature"
+TOGGLE_FILE = "sampling.json"
+
+# Innermost matching frame decides the stage a sample is attributed to
+STAGE_FUNCTIONS = {
+    "_decode": "decode",
+    "load_image": "decode",
+    "resize_image": "preprocess",
+    "write_input": "preprocess",
+    "_run_model": "forward",
+    "_run_buckets": "forward",
+    "_forward_torch": "forward",
+    "_forward_cascade": "forward",
+    "predict_preprocessed": "forward",
+    # Request threads of batched cat requests wait here while the scheduler
+    # thread runs the forward pass for the whole micro-batch
+    "predict_array": "batch_wait",
+}
+
+
+# ==========================
+# Signed header
+# ==========================
+def _signature(secret, path, expires):
+    message = f"{expires}:{path}".encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def sign_request(secret, path, ttl_seconds=300):
+    """Header value that profiles requests to `path` for the next ttl_seconds"""
+    expires = int(time.time()) + ttl_seconds
+    return f"{expires}:{_signature(secret, path, expires)}"
+
+
+def verify_signature(secret, path, value):
+    """True when `value` was made by sign_request for this path and has not expired"""
+    if not secret or not value:
+        return False
+    expires, _, signature = value.partition(":")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, _signature(secret, path, int(expires)))
+
+
+# ==========================
+# Sampler
+# ==========================
+class _Session:
+    def __init__(self, thread_id, route):
+        self.thread_id = thread_id
+        self.route = route
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+
+
+class Sampler:
+    """One thread per process that samples the stacks of registered request threads"""
+
+    def __init__(self, interval_seconds=0.005):
+        self.interval = interval_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start_session(self, route):
+        session = _Session(threading.get_ident(), route)
+        with self._lock:
+            self._sessions[session.thread_id] = session
+            self._active.set()
+            if self._pid != os.getpid():
+                # First profile in this process (or a forked worker)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, name="profiler-sampler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop_session(self, session):
+        with self._lock:
+            self._sessions.pop(session.thread_id, None)
+            if not self._sessions:
+                self._active.clear()
+        return session
+
+    def _loop(self):
+        own_ident = threading.get_ident()
+        while True:
+            self._active.wait()
+            with self._lock:
+                sessions = list(self._sessions.values())
+            frames = sys._current_frames()
+            for session in sessions:
+                frame = frames.get(session.thread_id)
+                if frame is not None and session.thread_id != own_ident:
+                    session.stacks[_collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+def _frame_label(code):
+    path = code.co_filename
+    parts = path.replace("\\", "/").rsplit("/", 2)
+    short = "/".join(parts[-2:]) if len(parts) > 1 else path
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def _collapse(frame):
+    """Root-first tuple of frame labels, led by the stage the leaf is in"""
+    labels = []
+    stage = None
+    while frame is not None:
+        code = frame.f_code
+        if stage is None:
+            stage = STAGE_FUNCTIONS.get(code.co_name)
+            if stage is None and "sqlalchemy" in code.co_filename:
+                stage = "db"
+        labels.append(_frame_label(code))
+        frame = frame.f_back
+    labels.append(f"stage={stage or 'other'}")
+    labels.reverse()
+    return tuple(labels)
+
+
+# ==========================
+# Output
+# ==========================
+_profile_ids = count(1)
+
+
+def write_profile(directory, session, max_files=500):
+    """
+    Write a session's samples as collapsed stacks and rotate old profiles
+
+    Returns:
+        str: File name of the profile (None when no sample was taken)
+    """
+    if not session.stacks:
+        return None
+    os.makedirs(directory, exist_ok=True)
+
+    route_slug = re.sub(r"[^A-Za-z0-9]+", "_", session.route).strip("_") or "root"
+    duration_ms = (time.perf_counter() - session.started) * 1000.0
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_profile_ids)}-{route_slug}.collapsed"
+    route_frame = f"route={session.route}".replace(";", ",")
+
+    lines = [
+        f"{route_frame};{';'.join(stack)} {samples}"
+        for stack, samples in session.stacks.most_common()
+    ]
+    path = os.path.join(directory, name)
+    with open(f"{path}.tmp", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(f"{path}.tmp", path)
+    logger.info(f"Profile of {session.route} ({duration_ms:.0f} ms, {sum(session.stacks.values())} samples): {name}")
+
+    _rotate(directory, max_files)
+    return name
+
+
+def _rotate(directory, max_files):
+    profiles = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".collapsed")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in profiles[:max(len(profiles) - max_files, 0)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def list_profiles(directory, limit=50):
+    """Newest profiles first, as {"name", "bytes", "modified"} dicts"""
+    if not os.path.isdir(directory):
+        return []
+    profiles = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".collapsed")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    return [
+        {"name": entry.name, "bytes": entry.stat().st_size, "modified": entry.stat().st_mtime}
+        for entry in profiles[:limit]
+    ]
+
+
+# ==========================
+# Sampling toggle (shared by all workers)
+# ==========================
+class SamplingToggle:
+    """Sample rate switched on at runtime, stored in PROFILER_DIR and re-read once a second"""
+
+    def __init__(self, directory, default_rate=0.0):
+        self.path = os.path.join(directory, TOGGLE_FILE)
+        self.default_rate = default_rate
+        self._rate = default_rate
+        self._checked_at = 0.0
+
+    def rate(self):
+        now = time.monotonic()
+        if now - self._checked_at >= 1.0:
+            self._checked_at = now
+            self._rate = self.read().get("sample_rate", self.default_rate)
+        return self._rate
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {"sample_rate": self.default_rate, "until": None}
+        if state.get("until") is not None and state["until"] < time.time():
+            return {"sample_rate": self.default_rate, "until": None}
+        return state
+
+    def set(self, sample_rate, duration_seconds):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        state = {"sample_rate": sample_rate, "until": time.time() + duration_seconds}
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{self.path}.tmp", self.path)
+        self._checked_at = 0.0
+        return state
+
+
+# ==========================
+# Flask integration
+# ==========================
+_sampler = None
+_toggle = None
+
+
+def get_sampling_toggle():
+    return _toggle
+
+
+def init_profiler(app):
+    """
+    Install the request hooks and the admin blueprint
+
+    Nothing is installed unless PROFILER_ENABLED, so a disabled profiler
+    costs nothing per request.
+    """
+    global _sampler, _toggle
+    if not app.config.get("PROFILER_ENABLED"):
+        return
+
+    from flask import g, request
+
+    directory = app.config["PROFILER_DIR"]
+    secret = app.config.get("PROFILER_SECRET")
+    max_files = app.config.get("PROFILER_MAX_FILES", 500)
+    _sampler = Sampler(app.config.get("PROFILER_INTERVAL_MS", 5) / 1000.0)
+    _toggle = SamplingToggle(directory, app.config.get("PROFILER_SAMPLE_RATE", 0.0))
+
+    @app.before_request
+    def _start_profile():
+        if request.blueprint == "profiler":
+            return None
+        signed = request.headers.get(SIGNATURE_HEADER)
+        if signed is not None:
+            if not verify_signature(secret, request.path, signed):
+                return None
+        else:
+            rate = _toggle.rate()
+            if not rate or random.random() >= rate:
+                return None
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        g.profile_session = _sampler.start_session(route)
+        return None
+
+    @app.after_request
+    def _finish_profile(response):
+        session = g.pop("profile_session", None)
+        if session is not None:
+            _sampler.stop_session(session)
+            try:
+                name = write_profile(directory, session, max_files)
+            except OSError as e:
+                logger.warning(f"Could not write profile: {e}")
+                name = None
+            if name:
+                response.headers["X-Profile-Id"] = name
+        return response
+
+    from app.routes.profiler_routes import profiler_bp
+    app.register_blueprint(profiler_bp, url_prefix="/api/admin/profiler")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request profiler tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sign = subparsers.add_parser("sign", help=f"Print an {SIGNATURE_HEADER} header value for a path")
+    sign.add_argument("path", help="Request path, e.g. /api/dog-emotion/detect")
+    sign.add_argument("--ttl", type=int, default=300, help="Seconds the signature stays valid")
+    args = parser.parse_args()
+
+    secret = os.environ.get("PROFILER_SECRET")
+    if not secret:
+        parser.error("PROFILER_SECRET is not set")
+    print(f"{SIGNATURE_HEADER}: {sign_request(secret, args.path, args.ttl)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""
+Service Settings
+Reads tuning knobs from the Flask config when an app context is active
+"""
+
+from flask import current_app, has_app_context
+
+
+def get_setting(name, default=None):
+    """
+    Look up a config value, falling back to a default outside of Flask
+    
+    Args:
+        name (str): Config key, e.g. "CAT_BATCH_MAX_SIZE"
+        default: Value used when the key is unset or no app is active
+        
+    Returns:
+        The configured value or the default
+    """
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return default
@@ -0,0 +1,109 @@
+"""
+Static Files
+Serving of uploaded images with HTTP caching, for the /uploads/... routes.
+
+Uploaded files never change once written (new uploads get new names), so
+every response carries:
+- a strong ETag made from the file's size and mtime (no hashing, one stat)
+- Cache-Control: public, max-age=UPLOAD_CACHE_MAX_AGE, immutable
+
+A request whose If-None-Match matches is answered 304 before the file is
+opened. Range and If-Range requests get 206 partial content.
+
+With UPLOAD_SENDFILE set, the worker only sends headers and the front
+proxy streams the file:
+- "x-accel" (nginx): X-Accel-Redirect: UPLOAD_ACCEL_PREFIX/<path under app/uploads>
+- "x-sendfile" (Apache mod_xsendfile, lighttpd): X-Sendfile: <absolute path>
+"""
+
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import abort, current_app, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+
+def file_etag(stat_result):
+    """Strong validator of an immutable file: size + mtime in nanoseconds"""
+    return f"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"
+
+
+def send_upload(folder, filename, immutable=True):
+    """
+    Response for one file of an upload folder
+
+    Args:
+        folder (str): Upload folder the file must be inside
+        filename (str): Path relative to folder (from the URL)
+        immutable (bool): The URL always maps to the same bytes. False for
+            responses that may change under the same URL (e.g. an image
+            served in place of a variant that is not made yet)
+
+    Returns:
+        flask.Response: 200, 206 or 304 (404 when there is no such file)
+    """
+    path = safe_join(folder, filename)
+    # Dot-prefixed entries (the upload store's .tmp) are never served
+    if path is None or any(part.startswith(".") for part in filename.split("/")):
+        abort(404)
+    try:
+        stat_result = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        abort(404)
+    if not os.path.isfile(path):
+        abort(404)
+
+    etag = file_etag(stat_result)
+    max_age = current_app.config.get("UPLOAD_CACHE_MAX_AGE", 31536000) if immutable else 0
+
+    # Revalidation of a cached copy: answer without opening the file
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        return _cache_headers(response, etag, max_age, immutable)
+
+    mode = current_app.config.get("UPLOAD_SENDFILE")
+    if mode == "x-accel":
+        response = _accel_redirect(path, stat_result)
+        if response is not None:
+            response = _cache_headers(response, etag, max_age, immutable)
+            return response.make_conditional(request)
+
+    response = send_file(
+        path,
+        request.environ,
+        etag=etag,
+        last_modified=stat_result.st_mtime,
+        max_age=max_age,
+        use_x_sendfile=mode == "x-sendfile",
+        response_class=current_app.response_class,
+        _root_path=current_app.root_path,
+    )
+    return _cache_headers(response, etag, max_age, immutable)
+
+
+def _accel_redirect(path, stat_result):
+    """Header-only response that makes nginx send the file (None outside app/uploads)"""
+    uploads_root = os.path.join(current_app.root_path, "uploads")
+    relative = os.path.relpath(path, uploads_root)
+    if relative.startswith(os.pardir):
+        return None
+
+    prefix = current_app.config.get("UPLOAD_ACCEL_PREFIX", "/protected-uploads").rstrip("/")
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    response = current_app.response_class(mimetype=mimetype)
+    response.headers["X-Accel-Redirect"] = f"{prefix}/{quote(relative.replace(os.sep, '/'))}"
+    response.last_modified = stat_result.st_mtime
+    return response
+
+
+def _cache_headers(response, etag, max_age, immutable):
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if immutable:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
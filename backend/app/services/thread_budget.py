@@ -0,0 +1,197 @@
+"""
+CPU Thread Budget
+Splits the cores of a worker process between the PyTorch (cat) and
+TensorFlow (dog) thread pools and the request threads that call them.
+
+Left alone, torch and TensorFlow each size their intra-op and inter-op
+pools to every core of the machine, every prefork worker does the same,
+and each request thread of the threaded server can start its own forward
+pass on top. Mixed cat + dog traffic then runs many times more compute
+threads than there are cores and tail latency explodes.
+
+The budget is planned once in create_app (from CPU_BUDGET_* config):
+
+    cores per worker = cores / workers
+    cat / dog cores  = cores per worker * per-detector share
+    intra-op threads = detector cores / concurrent forward passes
+    inter-op threads = 1 (the models are single chains of ops)
+
+and applied when each framework is imported. inference_slot() bounds the
+number of request threads inside one detector's forward pass at the same
+time; the rest wait instead of competing for the same cores.
+"""
+
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("ThreadBudget")
+
+_plan = None
+_slots = {}
+_lock = threading.Lock()
+
+
+def available_cores():
+    """Cores this process may run on (respects taskset / container cpusets)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def plan_thread_budget(cores=None, workers=1, shares=None, inference_concurrency=1):
+    """
+    Work out the thread counts for one worker process
+
+    Args:
+        cores (int): Cores shared by all workers (default: available_cores())
+        workers (int): Worker processes running on those cores
+        shares (dict): species -> relative share of a worker's cores
+        inference_concurrency (int): Forward passes allowed at once per detector
+
+    Returns:
+        dict: The plan, see thread_budget_status()
+    """
+    cores = int(cores or available_cores())
+    workers = max(1, int(workers or 1))
+    shares = shares or {"cat": 0.5, "dog": 0.5}
+    total_share = float(sum(shares.values())) or 1.0
+    cores_per_worker = max(1, cores // workers)
+
+    species_plan = {}
+    for species, share in shares.items():
+        species_cores = max(1, int(round(cores_per_worker * share / total_share)))
+        concurrency = max(1, min(int(inference_concurrency), species_cores))
+        species_plan[species] = {
+            "share": share / total_share,
+            "cores": species_cores,
+            "concurrency": concurrency,
+            "intra_op_threads": max(1, species_cores // concurrency),
+            "inter_op_threads": 1,
+        }
+
+    return {
+        "cores": cores,
+        "workers": workers,
+        "cores_per_worker": cores_per_worker,
+        "decode_threads": cores_per_worker,
+        "species": species_plan,
+    }
+
+
+def set_thread_budget(plan):
+    """
+    Install a plan (None removes it) and apply it to any framework that is
+    already imported; the detectors apply it to the others on import.
+    """
+    global _plan
+    with _lock:
+        _plan = plan
+        _slots.clear()
+        if plan:
+            for species, entry in plan["species"].items():
+                _slots[species] = threading.BoundedSemaphore(entry["concurrency"])
+
+    if plan:
+        if "torch" in sys.modules:
+            apply_torch_threads(sys.modules["torch"])
+        if "tensorflow" in sys.modules:
+            apply_tensorflow_threads(sys.modules["tensorflow"])
+        logger.info(
+            f"CPU budget: {plan['cores_per_worker']} of {plan['cores']} cores per worker, "
+            + ", ".join(f"{s} {e['intra_op_threads']}x{e['concurrency']}" for s, e in plan["species"].items())
+        )
+
+
+def configure_thread_budget(app):
+    """Plan the budget from the app's CPU_BUDGET_* config and install it"""
+    if not app.config.get("CPU_BUDGET_ENABLED", True):
+        set_thread_budget(None)
+        return None
+
+    plan = plan_thread_budget(
+        cores=app.config.get("CPU_BUDGET_CORES"),
+        workers=app.config.get("CPU_BUDGET_WORKERS", 1),
+        shares=app.config.get("CPU_BUDGET_SHARES"),
+        inference_concurrency=app.config.get("CPU_BUDGET_INFERENCE_CONCURRENCY", 1),
+    )
+    set_thread_budget(plan)
+    return plan
+
+
+def species_threads(species):
+    """(intra_op, inter_op) thread counts for a detector, or (None, None) without a budget"""
+    plan = _plan
+    if not plan or species not in plan["species"]:
+        return None, None
+    entry = plan["species"][species]
+    return entry["intra_op_threads"], entry["inter_op_threads"]
+
+
+def decode_threads():
+    """Size of the shared image decode pool, or None without a budget"""
+    plan = _plan
+    return plan["decode_threads"] if plan else None
+
+
+def apply_torch_threads(torch):
+    """Size torch's CPU thread pools for the cat detector"""
+    intra, inter = species_threads("cat")
+    if intra is None:
+        return
+    torch.set_num_threads(intra)
+    try:
+        # Only allowed once per process, before any inter-op work has started
+        if torch.get_num_interop_threads() != inter:
+            torch.set_num_interop_threads(inter)
+    except RuntimeError as e:
+        logger.warning(f"Could not set torch inter-op threads: {e}")
+
+
+def apply_tensorflow_threads(tf):
+    """Size TensorFlow's thread pools for the dog detector"""
+    intra, inter = species_threads("dog")
+    if intra is None:
+        return
+    try:
+        # Must happen before TensorFlow creates its runtime context
+        tf.config.threading.set_intra_op_parallelism_threads(intra)
+        tf.config.threading.set_inter_op_parallelism_threads(inter)
+    except RuntimeError as e:
+        logger.warning(f"Could not size TensorFlow thread pools (already initialised): {e}")
+
+
+@contextmanager
+def inference_slot(species):
+    """Hold one of the detector's concurrent forward-pass slots (no-op without a budget)"""
+    slot = _slots.get(species)
+    if slot is None:
+        yield
+        return
+    with slot:
+        yield
+
+
+def thread_budget_status():
+    """The active plan, plus the thread counts each framework actually reports"""
+    plan = _plan
+    if not plan:
+        return {"enabled": False}
+
+    status = {"enabled": True, **plan}
+    if "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        status["torch_threads"] = {
+            "intra_op": torch.get_num_threads(),
+            "inter_op": torch.get_num_interop_threads(),
+        }
+    if "tensorflow" in sys.modules:
+        tf = sys.modules["tensorflow"]
+        status["tensorflow_threads"] = {
+            "intra_op": tf.config.threading.get_intra_op_parallelism_threads(),
+            "inter_op": tf.config.threading.get_inter_op_parallelism_threads(),
+        }
+    return status
@@ -0,0 +1,342 @@
+"""
+Upload Store
+Content-addressed storage for uploaded files, used by every upload route.
+
+A file is named by the SHA-256 of its bytes and sharded two levels deep:
+
+    <folder>/ab/cd/abcd1234....jpg
+
+so no directory grows past a few hundred entries, and uploading the same
+bytes twice stores them once. Every stored name has a reference count in a
+SQLite index (UPLOAD_STORE_INDEX, shared by all worker processes): put()
+adds a reference, release() drops one and deletes the file with the last.
+
+Writes are atomic: the upload is streamed (and hashed) into a temporary file
+under <folder>/.tmp on the same filesystem, fsynced, then renamed into place.
+A reader sees either no file or the complete one. The counter update and the
+rename/unlink happen inside one BEGIN IMMEDIATE transaction, so a put racing
+a release of the same content cannot lose the file.
+
+Names from before the store (flat "<uuid>.<ext>") keep working: they have no
+index row and count as a single reference.
+
+put_async() hands the write to a small background pool (UPLOAD_WRITER_WORKERS),
+so a route that already holds the bytes can run inference while they are
+written and fsynced.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from werkzeug.security import safe_join
+
+from app.services.settings import get_setting
+
+CHUNK_SIZE = 1024 * 1024
+TEMP_DIR = ".tmp"
+
+_NAME_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_refs (
+    store TEXT NOT NULL,
+    name TEXT NOT NULL,
+    refs INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (store, name)
+);
+"""
+
+
+def content_name(digest, extension):
+    """Sharded relative name of a file with the given SHA-256 hex digest"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+
+def is_content_name(name):
+    return bool(_NAME_RE.match(name or ""))
+
+
+class UploadStore:
+    """One upload folder, with its reference counts kept in a shared SQLite index"""
+
+    def __init__(self, root, index_path):
+        self.root = root
+        self.index_path = index_path
+        # Counters are keyed by the folder name, so moving app/ keeps them valid
+        self.key = os.path.basename(os.path.normpath(root))
+        self.temp_dir = os.path.join(root, TEMP_DIR)
+        os.makedirs(self.temp_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # Same pattern as the job store: a connection per call, autocommit mode
+        conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def path(self, name):
+        """Absolute path of a stored name (None for names outside the folder)"""
+        return safe_join(self.root, name)
+
+    def put(self, source, extension):
+        """
+        Store a file and add a reference to it
+
+        Args:
+            source: Binary file-like object (read from its current position) or bytes
+            extension (str): File extension without the dot, e.g. "jpg"
+
+        Returns:
+            str: Stored name relative to the folder ("ab/cd/<sha256>.<ext>")
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_dir, suffix=".part")
+        try:
+            digest, size = _write_hashed(fd, source)
+            name = content_name(digest, extension)
+            self._commit(name, temp_path, size)
+        finally:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass  # renamed into place
+        return name
+
+    def put_async(self, data, extension):
+        """
+        put() on the background writer pool
+
+        Args:
+            data (bytes): The whole file (a stream could be consumed by the
+                caller while the writer reads it)
+            extension (str): File extension without the dot
+
+        Returns:
+            concurrent.futures.Future: Resolves to the stored name
+        """
+        return get_upload_writer().submit(self.put, data, extension)
+
+    def _commit(self, name, temp_path, size):
+        final_path = self.path(name)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                updated = conn.execute(
+                    "UPDATE upload_refs SET refs = refs + 1 WHERE store = ? AND name = ?",
+                    (self.key, name),
+                ).rowcount
+                if not updated:
+                    conn.execute(
+                        "INSERT INTO upload_refs (store, name, refs, size) VALUES (?, ?, 1, ?)",
+                        (self.key, name, size),
+                    )
+                if not os.path.exists(final_path):
+                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                    os.chmod(temp_path, 0o644)  # mkstemp creates 0600; nginx serves these
+                    os.replace(temp_path, final_path)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def release(self, name, cleanup=None):
+        """
+        Drop one reference to a stored name
+
+        Args:
+            name (str): Stored name, as returned by put()
+            cleanup (callable): Called with the file's path after the last
+                reference deleted it, to remove derived files next to it
+                (e.g. image_variants.delete_variants)
+
+        Returns:
+            bool: True when this was the last reference and the file was deleted
+        """
+        path = self.path(name)
+        if path is None:
+            return False
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT refs FROM upload_refs WHERE store = ? AND name = ?",
+                    (self.key, name),
+                ).fetchone()
+                if row is not None and row[0] > 1:
+                    conn.execute(
+                        "UPDATE upload_refs SET refs = refs - 1 WHERE store = ? AND name = ?",
+                        (self.key, name),
+                    )
+                    conn.execute("COMMIT")
+                    return False
+                if row is not None:
+                    conn.execute("DELETE FROM upload_refs WHERE store = ? AND name = ?", (self.key, name))
+                try:
+                    os.remove(path)
+                    removed = True
+                except FileNotFoundError:
+                    removed = False
+                if cleanup is not None:
+                    cleanup(path)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        _prune_empty_dirs(os.path.dirname(path), self.root)
+        return removed
+
+    def refs(self, name):
+        """Reference count of a stored name (0 when unknown)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT refs FROM upload_refs WHERE store = ? AND name = ?",
+                (self.key, name),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def stats(self):
+        """{"files", "references", "bytes"} for this folder"""
+        with self._connect() as conn:
+            files, references, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(refs), 0), COALESCE(SUM(size), 0) "
+                "FROM upload_refs WHERE store = ?",
+                (self.key,),
+            ).fetchone()
+        return {"files": files, "references": references, "bytes": size}
+
+
+def _write_hashed(fd, source):
+    """Copy source into an open temporary file while hashing it, then fsync"""
+    sha = hashlib.sha256()
+    size = 0
+    with os.fdopen(fd, "wb") as out:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            sha.update(source)
+            out.write(source)
+            size = len(source)
+        else:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        out.flush()
+        os.fsync(out.fileno())
+    return sha.hexdigest(), size
+
+
+def _prune_empty_dirs(directory, root):
+    """Remove emptied shard directories up to (not including) root"""
+    root = os.path.normpath(root)
+    while os.path.normpath(directory) != root and directory.startswith(root):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            return  # not empty, or already gone
+        directory = os.path.dirname(directory)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+_writer = None
+_writer_pid = None
+
+
+def get_upload_store(root):
+    """Process-wide store for one upload folder"""
+    store = _stores.get(root)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(root)
+            if store is None:
+                index_path = get_setting("UPLOAD_STORE_INDEX") or os.path.join(
+                    os.path.dirname(os.path.normpath(root)), ".upload_index.sqlite3"
+                )
+                store = UploadStore(root, index_path)
+                _stores[root] = store
+    return store
+
+
+def get_upload_writer():
+    """Process-wide pool for put_async (a forked worker gets its own)"""
+    global _writer, _writer_pid
+    if _writer is None or _writer_pid != os.getpid():
+        with _stores_lock:
+            if _writer is None or _writer_pid != os.getpid():
+                _writer = ThreadPoolExecutor(
+                    max_workers=get_setting("UPLOAD_WRITER_WORKERS", 2),
+                    thread_name_prefix="upload-writer",
+                )
+                _writer_pid = os.getpid()
+    return _writer
+
+
+def migrate_folder(store, model, column="image_url"):
+    """
+    Move the flat files referenced by one model's rows into the store
+
+    Returns:
+        int: Rows whose file was moved
+    """
+    from app import db
+    from app.services.image_variants import delete_variants
+
+    moved = 0
+    for row in model.query.filter(getattr(model, column).isnot(None)).all():
+        name = getattr(row, column)
+        if is_content_name(name):
+            continue
+        path = store.path(name)
+        if path is None or not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            new_name = store.put(f, name.rsplit(".", 1)[-1].lower())
+        setattr(row, column, new_name)
+        db.session.commit()
+        store.release(name, cleanup=delete_variants)
+        moved += 1
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload store tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("migrate", help="Move flat pet and vet photos into the content-addressed store")
+    subparsers.add_parser("stats", help="Print file, reference and byte counts per upload folder")
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.models import Pet, Veterinarian
+    app = create_app(preload_models=False)
+    with app.app_context():
+        folders = {
+            "UPLOAD_FOLDER": Pet,
+            "UPLOAD_FOLDER_VETS": Veterinarian,
+            "UPLOAD_FOLDER_CAT_EMOTIONS": None,
+            "UPLOAD_FOLDER_DOG_EMOTIONS": None,
+        }
+        for key, model in folders.items():
+            store = get_upload_store(app.config[key])
+            if args.command == "stats":
+                print(f"📦 {store.key}: {store.stats()}")
+            elif model is not None:
+                print(f"✅ {store.key}: moved {migrate_folder(store, model)} files")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Upload Handling
+Streaming, bounded-memory handling of multipart file uploads, shared by
+the pet, veterinarian and emotion routes.
+
+Werkzeug's form parser writes each uploaded file into an UploadSpool
+chunk by chunk. The spool:
+- sniffs the file's magic bytes from the first chunk and stops keeping
+  data for anything that is not a supported image or clip format
+- stops keeping data once a file passes its size cap
+  (UPLOAD_MAX_IMAGE_BYTES or UPLOAD_MAX_CLIP_BYTES, by sniffed format)
+- keeps at most UPLOAD_SPOOL_BYTES of a request's files in memory and
+  rolls the rest over to temporary files on disk
+
+MAX_CONTENT_LENGTH caps the whole request body. Routes call check_upload,
+which turns the spool's verdict into an UploadError and checks image
+headers (dimensions) without decoding pixels. The spool itself is then
+handed to the decoder as a file-like object, so an upload is never read
+into one bytes object on the way to the model.
+"""
+
+from tempfile import SpooledTemporaryFile
+
+from flask import Request, current_app, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+MB = 1024 * 1024
+
+# Bytes needed to tell every supported format apart
+SNIFF_BYTES = 16
+
+IMAGE_FORMATS = {"jpeg", "png", "gif", "webp", "bmp"}
+PROFILE_IMAGE_FORMATS = {"jpeg", "png"}
+ANIMATION_FORMATS = {"gif", "webp", "png"}
+VIDEO_FORMATS = {"mp4", "matroska", "avi"}
+CLIP_FORMATS = ANIMATION_FORMATS | VIDEO_FORMATS
+
+# File extension used when an upload is stored under a generated name
+FORMAT_EXTENSIONS = {
+    "jpeg": "jpg",
+    "png": "png",
+    "gif": "gif",
+    "webp": "webp",
+    "bmp": "bmp",
+    "mp4": "mp4",
+    "matroska": "mkv",
+    "avi": "avi",
+}
+
+
+def sniff_format(head):
+    """
+    Identify an upload from its first SNIFF_BYTES bytes
+
+    Returns:
+        str: One of FORMAT_EXTENSIONS' keys, or None for anything else
+    """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "avi"
+    if head[:2] == b"BM":
+        return "bmp"
+    if head[4:8] == b"ftyp":
+        # ISO base media: mp4, mov, m4v
+        return "mp4"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        # EBML: mkv, webm
+        return "matroska"
+    return None
+
+
+class UploadError(ValueError):
+    """An upload was rejected; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# ==========================
+# Spooling
+# ==========================
+class _MemoryBudget:
+    """In-memory bytes left for one request's uploads"""
+
+    def __init__(self, limit):
+        self.remaining = limit
+
+
+class UploadSpool:
+    """
+    Writable/readable file for one uploaded file, see the module docstring
+
+    After parsing, `format` is the sniffed format (None if unsupported),
+    `size` the bytes received and `error` None, "unsupported" or
+    "too_large". Reads, seeks etc. go to the underlying spooled file.
+    """
+
+    def __init__(self, budget, image_limit, clip_limit):
+        # max_size=0: rollover is driven by the request-wide budget below
+        self._file = SpooledTemporaryFile(max_size=0, mode="w+b")
+        self._budget = budget
+        self._in_memory = 0
+        self._head = b""
+        self._limits = (image_limit, clip_limit)
+        self.format = None
+        self.size = 0
+        self.error = None
+        self.sniffed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.error is not None:
+            # Drain the rest of the part without keeping it
+            return len(data)
+
+        if not self.sniffed:
+            self._head += bytes(data[:SNIFF_BYTES - len(self._head)])
+            if len(self._head) >= SNIFF_BYTES:
+                self._sniff()
+                if self.error is not None:
+                    return len(data)
+
+        if self.size > self.limit:
+            self._reject("too_large")
+            return len(data)
+
+        self._file.write(data)
+        if not self._file._rolled:
+            self._in_memory += len(data)
+            self._budget.remaining -= len(data)
+            if self._budget.remaining < 0:
+                self._file.rollover()
+                self._budget.remaining += self._in_memory
+                self._in_memory = 0
+        return len(data)
+
+    def finish(self):
+        """Settle the verdict for files shorter than SNIFF_BYTES"""
+        if not self.sniffed:
+            self._sniff()
+        return self
+
+    @property
+    def limit(self):
+        image_limit, clip_limit = self._limits
+        if not self.sniffed:
+            return max(image_limit, clip_limit)
+        return clip_limit if self.format in VIDEO_FORMATS else image_limit
+
+    def _sniff(self):
+        self.sniffed = True
+        self.format = sniff_format(self._head)
+        if self.format is None:
+            self._reject("unsupported")
+
+    def _reject(self, error):
+        self.error = error
+        self._file.seek(0)
+        self._file.truncate()
+        if self._in_memory:
+            self._budget.remaining += self._in_memory
+            self._in_memory = 0
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """Flask request whose file parts are written into UploadSpools"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        budget = getattr(self, "_upload_budget", None)
+        if budget is None:
+            budget = self._upload_budget = _MemoryBudget(config.get("UPLOAD_SPOOL_BYTES", MB))
+        return UploadSpool(
+            budget,
+            config.get("UPLOAD_MAX_IMAGE_BYTES", 16 * MB),
+            config.get("UPLOAD_MAX_CLIP_BYTES", 64 * MB),
+        )
+
+
+# ==========================
+# Validation
+# ==========================
+def check_upload(file, formats):
+    """
+    Validate one uploaded file before it is decoded or stored
+
+    Args:
+        file: werkzeug FileStorage from request.files
+        formats (set): Accepted sniffed formats, e.g. IMAGE_FORMATS
+
+    Returns:
+        str: The sniffed format; file.stream is rewound and ready to read
+
+    Raises:
+        UploadError: Missing, unsupported, oversized or malformed upload
+    """
+    if file is None or not file.filename:
+        raise UploadError("No file selected")
+
+    stream = file.stream
+    if isinstance(stream, UploadSpool):
+        stream.finish()
+        if stream.error == "too_large":
+            raise UploadError(f"File too large, at most {stream.limit // MB} MB", 413)
+        upload_format = stream.format
+    else:
+        upload_format = sniff_format(stream.read(SNIFF_BYTES))
+    stream.seek(0)
+
+    if upload_format not in formats:
+        raise UploadError(f"Invalid file type. Allowed types: {', '.join(sorted(formats))}")
+
+    if upload_format in IMAGE_FORMATS:
+        _check_image_header(stream)
+    return upload_format
+
+
+def _check_image_header(stream):
+    """Read the image header only: reject corrupt headers and decompression bombs"""
+    from PIL import Image
+
+    max_pixels = current_app.config.get("UPLOAD_MAX_IMAGE_PIXELS", 40_000_000)
+    try:
+        with Image.open(stream) as img:
+            width, height = img.size
+    except Exception as e:
+        raise UploadError(f"Invalid image: {e}")
+    finally:
+        stream.seek(0)
+
+    if width * height > max_pixels:
+        raise UploadError(f"Image too large, at most {max_pixels // 1_000_000} megapixels", 413)
+
+
+# ==========================
+# Flask integration
+# ==========================
+def init_uploads(app):
+    """Install the spooling request class and answer oversized bodies with 413"""
+    app.request_class = UploadRequest
+
+    @app.before_request
+    def _parse_uploads():
+        # Parse multipart bodies up front: an oversized body is then a 413
+        # here instead of an exception inside a route's try/except
+        if request.mimetype == "multipart/form-data":
+            request.files
+        return None
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def _request_too_large(e):
+        limit = app.config.get("MAX_CONTENT_LENGTH")
+        message = f"Upload too large, at most {limit // MB} MB per request" if limit else "Upload too large"
+        return jsonify({"success": False, "error": message}), 413
@@ -0,0 +1,93 @@
+"""
+Benchmark: per-request vs micro-batched cat emotion inference
+
+Fires the same closed-loop load (N client threads, each sending one image
+after another) at CatEmotionDetector.predict_from_bytes directly and at
+CatInferenceScheduler, then prints throughput and p50/p95/p99 latency.
+
+Usage (from backend/):
+    python -m benchmarks.cat_batching --clients 16 --requests 40
+"""
+
+import argparse
+import logging
+import threading
+import time
+
+from benchmarks.common import latency_summary, load_cat_detector, make_synthetic_jpeg
+
+
+def run_load(predict, image_bytes, clients, requests_per_client):
+    """Closed-loop load: every client waits for its answer before sending again"""
+    latencies = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(clients + 1)
+
+    def client():
+        local = []
+        start_barrier.wait()
+        for _ in range(requests_per_client):
+            t0 = time.perf_counter()
+            result = predict(image_bytes)
+            local.append((time.perf_counter() - t0) * 1000.0)
+            if not result.get("success"):
+                raise RuntimeError(result.get("error"))
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    start_barrier.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    return latency_summary(latencies, time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Path to cat_resnet18.pth (random weights if omitted/missing)")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent client threads")
+    parser.add_argument("--requests", type=int, default=25, help="Requests per client")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--queue-depth", type=int, default=256)
+    args = parser.parse_args()
+
+    logging.getLogger("CatEmotionDetector").setLevel(logging.WARNING)
+
+    from app.services.cat_emotion_service import CatInferenceScheduler
+
+    detector = load_cat_detector(args.model)
+    image_bytes = make_synthetic_jpeg()
+
+    # Warm up both paths so one-off allocator/thread-pool costs are excluded
+    for _ in range(3):
+        detector.predict_from_bytes(image_bytes)
+
+    scheduler = CatInferenceScheduler(
+        detector,
+        max_batch_size=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        queue_depth=args.queue_depth,
+    )
+
+    print(f"\nClients: {args.clients}  Requests/client: {args.requests}")
+    rows = [
+        ("per-request", run_load(detector.predict_from_bytes, image_bytes, args.clients, args.requests)),
+        ("micro-batched", run_load(scheduler.predict_from_bytes, image_bytes, args.clients, args.requests)),
+    ]
+
+    print(f"\n{'mode':15s} {'req/s':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for name, s in rows:
+        print(f"{name:15s} {s['throughput_rps']:8.1f} {s['p50_ms']:9.1f} {s['p95_ms']:9.1f} {s['p99_ms']:9.1f}")
+
+    base, batched = rows[0][1], rows[1][1]
+    print(f"\nThroughput gain: {batched['throughput_rps'] / base['throughput_rps']:.2f}x")
+    print(f"p99 change:      {base['p99_ms']:.1f} ms -> {batched['p99_ms']:.1f} ms")
+    print(f"Scheduler stats: {scheduler.stats()}")
+
+
+if __name__ == "__main__":
+    main()
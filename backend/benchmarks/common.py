@@ -0,0 +1,122 @@
+"""
+Shared helpers for the offline benchmark scripts
+Run every benchmark from the backend/ folder, e.g.
+    python -m benchmarks.cat_batching --help
+"""
+
+import os
+import sys
+import tempfile
+from io import BytesIO
+
+# Make "app" importable when running as "python -m benchmarks.<name>"
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers (pct in 0-100)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def latency_summary(samples_ms, wall_seconds):
+    """p50/p95/p99 latency plus throughput for a list of per-request timings"""
+    return {
+        "requests": len(samples_ms),
+        "p50_ms": percentile(samples_ms, 50),
+        "p95_ms": percentile(samples_ms, 95),
+        "p99_ms": percentile(samples_ms, 99),
+        "throughput_rps": len(samples_ms) / wall_seconds if wall_seconds else 0.0,
+    }
+
+
+def make_synthetic_jpeg(width=1280, height=960, seed=0, quality=90):
+    """Build a noisy gradient JPEG in memory so benchmarks need no sample files"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noise = rng.normal(0, 25, size=base.shape)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+
+    buffer = BytesIO()
+    Image.fromarray(pixels, "RGB").save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def load_cat_detector(model_path=None):
+    """
+    Build a CatEmotionDetector for timing
+
+    Without a model path (or when the trained weights are not checked out)
+    a randomly initialised ResNet18 is used - accuracy is meaningless but
+    the cost of every stage is identical.
+    """
+    from app.services.cat_emotion_service import CatEmotionDetector
+
+    if model_path and os.path.exists(model_path):
+        return CatEmotionDetector(model_path=model_path)
+
+    default_path = os.path.join(BACKEND_DIR, "app", "trained", "cat_resnet18.pth")
+    if model_path is None and os.path.exists(default_path):
+        return CatEmotionDetector(model_path=default_path)
+
+    import torch
+    import torch.nn as nn
+    from torchvision import models
+
+    print("⚠️  Trained cat weights not found, benchmarking a randomly initialised ResNet18")
+    model = models.resnet18(weights=None)
+    model.fc = nn.Linear(model.fc.in_features, 3)
+    handle, path = tempfile.mkstemp(suffix=".pth")
+    os.close(handle)
+    torch.save(model.state_dict(), path)
+    try:
+        return CatEmotionDetector(model_path=path)
+    finally:
+        os.remove(path)
+
+
+def load_dog_detector(model_path=None):
+    """
+    Build a DogEmotionDetector for timing
+
+    Falls back to an untrained EfficientNet-B0 with the same head as the
+    training notebook when dog.h5 is not available.
+    """
+    from app.services.dog_emotion_service import DogEmotionDetector
+
+    if model_path and os.path.exists(model_path):
+        return DogEmotionDetector(model_path=model_path)
+
+    default_path = os.path.join(BACKEND_DIR, "app", "trained", "dog.h5")
+    if model_path is None and os.path.exists(default_path):
+        return DogEmotionDetector(model_path=default_path)
+
+    import tensorflow as tf
+
+    print("⚠️  Trained dog weights not found, benchmarking a randomly initialised EfficientNet-B0")
+    base = tf.keras.applications.EfficientNetB0(include_top=False, weights=None, input_shape=(224, 224, 3))
+    inputs = tf.keras.layers.Input(shape=(224, 224, 3))
+    x = tf.keras.applications.efficientnet.preprocess_input(inputs)
+    x = base(x, training=False)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    x = tf.keras.layers.Dropout(0.3)(x)
+    outputs = tf.keras.layers.Dense(4, activation="softmax")(x)
+    model = tf.keras.Model(inputs, outputs)
+
+    handle, path = tempfile.mkstemp(suffix=".h5")
+    os.close(handle)
+    model.save(path)
+    try:
+        return DogEmotionDetector(model_path=path)
+    finally:
+        os.remove(path)
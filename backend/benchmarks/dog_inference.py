@@ -0,0 +1,75 @@
+"""
+Benchmark: Keras model.predict vs the compiled, bucketed dog inference path
+
+"before" replays the original DogEmotionDetector code path (eager TF
+preprocessing + model.predict per image); "after" is the current
+predict_from_bytes / predict_batch_from_bytes built on the traced
+serving signature. Prints per-image latency for both.
+
+Usage (from backend/):
+    python -m benchmarks.dog_inference --iterations 30
+"""
+
+import argparse
+import time
+from io import BytesIO
+
+from benchmarks.common import latency_summary, load_dog_detector, make_synthetic_jpeg
+
+
+def legacy_predict_from_bytes(detector, image_bytes):
+    """The pre-compilation implementation, kept here for comparison only"""
+    import numpy as np
+    import tensorflow as tf
+    from PIL import Image
+
+    img = Image.open(BytesIO(image_bytes)).convert("RGB")
+    img = img.resize((detector.img_size, detector.img_size))
+    img_array = tf.keras.preprocessing.image.img_to_array(img)
+    img_array = tf.expand_dims(img_array, 0)
+    img_array = tf.keras.applications.efficientnet.preprocess_input(img_array)
+    predictions = detector.model.predict(img_array, verbose=0)
+    return {"success": True, "emotion": detector.classes[int(np.argmax(predictions[0]))]}
+
+
+def time_calls(fn, iterations):
+    samples = []
+    t_start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return latency_summary(samples, time.perf_counter() - t_start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Path to dog.h5 (random weights if omitted/missing)")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--batch", type=int, default=8, help="Images per call for the batched row")
+    args = parser.parse_args()
+
+    detector = load_dog_detector(args.model)
+    image_bytes = make_synthetic_jpeg()
+    batch = [image_bytes] * args.batch
+
+    # Warm up: first calls trace graphs / build the predict() machinery
+    for _ in range(3):
+        legacy_predict_from_bytes(detector, image_bytes)
+        detector.predict_from_bytes(image_bytes)
+        detector.predict_batch_from_bytes(batch)
+
+    before = time_calls(lambda: legacy_predict_from_bytes(detector, image_bytes), args.iterations)
+    after = time_calls(lambda: detector.predict_from_bytes(image_bytes), args.iterations)
+    batched = time_calls(lambda: detector.predict_batch_from_bytes(batch), args.iterations)
+
+    print(f"\n{'path':28s} {'p50 ms/img':>11s} {'p99 ms/img':>11s}")
+    print(f"{'model.predict (before)':28s} {before['p50_ms']:11.1f} {before['p99_ms']:11.1f}")
+    print(f"{'compiled, batch 1 (after)':28s} {after['p50_ms']:11.1f} {after['p99_ms']:11.1f}")
+    label = f"compiled, batch {args.batch} (after)"
+    print(f"{label:28s} {batched['p50_ms'] / args.batch:11.1f} {batched['p99_ms'] / args.batch:11.1f}")
+    print(f"\nSpeedup at batch 1: {before['p50_ms'] / after['p50_ms']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark: per-request commits vs group-committed emotion history inserts
+
+Fires the same closed-loop load (N client threads, each saving one
+CatEmotionHistory row after another) through record_history with:
+- direct: one INSERT + COMMIT per row (HISTORY_GROUP_COMMIT off)
+- group-wait: group commit, every caller waits for its batch to commit
+- group-ack: group commit, callers return once the row is queued; the
+  clock stops after the final flush, so throughput counts committed rows
+
+and prints sustained rows/second plus p50/p95/p99 latency per call.
+
+By default the rows go to a temporary SQLite file (synchronous=FULL, one
+fsync per commit). Point --database-uri at the MySQL database to measure
+the real server; the tables must exist and --pet-id must be a real pet.
+
+Usage (from backend/):
+    python -m benchmarks.history_writes --clients 16 --rows 200
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.common import latency_summary
+
+
+def build_app(database_uri):
+    from flask import Flask
+    from app import db
+
+    app = Flask("history_benchmark")
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_size": 32} if database_uri.startswith("mysql") else {}
+    db.init_app(app)
+    if database_uri.startswith("sqlite"):
+        from sqlalchemy import event
+        from app.models import CatEmotionHistory
+
+        with app.app_context():
+            event.listen(db.engine, "connect", lambda conn, _: conn.execute("PRAGMA synchronous=FULL"))
+            db.metadata.create_all(db.engine, tables=[CatEmotionHistory.__table__])
+    return app
+
+
+def run_load(app, mode, clients, rows_per_client, pet_id, max_batch, max_wait_ms):
+    """Closed-loop load: every client saves its next row once the last one returned"""
+    from app.models import CatEmotionHistory
+    from app.services import history_writer
+    from app.services.history_writer import get_history_writer, record_history
+
+    app.config.update(
+        HISTORY_GROUP_COMMIT=mode != "direct",
+        HISTORY_COMMIT_WAIT=mode == "group-wait",
+        HISTORY_BATCH_MAX_SIZE=max_batch,
+        HISTORY_BATCH_MAX_WAIT_MS=max_wait_ms,
+        HISTORY_QUEUE_DEPTH=max(1024, clients * rows_per_client),
+    )
+    history_writer._writer_instance = None  # fresh writer and stats for every mode
+
+    probabilities = json.dumps({"angry": 0.1, "happy": 0.8, "sad": 0.1})
+    latencies = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(clients + 1)
+
+    def client():
+        local = []
+        with app.app_context():
+            start_barrier.wait()
+            for _ in range(rows_per_client):
+                t0 = time.perf_counter()
+                record_history(
+                    CatEmotionHistory,
+                    pet_id=pet_id,
+                    emotion="happy",
+                    confidence=0.8,
+                    probabilities=probabilities,
+                    image_url=None,
+                    model_version="benchmark",
+                )
+                local.append((time.perf_counter() - t0) * 1000.0)
+        with lock:
+            latencies.extend(local)
+
+    with app.app_context():
+        writer = get_history_writer() if mode != "direct" else None
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    start_barrier.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    if writer is not None:
+        writer.flush(timeout=120)
+    summary = latency_summary(latencies, time.perf_counter() - t0)
+    summary["rows_per_s"] = summary.pop("throughput_rps")
+    if writer is not None:
+        stats = writer.stats()
+        summary["avg_batch_size"] = stats["avg_batch_size"]
+        summary["failed"] = stats["failed"]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-uri", help="SQLAlchemy URI (temporary SQLite file if omitted)")
+    parser.add_argument("--pet-id", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent client threads")
+    parser.add_argument("--rows", type=int, default=200, help="Rows saved per client")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--modes", default="direct,group-wait,group-ack")
+    args = parser.parse_args()
+
+    logging.getLogger("HistoryWriter").setLevel(logging.WARNING)
+
+    temp_dir = None
+    database_uri = args.database_uri
+    if not database_uri:
+        temp_dir = tempfile.TemporaryDirectory()
+        database_uri = f"sqlite:///{os.path.join(temp_dir.name, 'history.sqlite3')}"
+    app = build_app(database_uri)
+
+    print(f"History inserts: {args.clients} clients x {args.rows} rows on {database_uri.split('://')[0]}")
+    print(f"{'mode':<12} {'rows/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'avg batch':>10}")
+    for mode in args.modes.split(","):
+        s = run_load(app, mode, args.clients, args.rows, args.pet_id, args.max_batch, args.max_wait_ms)
+        batch = f"{s['avg_batch_size']:.1f}" if "avg_batch_size" in s else "1"
+        print(f"{mode:<12} {s['rows_per_s']:>10.0f} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {batch:>10}")
+
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark: full JPEG decode vs reduced-resolution (draft mode) decode
+
+"full" is how the detectors used to load uploads: Image.open().convert("RGB")
+at the original resolution, then resize to 224x224. "draft" is
+app.services.preprocessing.load_image, which lets libjpeg decode at 1/2,
+1/4 or 1/8 scale and applies the EXIF orientation on the small image.
+
+For each mode it reports decode+resize latency, the peak RSS growth of a
+fresh process decoding the images one after another, and how far the
+224x224 model input drifts from the full decode (mean |Δ| in 0-255 units).
+
+Usage (from backend/):
+    python -m benchmarks.image_decode --images ~/phone_photos
+    python -m benchmarks.image_decode --count 10        # synthetic 12 MP JPEGs
+"""
+
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import BACKEND_DIR, latency_summary, make_synthetic_jpeg
+
+MODES = ("full", "draft")
+
+
+def load_full(path):
+    """The previous loader: decode every pixel, no EXIF handling"""
+    from PIL import Image
+    return Image.open(path).convert("RGB")
+
+
+def load_draft(path):
+    from app.services.preprocessing import load_image
+    return load_image(path)
+
+
+LOADERS = {
+    "full": load_full,
+    "draft": load_draft,
+}
+
+
+def model_input(mode, path, species):
+    import numpy as np
+    from app.services.preprocessing import resize_image
+    return np.asarray(resize_image(species, LOADERS[mode](path)), dtype=np.float32)
+
+
+def synthetic_phone_photos(folder, count):
+    """12 MP (4032x3024) JPEGs, like a current phone camera produces"""
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"synthetic_{i}.jpg")
+        with open(path, "wb") as f:
+            f.write(make_synthetic_jpeg(4032, 3024, seed=i, quality=92))
+        paths.append(path)
+    return paths
+
+
+def _rss_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def _measure_rss(mode, species, paths):
+    """Child process entry: peak RSS growth while decoding the images one by one"""
+    from io import BytesIO
+
+    # One tiny decode first, so import and plugin-loading cost stays out of the measurement
+    model_input(mode, BytesIO(make_synthetic_jpeg(32, 32)), species)
+    baseline = _rss_kb("VmRSS")
+    for path in paths:
+        model_input(mode, path, species)
+    print((_rss_kb("VmHWM") - baseline) / 1024.0)
+
+
+def peak_rss_mb(mode, species, paths):
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.image_decode", "--measure-rss", mode, species] + paths,
+        capture_output=True, text=True, cwd=BACKEND_DIR,
+    )
+    try:
+        return float(result.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return 0.0
+
+
+def time_mode(mode, species, paths, iterations):
+    samples = []
+    t_start = time.perf_counter()
+    for _ in range(iterations):
+        for path in paths:
+            t0 = time.perf_counter()
+            model_input(mode, path, species)
+            samples.append((time.perf_counter() - t0) * 1000.0)
+    return latency_summary(samples, time.perf_counter() - t_start)
+
+
+def main():
+    if len(sys.argv) > 4 and sys.argv[1] == "--measure-rss":
+        _measure_rss(sys.argv[2], sys.argv[3], sys.argv[4:])
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Folder of JPEG photos (synthetic 12 MP images when omitted)")
+    parser.add_argument("--count", type=int, default=8, help="Synthetic images to generate / max images to use")
+    parser.add_argument("--species", choices=["cat", "dog"], default="cat", help="Resize pipeline to apply")
+    parser.add_argument("--iterations", type=int, default=3, help="Passes over the image set per mode")
+    args = parser.parse_args()
+
+    import numpy as np
+    from PIL import Image
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.images:
+            paths = sorted(
+                p for p in glob.glob(os.path.join(os.path.expanduser(args.images), "*"))
+                if p.lower().endswith((".jpg", ".jpeg"))
+            )[:args.count]
+            if not paths:
+                print(f"❌ No JPEGs found in {args.images}")
+                sys.exit(1)
+        else:
+            paths = synthetic_phone_photos(tmp, args.count)
+
+        sizes = sorted({Image.open(p).size for p in paths})
+        print(f"{len(paths)} JPEGs, sizes {', '.join(f'{w}x{h}' for w, h in sizes)}, {args.species} pipeline")
+
+        drift = [
+            float(np.mean(np.abs(model_input("full", p, args.species) - model_input("draft", p, args.species))))
+            for p in paths
+        ]
+
+        rows = {}
+        for mode in MODES:
+            rows[mode] = time_mode(mode, args.species, paths, args.iterations)
+            rows[mode]["peak_rss_mb"] = peak_rss_mb(mode, args.species, paths)
+
+    print(f"\n{'mode':6s} {'p50 ms':>8s} {'p95 ms':>8s} {'img/s':>7s} {'peak RSS MB':>12s}")
+    for mode, row in rows.items():
+        print(f"{mode:6s} {row['p50_ms']:8.1f} {row['p95_ms']:8.1f} {row['throughput_rps']:7.1f} {row['peak_rss_mb']:12.1f}")
+    speedup = rows["full"]["p50_ms"] / rows["draft"]["p50_ms"] if rows["draft"]["p50_ms"] else 0.0
+    print(f"\ndraft decode is {speedup:.1f}x faster; mean |Δ| of the 224x224 input: "
+          f"{np.mean(drift):.2f} (max {np.max(drift):.2f}) on a 0-255 scale")
+    print("note: 'full' ignores EXIF orientation, so rotated photos show a large |Δ| by design")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Benchmark suite: cat and dog inference timed stage by stage
+
+Runs offline (no MySQL, no Flask server, no network) against
+CatEmotionDetector and DogEmotionDetector and times every stage of the
+pipeline separately:
+
+    decode        upload bytes -> upright RGB PIL image (load_image)
+    preprocess    resize + write into a pooled float32 batch
+    forward       model forward pass on a ready batch (incl. softmax)
+    postprocess   probabilities -> API result dicts
+    end_to_end    predict_batch_from_bytes (parallel decode + all of the above)
+
+for every batch size and framework thread count, on two image sets:
+synthetic JPEGs of several sizes, and sample photos from a folder
+(app/uploads/pets_data by default). Each thread count runs in a fresh
+process, because TensorFlow fixes its pool sizes at startup. Every row
+reports p50/p95/p99 latency per call and images per second.
+
+Baselines are plain JSON. --compare checks a run (or a saved --current
+file) against a baseline and exits non-zero when p50 latency or
+throughput regressed by more than --tolerance.
+
+Usage (from backend/):
+    python -m benchmarks.pipeline_stages --save baseline.json
+    python -m benchmarks.pipeline_stages --compare baseline.json
+    python -m benchmarks.pipeline_stages --species cat --batch-sizes 1,8 --threads 1,4 --iterations 5
+    python -m benchmarks.pipeline_stages --compare baseline.json --current new.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from importlib import metadata
+
+from benchmarks.common import (
+    BACKEND_DIR, latency_summary, load_cat_detector, load_dog_detector, make_synthetic_jpeg
+)
+
+STAGES = ("decode", "preprocess", "forward", "postprocess", "end_to_end")
+SAMPLE_DIR = os.path.join(BACKEND_DIR, "app", "uploads", "pets_data")
+SYNTHETIC_SIZES = ((640, 480), (1280, 960), (4032, 3024))
+RESULT_PREFIX = "RESULT "
+
+
+def synthetic_images(count):
+    """Synthetic JPEGs cycling through webcam, small photo and 12 MP phone sizes"""
+    return [
+        make_synthetic_jpeg(*SYNTHETIC_SIZES[i % len(SYNTHETIC_SIZES)], seed=i)
+        for i in range(count)
+    ]
+
+
+def sample_images(folder, count):
+    paths = sorted(
+        p for p in glob.glob(os.path.join(os.path.expanduser(folder), "*"))
+        if p.lower().endswith((".jpg", ".jpeg", ".png", ".webp", ".bmp"))
+    )[:count]
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    return images
+
+
+def time_stage(fn, images_per_call, iterations, warmup):
+    """Latency percentiles per call and images per second for one stage"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    wall = time.perf_counter() - started
+    summary = latency_summary(samples, wall)
+    return {
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "p99_ms": summary["p99_ms"],
+        "images_per_s": images_per_call * iterations / wall if wall else 0.0,
+        "iterations": iterations,
+    }
+
+
+def set_framework_threads(species, threads):
+    """Pin the species' framework intra-op pool before its model is loaded"""
+    if species == "cat":
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    else:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def benchmark_species(species, detector, image_sets, batch_sizes, threads, stages, iterations, warmup):
+    import numpy as np
+    from app.services.preprocessing import input_shape, load_image, resize_image, write_input
+
+    if species == "cat":
+        forward = detector._forward_torch
+    else:
+        forward = detector._run_model
+
+    results = {}
+    for batch_size in batch_sizes:
+        prefix = f"{species}/threads={threads}/batch={batch_size}"
+
+        # forward / postprocess only depend on the batch shape
+        inputs = np.random.default_rng(0).uniform(
+            0, 1.0 if species == "cat" else 255.0, size=input_shape(species, batch_size)
+        ).astype(np.float32)
+        if "forward" in stages:
+            results[f"{prefix}/forward"] = time_stage(lambda: forward(inputs), batch_size, iterations, warmup)
+        if "postprocess" in stages:
+            probabilities = forward(inputs)
+            results[f"{prefix}/postprocess"] = time_stage(
+                lambda: [detector._build_result(row) for row in probabilities], batch_size, iterations, warmup
+            )
+
+        for set_name, images in image_sets.items():
+            items = [images[i % len(images)] for i in range(batch_size)]
+            key = f"{species}/{set_name}/threads={threads}/batch={batch_size}"
+
+            if "decode" in stages:
+                results[f"{key}/decode"] = time_stage(
+                    lambda: [load_image(data) for data in items], batch_size, iterations, warmup
+                )
+            if "preprocess" in stages:
+                decoded = [load_image(data) for data in items]
+
+                def preprocess():
+                    with detector.input_pool.batch(batch_size) as batch:
+                        for img, row in zip(decoded, batch):
+                            write_input(species, resize_image(species, img), row)
+
+                results[f"{key}/preprocess"] = time_stage(preprocess, batch_size, iterations, warmup)
+            if "end_to_end" in stages:
+                results[f"{key}/end_to_end"] = time_stage(
+                    lambda: detector.predict_batch_from_bytes(items), batch_size, iterations, warmup
+                )
+
+        print(f"   {prefix} done", file=sys.stderr, flush=True)
+    return results
+
+
+def run_child(args, threads):
+    """Child process entry: one thread count, every species / batch size / stage"""
+    # The cat model (torch + torchvision) has to load before TensorFlow is imported
+    species_list = sorted(args.species.split(","), key=lambda species: species != "cat")
+
+    image_sets = {"synthetic": synthetic_images(args.synthetic_count)}
+    samples = sample_images(args.images, args.sample_count)
+    if samples:
+        image_sets["samples"] = samples
+
+    results = {}
+    for species in species_list:
+        set_framework_threads(species, threads)
+        detector = load_cat_detector(args.cat_model) if species == "cat" else load_dog_detector(args.dog_model)
+        results.update(benchmark_species(
+            species, detector, image_sets, args.batch_sizes, threads, args.stages, args.iterations, args.warmup
+        ))
+    return results
+
+
+def environment():
+    """Context saved with a baseline; comparisons across machines are flagged"""
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    for package in ("torch", "tensorflow", "numpy", "Pillow"):
+        try:
+            info[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            info[package] = None
+    return info
+
+
+def run_suite(args):
+    results = {}
+    for threads in args.threads:
+        print(f"⏳ threads={threads} ...", flush=True)
+        command = [
+            sys.executable, "-m", "benchmarks.pipeline_stages", "--child-threads", str(threads),
+            "--species", args.species,
+            "--batch-sizes", ",".join(map(str, args.batch_sizes)),
+            "--stages", ",".join(args.stages),
+            "--iterations", str(args.iterations), "--warmup", str(args.warmup),
+            "--images", args.images, "--sample-count", str(args.sample_count),
+            "--synthetic-count", str(args.synthetic_count),
+        ]
+        for flag, value in (("--cat-model", args.cat_model), ("--dog-model", args.dog_model)):
+            if value:
+                command += [flag, value]
+        completed = subprocess.run(command, cwd=BACKEND_DIR, stdout=subprocess.PIPE, text=True, check=True)
+        for line in completed.stdout.splitlines():
+            if line.startswith(RESULT_PREFIX):
+                results.update(json.loads(line[len(RESULT_PREFIX):]))
+
+    return {
+        "environment": environment(),
+        "config": {
+            "species": args.species.split(","),
+            "batch_sizes": args.batch_sizes,
+            "threads": args.threads,
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+
+
+def print_report(report):
+    print(f"\n{'benchmark':58s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'img/s':>9s}")
+    for key, row in sorted(report["results"].items()):
+        print(f"{key:58s} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} {row['p99_ms']:9.2f} {row['images_per_s']:9.1f}")
+
+
+def compare(baseline, current, tolerance):
+    """
+    Print p50 / throughput changes against a baseline
+
+    Returns:
+        list: Keys that regressed by more than `tolerance` (0.1 = 10%)
+    """
+    base_env, cur_env = baseline.get("environment", {}), current.get("environment", {})
+    for field in ("cpu_count", "torch", "tensorflow"):
+        if base_env.get(field) != cur_env.get(field):
+            print(f"⚠️  {field} differs from the baseline: {base_env.get(field)} -> {cur_env.get(field)}")
+
+    regressions = []
+    print(f"\n{'benchmark':58s} {'p50 base':>9s} {'p50 now':>9s} {'Δp50':>7s} {'Δimg/s':>7s}")
+    for key in sorted(baseline["results"]):
+        if key not in current["results"]:
+            continue
+        base, cur = baseline["results"][key], current["results"][key]
+        p50_change = cur["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        throughput_change = cur["images_per_s"] / base["images_per_s"] - 1 if base["images_per_s"] else 0.0
+        regressed = p50_change > tolerance or throughput_change < -tolerance
+        if regressed:
+            regressions.append(key)
+        print(f"{key:58s} {base['p50_ms']:9.2f} {cur['p50_ms']:9.2f} {p50_change:+7.1%} {throughput_change:+7.1%}"
+              f"{'  ❌' if regressed else ''}")
+
+    missing = sorted(set(baseline["results"]) - set(current["results"]))
+    if missing:
+        print(f"\nℹ️  {len(missing)} baseline benchmarks were not run this time")
+    return regressions
+
+
+def main():
+    def int_list(value):
+        return [int(v) for v in value.split(",") if v.strip()]
+
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--species", default="cat,dog")
+    parser.add_argument("--batch-sizes", type=int_list, default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--threads", type=int_list, default=sorted({1, cores}),
+                        help="torch / TensorFlow intra-op thread counts to run")
+    parser.add_argument("--stages", type=lambda v: [s for s in v.split(",") if s], default=list(STAGES),
+                        help=f"Subset of {','.join(STAGES)}")
+    parser.add_argument("--iterations", type=int, default=10, help="Timed calls per benchmark")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed calls before each benchmark")
+    parser.add_argument("--images", default=SAMPLE_DIR, help="Folder of sample photos")
+    parser.add_argument("--sample-count", type=int, default=16, help="Max sample photos to use")
+    parser.add_argument("--synthetic-count", type=int, default=6, help="Synthetic JPEGs to generate")
+    parser.add_argument("--cat-model", help="Cat weights (random ResNet18 if omitted/missing)")
+    parser.add_argument("--dog-model", help="dog.h5 (random EfficientNet-B0 if omitted/missing)")
+    parser.add_argument("--save", help="Write this run as a JSON baseline")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--current", help="Compare this saved JSON instead of running the suite")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown before flagging (0.15 = 15%%)")
+    parser.add_argument("--child-threads", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    if args.child_threads:
+        print(RESULT_PREFIX + json.dumps(run_child(args, args.child_threads)), flush=True)
+        return
+
+    if args.current:
+        with open(args.current) as f:
+            report = json.load(f)
+    else:
+        report = run_suite(args)
+        print_report(report)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📝 Baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} benchmarks regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print(f"\n✅ No regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark: per-worker memory and cold start of the prefork server
+
+Starts `python -m app.server` once per scenario and, when every worker is
+serving, reads /proc/<pid>/smaps_rollup of the master and each worker:
+
+    RSS   resident pages, shared ones counted in full for every process
+    PSS   shared pages split between the processes mapping them
+    USS   pages private to the process (what one more worker really costs)
+
+Cold start is the time from launching the server until every worker has
+loaded + warmed its models and is accepting requests.
+
+Default scenarios:
+    legacy   every worker loads the .pth / .h5 itself after the fork
+    master   cat weights loaded once in the master from the .pth / .h5
+    bundle   cat weights memory-mapped once in the master from the .bundle
+             folders (the dog model is always loaded per worker, from its
+             bundle in this scenario)
+
+Usage (from backend/):
+    python build_model_bundles.py                    # once
+    python -m benchmarks.prefork_memory --workers 4
+    python -m benchmarks.prefork_memory --species cat --scenarios legacy,bundle
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.common import BACKEND_DIR
+
+TRAINED_DIR = os.path.join(BACKEND_DIR, "app", "trained")
+
+SCENARIOS = {
+    "legacy": {"preload": "worker", "cat": "cat_resnet18.pth", "dog": "dog.h5"},
+    "master": {"preload": "master", "cat": "cat_resnet18.pth", "dog": "dog.h5"},
+    "bundle": {"preload": "master", "cat": "cat_resnet18.bundle", "dog": "dog.bundle"},
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def smaps_rollup_mb(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            match = re.match(r"(\w+):\s+(\d+) kB", line)
+            if match:
+                values[match.group(1)] = int(match.group(2)) / 1024.0
+    return {
+        "rss_mb": values.get("Rss", 0.0),
+        "pss_mb": values.get("Pss", 0.0),
+        "uss_mb": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+    }
+
+
+def run_scenario(name, workers, species, timeout, model_dir):
+    config = SCENARIOS[name]
+    env = dict(os.environ)
+    env["CAT_MODEL_PATH"] = os.path.join(model_dir, config["cat"])
+    env["DOG_MODEL_PATH"] = os.path.join(model_dir, config["dog"])
+    env["PYTHONUNBUFFERED"] = "1"
+
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.server", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--species", species, "--preload", config["preload"]],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+
+    ready = set()
+    worker_pids = []
+    try:
+        deadline = time.monotonic() + timeout
+        for line in server.stdout:
+            # Workers share the pipe, so two of them can land on one line
+            ready.update(int(pid) for pid in re.findall(r"Worker (\d+) ready", line))
+            if len(ready) == workers:
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{name}: workers not ready after {timeout}s")
+        cold_start = time.perf_counter() - started
+        if len(ready) < workers:
+            raise RuntimeError(f"{name}: server exited before all workers were ready")
+
+        time.sleep(1.0)  # let allocator arenas settle
+        worker_pids = sorted(ready)
+        master = smaps_rollup_mb(server.pid)
+        per_worker = [smaps_rollup_mb(pid) for pid in worker_pids]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    def avg(key):
+        return sum(w[key] for w in per_worker) / len(per_worker)
+
+    return {
+        "cold_start_s": cold_start,
+        "master": master,
+        "worker_rss_mb": avg("rss_mb"),
+        "worker_pss_mb": avg("pss_mb"),
+        "worker_uss_mb": avg("uss_mb"),
+        "total_pss_mb": master["pss_mb"] + sum(w["pss_mb"] for w in per_worker),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--species", default="cat,dog", help="Models the server loads")
+    parser.add_argument("--scenarios", default="legacy,master,bundle")
+    parser.add_argument("--model-dir", default=TRAINED_DIR, help="Folder with the .pth/.h5 files and .bundle folders")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--report", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenarios.split(","):
+        print(f"⏳ {name} ...", flush=True)
+        results[name] = run_scenario(name, args.workers, args.species, args.timeout, args.model_dir)
+
+    print(f"\n{args.workers} workers, models: {args.species}")
+    print(f"{'scenario':9s} {'cold start s':>12s} {'worker RSS':>11s} {'worker PSS':>11s} "
+          f"{'worker USS':>11s} {'total PSS':>10s}")
+    for name, row in results.items():
+        print(f"{name:9s} {row['cold_start_s']:12.1f} {row['worker_rss_mb']:11.1f} {row['worker_pss_mb']:11.1f} "
+              f"{row['worker_uss_mb']:11.1f} {row['total_pss_mb']:10.1f}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📝 Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
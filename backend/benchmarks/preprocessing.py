@@ -0,0 +1,141 @@
+"""
+Benchmark: per-request tensor allocation vs pooled zero-copy preprocessing
+
+"legacy" rebuilds the original per-request preprocessing:
+    cat: torchvision Resize + ToTensor -> unsqueeze(0) -> .to(device)
+    dog: img_to_array -> tf.expand_dims -> efficientnet.preprocess_input
+"pooled" writes the resized pixels straight into a pooled float32 batch
+from app.services.preprocessing and hands the model a view of it.
+
+Both modes get the same already-decoded image, so only preprocessing
+differs. With --forward the model runs too (same forward for both modes).
+Each of --threads workers processes --iterations images; the benchmark
+reports latency, throughput and minor page faults per image. Page faults
+stand in for allocation cost across NumPy, torch and TF alike: a fresh
+large buffer faults in every page it touches, a reused one does not.
+
+Usage (from backend/):
+    python -m benchmarks.preprocessing --species cat --threads 8
+    python -m benchmarks.preprocessing --species dog --threads 8 --forward
+"""
+
+import argparse
+import resource
+import threading
+import time
+
+from benchmarks.common import latency_summary, load_cat_detector, load_dog_detector, make_synthetic_jpeg
+
+
+def legacy_cat(detector, forward):
+    import torch
+    from torchvision import transforms
+
+    transform = transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+    ])
+
+    def run(img):
+        tensor = transform(img).unsqueeze(0).to(detector.device)
+        if forward:
+            with torch.no_grad():
+                detector.model(tensor)
+    return run
+
+
+def legacy_dog(detector, forward):
+    import tensorflow as tf
+
+    def run(img):
+        img_array = tf.keras.preprocessing.image.img_to_array(img.resize((224, 224)))
+        img_array = tf.expand_dims(img_array, 0)
+        img_array = tf.keras.applications.efficientnet.preprocess_input(img_array)
+        if forward:
+            detector._get_serving_fn(1)(tf.cast(img_array, tf.float32))
+    return run
+
+
+def pooled(detector, species, forward):
+    from app.services.preprocessing import resize_image, write_input
+
+    if forward:
+        if species == "cat":
+            return lambda img: detector.predict_images([img])
+        return detector._predict_image
+
+    def run(img):
+        with detector.input_pool.batch(1) as batch:
+            write_input(species, resize_image(species, img), batch[0])
+    return run
+
+
+def run_load(fn, images, threads, iterations):
+    """Closed loop: every thread preprocesses `iterations` images back to back"""
+    samples = []
+    samples_lock = threading.Lock()
+
+    def worker(offset):
+        local = []
+        for i in range(iterations):
+            img = images[(offset + i) % len(images)]
+            t0 = time.perf_counter()
+            fn(img)
+            local.append((time.perf_counter() - t0) * 1000.0)
+        with samples_lock:
+            samples.extend(local)
+
+    for img in images[:2]:
+        fn(img)  # warmup
+
+    faults_before = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    t_start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    wall = time.perf_counter() - t_start
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults_before
+
+    summary = latency_summary(samples, wall)
+    summary["faults_per_image"] = faults / max(1, len(samples))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--species", choices=["cat", "dog"], default="cat")
+    parser.add_argument("--model", help="Model weights (random weights when omitted and not found)")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent request threads")
+    parser.add_argument("--iterations", type=int, default=50, help="Images per thread")
+    parser.add_argument("--forward", action="store_true", help="Include the model forward pass")
+    args = parser.parse_args()
+
+    from app.services.preprocessing import load_image
+
+    if args.species == "cat":
+        detector = load_cat_detector(args.model)
+        legacy = legacy_cat(detector, args.forward)
+    else:
+        detector = load_dog_detector(args.model)
+        legacy = legacy_dog(detector, args.forward)
+
+    images = [load_image(make_synthetic_jpeg(1280, 960, seed=i)) for i in range(8)]
+    modes = {
+        "legacy": legacy,
+        "pooled": pooled(detector, args.species, args.forward),
+    }
+
+    stage = "preprocess + forward" if args.forward else "preprocess only"
+    print(f"{args.species}, {stage}, {args.threads} threads x {args.iterations} images")
+    print(f"{'mode':7s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'img/s':>8s} {'faults/img':>11s}")
+    for name, fn in modes.items():
+        row = run_load(fn, images, args.threads, args.iterations)
+        print(f"{name:7s} {row['p50_ms']:8.2f} {row['p95_ms']:8.2f} {row['p99_ms']:8.2f} "
+              f"{row['throughput_rps']:8.1f} {row['faults_per_image']:11.1f}")
+    print(f"\ninput pool: {detector.input_pool.stats()}")
+
+
+if __name__ == "__main__":
+    main()
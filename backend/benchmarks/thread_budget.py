@@ -0,0 +1,142 @@
+"""
+Benchmark: mixed cat + dog load with and without the CPU thread budget
+
+Runs the same closed-loop load twice, each in a fresh process (thread
+pool sizes are fixed once torch / TensorFlow start):
+
+    default   torch and TensorFlow size their own pools, every client
+              thread runs its forward pass immediately
+    budget    app.services.thread_budget splits the cores between the two
+              frameworks and bounds concurrent forward passes per model
+
+Client threads play the request threads of one web worker: half of them
+send cat uploads, half dog uploads, back to back. Prints p50/p95/p99 per
+species and the combined throughput.
+
+Usage (from backend/):
+    python -m benchmarks.thread_budget --clients 16 --requests 20
+    python -m benchmarks.thread_budget --workers 2    # budget for 2 workers
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import (
+    BACKEND_DIR, latency_summary, load_cat_detector, load_dog_detector, make_synthetic_jpeg
+)
+
+RESULT_PREFIX = "RESULT "
+
+
+def run_load(mode, clients, requests, cores, workers, cat_model, dog_model):
+    from app.services.thread_budget import plan_thread_budget, set_thread_budget, thread_budget_status
+
+    if mode == "budget":
+        # Installed before torch / TensorFlow are imported, as in create_app
+        set_thread_budget(plan_thread_budget(cores=cores, workers=workers))
+
+    import torch  # noqa: F401  (torch must be imported before tensorflow)
+    detectors = {"cat": load_cat_detector(cat_model), "dog": load_dog_detector(dog_model)}
+    image_bytes = make_synthetic_jpeg()
+
+    for detector in detectors.values():
+        for _ in range(3):
+            detector.predict_from_bytes(image_bytes)
+
+    samples = {"cat": [], "dog": []}
+    samples_lock = threading.Lock()
+    start_barrier = threading.Barrier(clients + 1)
+
+    def client(species):
+        detector = detectors[species]
+        timings = []
+        start_barrier.wait()
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            detector.predict_from_bytes(image_bytes)
+            timings.append((time.perf_counter() - t0) * 1000.0)
+        with samples_lock:
+            samples[species].extend(timings)
+
+    threads = [threading.Thread(target=client, args=("cat" if i % 2 == 0 else "dog",)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    status = thread_budget_status()
+    return {
+        "cat": latency_summary(samples["cat"], wall),
+        "dog": latency_summary(samples["dog"], wall),
+        "throughput_rps": (len(samples["cat"]) + len(samples["dog"])) / wall,
+        "torch_threads": torch.get_num_threads(),
+        "tensorflow_intra_op_threads": status.get("tensorflow_threads", {}).get("intra_op"),
+    }
+
+
+def run_mode(mode, args):
+    """Run one mode in a child process and return its result dict"""
+    command = [
+        sys.executable, "-m", "benchmarks.thread_budget", "--child", mode,
+        "--clients", str(args.clients), "--requests", str(args.requests), "--workers", str(args.workers),
+    ]
+    for flag, value in (("--cores", args.cores), ("--cat-model", args.cat_model), ("--dog-model", args.dog_model)):
+        if value:
+            command += [flag, str(value)]
+
+    completed = subprocess.run(command, cwd=BACKEND_DIR, stdout=subprocess.PIPE, text=True, check=True)
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"{mode}: no result in benchmark output")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent request threads (half cat, half dog)")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client thread")
+    parser.add_argument("--cores", type=int, help="Cores to budget (default: all available)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes the budget assumes")
+    parser.add_argument("--cat-model", help="Path to the cat weights (random weights if omitted/missing)")
+    parser.add_argument("--dog-model", help="Path to dog.h5 (random weights if omitted/missing)")
+    parser.add_argument("--report", help="Write the results as JSON to this path")
+    parser.add_argument("--child", choices=["default", "budget"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_load(args.child, args.clients, args.requests, args.cores, args.workers,
+                          args.cat_model, args.dog_model)
+        print(RESULT_PREFIX + json.dumps(result), flush=True)
+        return
+
+    results = {}
+    for mode in ("default", "budget"):
+        print(f"⏳ {mode} ...", flush=True)
+        results[mode] = run_mode(mode, args)
+
+    print(f"\n{args.clients} client threads x {args.requests} requests, mixed cat + dog")
+    print(f"{'mode':8s} {'threads t/tf':>12s} {'cat p50':>8s} {'cat p99':>8s} {'dog p50':>8s} {'dog p99':>8s} {'img/s':>7s}")
+    for mode, row in results.items():
+        threads = f"{row['torch_threads']}/{row['tensorflow_intra_op_threads'] or 'auto'}"
+        print(f"{mode:8s} {threads:>12s} {row['cat']['p50_ms']:8.1f} {row['cat']['p99_ms']:8.1f} "
+              f"{row['dog']['p50_ms']:8.1f} {row['dog']['p99_ms']:8.1f} {row['throughput_rps']:7.1f}")
+    budget, default = results["budget"], results["default"]
+    print(f"\nBudget vs default: throughput {budget['throughput_rps'] / default['throughput_rps']:.2f}x, "
+          f"cat p99 {budget['cat']['p99_ms'] / default['cat']['p99_ms']:.2f}x, "
+          f"dog p99 {budget['dog']['p99_ms'] / default['dog']['p99_ms']:.2f}x")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📝 Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
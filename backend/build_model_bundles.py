@@ -0,0 +1,128 @@
+"""
+Convert the trained cat (.pth) and dog (.h5) models into memory-mappable
+bundles (see app/services/model_bundle.py) and check them against the
+originals.
+
+Run from the backend/ folder:
+    python build_model_bundles.py
+    python build_model_bundles.py --only dog --version 2024-06-01
+
+This writes app/trained/cat_resnet18.bundle and app/trained/dog.bundle.
+The detectors pick a bundle up automatically when it exists. The script
+exits non-zero if a bundle's predictions drift beyond --tolerance from
+the original model.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAINED_DIR = os.path.join(BACKEND_DIR, "app", "trained")
+
+
+def default_version(source_path):
+    """Version derived from the source weights when none is given"""
+    from app.services.model_bundle import file_sha256
+    return file_sha256(source_path)[:12]
+
+
+def build_cat(source_path, bundle_path, version):
+    import torch
+    from app.services.model_bundle import file_sha256, write_bundle
+
+    state_dict = torch.load(source_path, map_location="cpu", weights_only=True)
+    tensors = {name: tensor.detach().cpu().numpy() for name, tensor in state_dict.items()}
+
+    manifest = write_bundle(bundle_path, tensors, "cat_resnet18", version or default_version(source_path), {
+        "species": "cat",
+        "architecture": "torchvision.models.resnet18",
+        "classes": ["angry", "happy", "sad"],
+        "source": os.path.basename(source_path),
+        "source_sha256": file_sha256(source_path),
+    })
+    print(f"✅ Cat bundle {manifest['version']} written to {bundle_path} ({manifest['size_bytes'] / 1e6:.1f} MB)")
+
+
+def build_dog(source_path, bundle_path, version):
+    import tensorflow as tf
+    from app.services.model_bundle import file_sha256, write_bundle
+
+    model = tf.keras.models.load_model(source_path)
+
+    tensors = {}
+    order = []
+    for i, weight in enumerate(model.weights):
+        # Variable names are not unique across layers, so prefix the position
+        name = f"{i:04d}/{getattr(weight, 'path', None) or weight.name}"
+        tensors[name] = np.asarray(weight.numpy())
+        order.append(name)
+
+    manifest = write_bundle(bundle_path, tensors, "dog", version or default_version(source_path), {
+        "species": "dog",
+        "architecture": model.to_json(),
+        "weight_order": order,
+        "classes": ["angry", "happy", "relaxed", "sad"],
+        "source": os.path.basename(source_path),
+        "source_sha256": file_sha256(source_path),
+    })
+    print(f"✅ Dog bundle {manifest['version']} written to {bundle_path} ({manifest['size_bytes'] / 1e6:.1f} MB)")
+
+
+def check_parity(species, original, bundled, tolerance):
+    from app.services.preprocessing import input_shape
+
+    rng = np.random.default_rng(0)
+    high = 1.0 if species == "cat" else 255.0
+    inputs = rng.uniform(0, high, size=input_shape(species, 8)).astype(np.float32)
+
+    expected = original.predict_preprocessed(inputs)
+    actual = bundled.predict_preprocessed(inputs)
+    max_diff = max(
+        abs(want["all_probabilities"][c] - got["all_probabilities"][c])
+        for want, got in zip(expected, actual)
+        for c in want["all_probabilities"]
+    )
+    ok = max_diff <= tolerance
+    print(f"{'✅' if ok else '❌'} {species}: max |Δp| = {max_diff:.2e}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", choices=["cat", "dog"], help="Build a single bundle")
+    parser.add_argument("--cat-model", default=os.path.join(TRAINED_DIR, "cat_resnet18.pth"))
+    parser.add_argument("--dog-model", default=os.path.join(TRAINED_DIR, "dog.h5"))
+    parser.add_argument("--output-dir", default=TRAINED_DIR)
+    parser.add_argument("--version", help="Version string for the manifest (default: hash of the source weights)")
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="Max allowed probability difference")
+    args = parser.parse_args()
+
+    all_ok = True
+
+    if args.only in (None, "cat"):
+        from app.services.cat_emotion_service import CatEmotionDetector
+        bundle_path = os.path.join(args.output_dir, "cat_resnet18.bundle")
+        build_cat(args.cat_model, bundle_path, args.version)
+        all_ok &= check_parity(
+            "cat", CatEmotionDetector(model_path=args.cat_model), CatEmotionDetector(model_path=bundle_path), args.tolerance
+        )
+
+    if args.only in (None, "dog"):
+        from app.services.dog_emotion_service import DogEmotionDetector
+        bundle_path = os.path.join(args.output_dir, "dog.bundle")
+        build_dog(args.dog_model, bundle_path, args.version)
+        all_ok &= check_parity(
+            "dog", DogEmotionDetector(model_path=args.dog_model), DogEmotionDetector(model_path=bundle_path), args.tolerance
+        )
+
+    if not all_ok:
+        print("❌ Bundle check failed - do not deploy these bundles")
+        sys.exit(1)
+    print("🎉 All bundles match the original models")
+
+
+if __name__ == "__main__":
+    main()
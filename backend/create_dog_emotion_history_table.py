@@ -6,7 +6,7 @@ Run this once to add the new table
 from app import create_app, db
 from app.models import DogEmotionHistory
 
-app = create_app()
+app = create_app(preload_models=False)
 
 with app.app_context():
     # Create the table
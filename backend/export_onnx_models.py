@@ -0,0 +1,150 @@
+"""
+Export the cat (PyTorch ResNet18) and dog (Keras EfficientNet-B0) emotion
+models to ONNX and check the exported graphs against the originals.
+
+Run from the backend/ folder:
+    python export_onnx_models.py
+    python export_onnx_models.py --only cat --cat-model app/trained/cat_resnet18.pth
+
+Each export is verified by running the same inputs (random tensors,
+a synthetic photo and any images found in uploads/<species>_emotions)
+through the original detector and the ONNX Runtime detector. The
+script exits non-zero if probabilities drift beyond --tolerance or the
+predicted class ever differs.
+"""
+
+import argparse
+import glob
+import inspect
+import os
+import sys
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAINED_DIR = os.path.join(BACKEND_DIR, "app", "trained")
+UPLOADS_DIR = os.path.join(BACKEND_DIR, "app", "uploads")
+
+OPSET = 17
+
+
+def export_cat(model_path, output_path):
+    """Export the ResNet18 state_dict to ONNX with a dynamic batch dimension"""
+    import torch
+    from app.services.cat_emotion_service import CatEmotionDetector
+
+    detector = CatEmotionDetector(model_path=model_path)
+    dummy = torch.zeros(1, 3, 224, 224)
+    options = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # torch >= 2.5: keep the TorchScript exporter (dynamic_axes, opset 17)
+        options["dynamo"] = False
+    torch.onnx.export(
+        detector.model.cpu(),
+        dummy,
+        output_path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=OPSET,
+        **options,
+    )
+    print(f"✅ Cat model exported to {output_path}")
+    return detector
+
+
+def export_dog(model_path, output_path):
+    """Export the Keras model to ONNX with a dynamic batch dimension"""
+    import tensorflow as tf
+    from app.services.dog_emotion_service import DogEmotionDetector
+
+    detector = DogEmotionDetector(model_path=model_path)
+    signature = [tf.TensorSpec([None, 224, 224, 3], tf.float32, name="input")]
+    try:
+        import tf2onnx
+        tf2onnx.convert.from_keras(detector.model, input_signature=signature, opset=OPSET, output_path=output_path)
+    except Exception as e:
+        # Keras 3 models are not always understood by tf2onnx; Keras can export them itself
+        print(f"⚠️  tf2onnx conversion failed ({e}), falling back to model.export")
+        detector.model.export(output_path, format="onnx", input_signature=signature)
+    print(f"✅ Dog model exported to {output_path}")
+    return detector
+
+
+def parity_inputs(species, num_random=8):
+    """Random tensors plus a synthetic photo and any stored uploads, preprocessed for the species"""
+    from app.services.preprocessing import input_shape, load_image, resize_image, write_input
+    from benchmarks.common import make_synthetic_jpeg
+
+    rng = np.random.default_rng(0)
+    high = 1.0 if species == "cat" else 255.0
+    batches = [rng.uniform(0, high, size=input_shape(species, num_random)).astype(np.float32)]
+
+    images = [load_image(make_synthetic_jpeg())]
+    for path in sorted(glob.glob(os.path.join(UPLOADS_DIR, f"{species}_emotions", "*")))[:32]:
+        try:
+            images.append(load_image(path))
+        except Exception:
+            continue
+
+    real = np.empty(input_shape(species, len(images)), dtype=np.float32)
+    for i, img in enumerate(images):
+        write_input(species, resize_image(species, img), real[i])
+    batches.append(real)
+    return np.concatenate(batches)
+
+
+def check_parity(species, original, exported, tolerance):
+    """Compare full-pipeline probabilities of the original and the ONNX detector"""
+    inputs = parity_inputs(species)
+    expected = original.predict_preprocessed(inputs)
+    actual = exported.predict_preprocessed(inputs)
+
+    max_diff = 0.0
+    mismatches = 0
+    for want, got in zip(expected, actual):
+        diffs = [abs(want["all_probabilities"][c] - got["all_probabilities"][c]) for c in want["all_probabilities"]]
+        max_diff = max(max_diff, max(diffs))
+        mismatches += want["emotion"] != got["emotion"]
+
+    ok = max_diff <= tolerance and mismatches == 0
+    status = "✅" if ok else "❌"
+    print(f"{status} {species}: {len(inputs)} inputs, max |Δp| = {max_diff:.2e}, top-1 mismatches = {mismatches}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", choices=["cat", "dog"], help="Export a single model")
+    parser.add_argument("--cat-model", default=os.path.join(TRAINED_DIR, "cat_resnet18.pth"))
+    parser.add_argument("--dog-model", default=os.path.join(TRAINED_DIR, "dog.h5"))
+    parser.add_argument("--output-dir", default=TRAINED_DIR)
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="Max allowed probability difference")
+    args = parser.parse_args()
+
+    from app.services.cat_emotion_service import CatEmotionDetector
+    from app.services.dog_emotion_service import DogEmotionDetector
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    all_ok = True
+
+    if args.only in (None, "cat"):
+        output_path = os.path.join(args.output_dir, "cat_resnet18.onnx")
+        original = export_cat(args.cat_model, output_path)
+        exported = CatEmotionDetector(model_path=output_path, backend="onnx")
+        all_ok &= check_parity("cat", original, exported, args.tolerance)
+
+    if args.only in (None, "dog"):
+        output_path = os.path.join(args.output_dir, "dog.onnx")
+        original = export_dog(args.dog_model, output_path)
+        exported = DogEmotionDetector(model_path=output_path, backend="onnx")
+        all_ok &= check_parity("dog", original, exported, args.tolerance)
+
+    if not all_ok:
+        print("❌ Parity check failed - do not deploy the exported models")
+        sys.exit(1)
+    print("🎉 All exported models match the originals")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Post-training int8 quantization of the cat and dog emotion models.
+
+Works on the fp32 ONNX exports produced by export_onnx_models.py, so one
+toolchain (ONNX Runtime) covers both the PyTorch ResNet18 and the Keras
+EfficientNet-B0. For each model it writes:
+
+    app/trained/<name>.int8-dynamic.onnx   weights int8, activations quantized on the fly
+    app/trained/<name>.int8-static.onnx    weights + activations int8, calibrated (QDQ)
+
+Static quantization is calibrated on the photos already stored in
+uploads/cat_emotions and uploads/dog_emotions. Images are split into a
+calibration set and a held-out evaluation set. Every variant is then
+compared against the fp32 model on the held-out images: top-1
+agreement, probability drift, latency and memory.
+
+Run from the backend/ folder:
+    python export_onnx_models.py      # once, to get the fp32 .onnx files
+    python quantize_models.py
+    python quantize_models.py --only dog --report quantization_report.json
+
+Serve a variant with INFERENCE_BACKEND=onnx and ONNX_MODEL_VARIANT=int8-static
+(or int8-dynamic).
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAINED_DIR = os.path.join(BACKEND_DIR, "app", "trained")
+UPLOADS_DIR = os.path.join(BACKEND_DIR, "app", "uploads")
+
+MODEL_NAMES = {
+    "cat": "cat_resnet18",
+    "dog": "dog",
+}
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")
+
+
+def load_images(species, limit):
+    """Preprocess up to `limit` stored uploads of a species into one float32 batch"""
+    from app.services.preprocessing import input_shape, load_image, resize_image, write_input
+
+    folder = os.path.join(UPLOADS_DIR, f"{species}_emotions")
+    paths = sorted(
+        p for p in glob.glob(os.path.join(folder, "**", "*"), recursive=True)
+        if p.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+
+    images = []
+    for path in paths:
+        try:
+            images.append(resize_image(species, load_image(path)))
+        except Exception:
+            continue
+
+    batch = np.empty(input_shape(species, len(images)), dtype=np.float32)
+    for i, img in enumerate(images):
+        write_input(species, img, batch[i])
+    return batch
+
+
+def synthetic_images(species, count):
+    """Stand-in calibration data for trying the pipeline on a machine without uploads"""
+    from app.services.preprocessing import input_shape, load_image, resize_image, write_input
+    from benchmarks.common import make_synthetic_jpeg
+
+    batch = np.empty(input_shape(species, count), dtype=np.float32)
+    for i in range(count):
+        img = load_image(make_synthetic_jpeg(640, 480, seed=i))
+        write_input(species, resize_image(species, img), batch[i])
+    return batch
+
+
+class BatchCalibrationReader:
+    """onnxruntime CalibrationDataReader feeding one preprocessed image at a time"""
+
+    def __init__(self, input_name, images):
+        self.input_name = input_name
+        self.images = images
+        self.index = 0
+
+    def get_next(self):
+        if self.index >= len(self.images):
+            return None
+        sample = self.images[self.index:self.index + 1]
+        self.index += 1
+        return {self.input_name: sample}
+
+    def rewind(self):
+        self.index = 0
+
+
+def quantize(species, fp32_path, calibration):
+    """Write the dynamic and static int8 variants next to the fp32 model"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import (
+        CalibrationMethod, QuantFormat, QuantType, quantize_dynamic, quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    from app.services.onnx_backend import model_variant_path
+
+    dynamic_path = model_variant_path(fp32_path, "int8-dynamic")
+    static_path = model_variant_path(fp32_path, "int8-static")
+    prepared_path = model_variant_path(fp32_path, "prep")
+
+    # Shape inference + graph cleanup makes both quantizers far more effective
+    quant_pre_process(fp32_path, prepared_path, skip_symbolic_shape=True)
+
+    quantize_dynamic(prepared_path, dynamic_path, weight_type=QuantType.QInt8)
+    print(f"✅ {species}: dynamic int8 -> {dynamic_path}")
+
+    input_name = ort.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    quantize_static(
+        prepared_path,
+        static_path,
+        BatchCalibrationReader(input_name, calibration),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    print(f"✅ {species}: static int8 ({len(calibration)} calibration images) -> {static_path}")
+
+    os.remove(prepared_path)
+    return {"int8-dynamic": dynamic_path, "int8-static": static_path}
+
+
+def peak_rss_mb(species, path):
+    """
+    Peak RSS of a fresh process that loads the variant and runs one image
+
+    Measured in a child process so variants do not share allocator arenas
+    or one-off runtime initialisation.
+    """
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--measure-memory", species, path],
+        capture_output=True, text=True, cwd=BACKEND_DIR,
+    )
+    try:
+        return float(result.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return 0.0
+
+
+def _measure_memory(species, path):
+    from app.services.cat_emotion_service import CatEmotionDetector
+    from app.services.dog_emotion_service import DogEmotionDetector
+    from app.services.preprocessing import input_shape
+
+    detector_cls = CatEmotionDetector if species == "cat" else DogEmotionDetector
+    detector = detector_cls(model_path=path, backend="onnx")
+    detector.predict_preprocessed(np.zeros(input_shape(species, 1), dtype=np.float32))
+    # VmHWM rather than ru_maxrss, which can carry over the parent's peak across fork+exec
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                print(int(line.split()[1]) / 1024.0)
+
+
+def evaluate(species, path, images, iterations):
+    """Run the full detector on held-out images and time single-image inference"""
+    from app.services.cat_emotion_service import CatEmotionDetector
+    from app.services.dog_emotion_service import DogEmotionDetector
+
+    detector_cls = CatEmotionDetector if species == "cat" else DogEmotionDetector
+    detector = detector_cls(model_path=path, backend="onnx")
+
+    results = detector.predict_preprocessed(images)
+
+    samples = []
+    single = images[:1]
+    detector.predict_preprocessed(single)
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        detector.predict_preprocessed(single)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+
+    return {
+        "results": results,
+        "latency_ms": float(np.median(samples)),
+        "file_mb": os.path.getsize(path) / 1e6,
+        "peak_rss_mb": peak_rss_mb(species, path),
+    }
+
+
+def compare(species, fp32_path, variants, images, iterations):
+    """Accuracy drift, latency and memory of every variant relative to fp32"""
+    baseline = evaluate(species, fp32_path, images, iterations)
+    report = {"fp32": _summary(baseline, baseline)}
+    for name, path in variants.items():
+        report[name] = _summary(evaluate(species, path, images, iterations), baseline)
+
+    print(f"\n{species} ({len(images)} held-out images)")
+    print(f"{'variant':14s} {'top-1 agree':>11s} {'mean |Δp|':>10s} {'max |Δp|':>9s} "
+          f"{'ms/img':>7s} {'speedup':>8s} {'file MB':>8s} {'peak RSS MB':>12s}")
+    for name, row in report.items():
+        print(f"{name:14s} {row['top1_agreement'] * 100:10.1f}% {row['mean_abs_prob_diff']:10.4f} "
+              f"{row['max_abs_prob_diff']:9.4f} {row['latency_ms']:7.2f} {row['speedup']:7.2f}x "
+              f"{row['file_mb']:8.1f} {row['peak_rss_mb']:12.1f}")
+    return report
+
+
+def _summary(run, baseline):
+    agree = 0
+    diffs = []
+    for want, got in zip(baseline["results"], run["results"]):
+        agree += want["emotion"] == got["emotion"]
+        diffs.extend(abs(want["all_probabilities"][c] - got["all_probabilities"][c]) for c in want["all_probabilities"])
+    total = max(1, len(baseline["results"]))
+    return {
+        "top1_agreement": agree / total,
+        "mean_abs_prob_diff": float(np.mean(diffs)) if diffs else 0.0,
+        "max_abs_prob_diff": float(np.max(diffs)) if diffs else 0.0,
+        "latency_ms": run["latency_ms"],
+        "speedup": baseline["latency_ms"] / run["latency_ms"] if run["latency_ms"] else 0.0,
+        "file_mb": run["file_mb"],
+        "peak_rss_mb": run["peak_rss_mb"],
+    }
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--measure-memory":
+        _measure_memory(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", choices=["cat", "dog"], help="Quantize a single model")
+    parser.add_argument("--model-dir", default=TRAINED_DIR, help="Folder holding the fp32 .onnx exports")
+    parser.add_argument("--max-images", type=int, default=400, help="Stored uploads to use per species")
+    parser.add_argument("--calibration-split", type=float, default=0.5,
+                        help="Fraction of images used for calibration, the rest is held out")
+    parser.add_argument("--iterations", type=int, default=30, help="Timed single-image runs per variant")
+    parser.add_argument("--allow-synthetic", action="store_true",
+                        help="Use synthetic photos when no uploads are found (pipeline smoke test only)")
+    parser.add_argument("--report", help="Write the comparison as JSON to this path")
+    args = parser.parse_args()
+
+    full_report = {}
+    for species in ("cat", "dog"):
+        if args.only and args.only != species:
+            continue
+
+        fp32_path = os.path.join(args.model_dir, f"{MODEL_NAMES[species]}.onnx")
+        if not os.path.exists(fp32_path):
+            print(f"❌ {fp32_path} not found - run export_onnx_models.py first")
+            sys.exit(1)
+
+        images = load_images(species, args.max_images)
+        if len(images) < 2:
+            if not args.allow_synthetic:
+                print(f"❌ Need at least 2 images in uploads/{species}_emotions for calibration "
+                      f"(or pass --allow-synthetic)")
+                sys.exit(1)
+            print(f"⚠️  No stored {species} uploads, calibrating on synthetic images - drift numbers are not meaningful")
+            images = synthetic_images(species, 16)
+
+        split = max(1, min(len(images) - 1, int(len(images) * args.calibration_split)))
+        calibration, held_out = images[:split], images[split:]
+
+        variants = quantize(species, fp32_path, calibration)
+        full_report[species] = compare(species, fp32_path, variants, held_out, args.iterations)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(full_report, f, indent=2)
+        print(f"\n📝 Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import pytest
+
+from app.services.clip_analysis import _aggregate, _sampled_frames
+
+
+def frames_of(durations):
+    """(timestamp, seconds, get_rgb) for frames shown back to back"""
+    timestamp = 0.0
+    for seconds in durations:
+        yield timestamp, seconds, None
+        timestamp += seconds
+
+
+def sample(durations, sample_fps=1, max_seconds=60, max_frames=120):
+    sampled, state = _sampled_frames(frames_of(durations), sample_fps, max_seconds, max_frames)
+    picked = [(frame_index, timestamp) for frame_index, timestamp, _ in sampled]
+    return picked, state
+
+
+def test_samples_the_frame_shown_at_each_tick():
+    picked, state = sample([0.25] * 8)
+
+    assert picked == [(0, 0.0), (4, 1.0)]
+    assert state == {"duration": 2.0, "truncated": False}
+
+
+def test_frame_spanning_several_ticks_is_sampled_once():
+    picked, state = sample([3.0, 0.25, 0.25])
+
+    assert picked == [(0, 0.0), (1, 3.0)]
+    assert state["duration"] == 3.5
+
+
+def test_stops_at_max_seconds():
+    picked, state = sample([0.5] * 10, max_seconds=2)
+
+    assert [frame_index for frame_index, _ in picked] == [0, 2]
+    assert state == {"duration": 2.0, "truncated": True}
+
+
+def test_stops_at_max_frames():
+    picked, state = sample([1.0] * 10, max_frames=3)
+
+    assert [frame_index for frame_index, _ in picked] == [0, 1, 2]
+    assert state["truncated"] is True
+
+
+def prediction(emotion, classes=("happy", "sad")):
+    return {
+        "success": True,
+        "emotion": emotion,
+        "confidence": 1.0,
+        "all_probabilities": {name: float(name == emotion) for name in classes},
+        "model_version": "v1",
+    }
+
+
+def test_aggregate_weights_frames_by_duration_and_reuses_duplicates():
+    entries = [
+        {"frame": 0, "timestamp": 0.0, "prediction": 0},
+        {"frame": 1, "timestamp": 1.0, "duplicate_of": 0},
+        {"frame": 3, "timestamp": 3.0, "prediction": 1},
+    ]
+    result = _aggregate(entries, [prediction("happy"), prediction("sad")], {"duration": 4.0, "truncated": False})
+
+    assert result["success"] is True
+    assert result["emotion"] == "happy"
+    assert result["all_probabilities"] == pytest.approx({"happy": 0.75, "sad": 0.25})
+    assert result["model_version"] == "v1"
+    assert (result["frames_sampled"], result["frames_analysed"], result["duplicates_skipped"]) == (3, 2, 1)
+    assert [frame["emotion"] for frame in result["frames"]] == ["happy", "happy", "sad"]
+    assert result["segments"] == [
+        {"emotion": "happy", "start": 0.0, "end": 3.0},
+        {"emotion": "sad", "start": 3.0, "end": 4.0},
+    ]
+
+
+def test_aggregate_leaves_failed_frames_out_of_the_mean():
+    entries = [
+        {"frame": 0, "timestamp": 0.0, "prediction": 0},
+        {"frame": 1, "timestamp": 1.0, "prediction": 1},
+    ]
+    failed = {"success": False, "error": "bad frame"}
+    result = _aggregate(entries, [failed, prediction("sad")], {"duration": 2.0, "truncated": True})
+
+    assert result["emotion"] == "sad"
+    assert result["confidence"] == pytest.approx(1.0)
+    assert result["truncated"] is True
+    assert result["frames"][0] == {"frame": 0, "timestamp": 0.0, "success": False, "error": "bad frame"}
+
+
+def test_aggregate_fails_when_no_frame_was_predicted():
+    entries = [{"frame": 0, "timestamp": 0.0, "prediction": 0}]
+    result = _aggregate(entries, [{"success": False, "error": "model not loaded"}], {"duration": 1.0, "truncated": False})
+
+    assert result == {"success": False, "error": "model not loaded"}
@@ -0,0 +1,111 @@
+import json
+
+import pytest
+from flask import Flask
+
+from app import db
+from app.models import CatEmotionHistory, DogEmotionHistory
+from app.services import history_writer
+from app.services.history_writer import HistoryWriter, _has_consecutive_ids, _insert_rows, record_history
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'history.sqlite3'}"
+    db.init_app(app)
+    with app.app_context():
+        db.metadata.create_all(db.engine, tables=[CatEmotionHistory.__table__, DogEmotionHistory.__table__])
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def row(emotion="happy", **values):
+    return {"pet_id": 1, "emotion": emotion, "confidence": 0.9,
+            "probabilities": json.dumps({emotion: 0.9}), **values}
+
+
+def saved_emotions(model):
+    return {record.id: record.emotion for record in model.query.all()}
+
+
+def test_batch_insert_returns_ids_in_row_order(app):
+    ids = _insert_rows(db.session, CatEmotionHistory, [row("happy"), row("sad"), row("angry", image_url="a.jpg")])
+    db.session.commit()
+
+    assert saved_emotions(CatEmotionHistory) == dict(zip(ids, ["happy", "sad", "angry"]))
+
+
+def test_insert_without_sorted_returning_uses_one_statement_per_row(app, monkeypatch):
+    # SQLAlchemy < 2.0 has no insert_executemany_returning_sort_by_parameter_order
+    monkeypatch.delattr(db.session.get_bind().dialect, "insert_executemany_returning_sort_by_parameter_order")
+
+    ids = _insert_rows(db.session, CatEmotionHistory, [row("happy"), row("sad")])
+    db.session.commit()
+
+    assert saved_emotions(CatEmotionHistory) == dict(zip(ids, ["happy", "sad"]))
+
+
+class FakeMySQLSession:
+    def __init__(self, increment, offset):
+        self.settings = (increment, offset)
+        self.queries = 0
+
+    def get_bind(self):
+        return self
+
+    def execute(self, statement):
+        self.queries += 1
+        return self
+
+    def one(self):
+        return self.settings
+
+
+@pytest.mark.parametrize("increment, offset, consecutive", [(1, 1, True), (2, 1, False), (3, 2, False)])
+def test_mysql_ids_are_derived_only_with_a_unit_auto_increment(monkeypatch, increment, offset, consecutive):
+    monkeypatch.setattr(history_writer, "_consecutive_ids", {})
+    session = FakeMySQLSession(increment, offset)
+
+    assert _has_consecutive_ids(session) is consecutive
+    assert _has_consecutive_ids(session) is consecutive
+    assert session.queries == 1
+
+
+def test_failed_batch_is_retried_row_by_row(app):
+    writer = HistoryWriter(app, max_batch_size=3, max_wait_ms=1000)
+    futures = [
+        writer.submit(CatEmotionHistory, row("happy")),
+        writer.submit(CatEmotionHistory, row("sad", probabilities=None)),  # NOT NULL violation
+        writer.submit(DogEmotionHistory, row("relaxed")),
+    ]
+    writer.flush()
+
+    cat_id = futures[0].result(timeout=10)
+    with pytest.raises(Exception):
+        futures[1].result(timeout=10)
+    dog_id = futures[2].result(timeout=10)
+
+    assert saved_emotions(CatEmotionHistory) == {cat_id: "happy"}
+    assert saved_emotions(DogEmotionHistory) == {dog_id: "relaxed"}
+    stats = writer.stats()
+    assert (stats["rows"], stats["failed"]) == (2, 1)
+
+
+def test_group_commit_answers_with_the_row_id(app, monkeypatch):
+    monkeypatch.setattr(history_writer, "_writer_instance", None)
+    app.config.update(HISTORY_GROUP_COMMIT=True, HISTORY_COMMIT_WAIT=True, HISTORY_BATCH_MAX_WAIT_MS=1)
+
+    record = record_history(CatEmotionHistory, **row("happy"))
+
+    assert saved_emotions(CatEmotionHistory) == {record["id"]: "happy"}
+    assert record["created_at"]
+
+
+def test_direct_insert_when_group_commit_is_off(app):
+    app.config["HISTORY_GROUP_COMMIT"] = False
+
+    record = record_history(DogEmotionHistory, **row("sad"))
+
+    assert saved_emotions(DogEmotionHistory) == {record["id"]: "sad"}
@@ -0,0 +1,69 @@
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+from app.services.inference_client import InferenceClient, RemoteEmotionDetector
+from app.services.inference_server import InferenceServer
+from app.services.preprocessing import resize_image
+
+
+class FakeDetector:
+    classes = ["happy", "sad"]
+    model_version = "v1"
+
+    def predict_preprocessed(self, batch):
+        return [{"success": True, "emotion": "happy", "model_version": self.model_version} for _ in batch]
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = InferenceServer(str(tmp_path / "inference.sock"), {"cat": FakeDetector()})
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def shm_segments():
+    return set(os.listdir("/dev/shm"))
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="needs /dev/shm")
+def test_short_lived_request_threads_reuse_pooled_segments(server):
+    client = InferenceClient(server.server_address, max_idle_segments=2)
+    detector = RemoteEmotionDetector("cat", client)
+    image = resize_image("cat", Image.new("RGB", (64, 64)))
+    before = shm_segments()
+
+    for _ in range(20):
+        thread = threading.Thread(target=detector.predict_images, args=([image],))
+        thread.start()
+        thread.join()
+
+    assert len(shm_segments() - before) <= 2
+    client.close_segments()
+    assert shm_segments() - before == set()
+
+
+def test_model_version_follows_a_swap_on_the_server(server):
+    detector = RemoteEmotionDetector("cat", InferenceClient(server.server_address))
+    image = resize_image("cat", Image.new("RGB", (64, 64)))
+    assert detector.model_version == "v1"
+
+    server.detectors["cat"].model_version = "v2"
+    assert detector.predict_images([image])[0]["model_version"] == "v2"
+    assert detector.model_version == "v2"
+    detector.client.close_segments()
+
+
+def test_reconnect_refetches_detector_info(server):
+    client = InferenceClient(server.server_address)
+    detector = RemoteEmotionDetector("cat", client)
+    assert detector.model_version == "v1"
+
+    server.detectors["cat"].model_version = "v2"
+    client.reconnects += 1
+    assert detector.model_version == "v2"
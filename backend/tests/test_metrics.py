@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.services.metrics import _merge, render_metrics
+
+
+@pytest.fixture(scope="module")
+def dead_pid():
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    return child.pid
+
+
+def write_process_file(directory, pid, metrics):
+    with open(os.path.join(directory, f"metrics-{pid}.json"), "w") as f:
+        json.dump({"pid": pid, "metrics": metrics}, f)
+
+
+def histogram(values, buckets=(0.1, 1.0)):
+    return {"kind": "histogram", "help": "Latency", "labelnames": ["species"], "buckets": list(buckets),
+            "mode": "sum", "values": values}
+
+
+def gauge(values, mode="sum"):
+    return {"kind": "gauge", "help": "Depth", "labelnames": ["species"], "buckets": None,
+            "mode": mode, "values": values}
+
+
+def counter(values, kind="counter"):
+    return {"kind": kind, "help": "Errors", "labelnames": ["route"], "buckets": None,
+            "mode": "sum", "values": values}
+
+
+def test_merge_sums_counters_and_histograms_of_every_process(tmp_path, dead_pid):
+    write_process_file(tmp_path, os.getpid(), {
+        "latency": histogram([[["cat"], [1, 2, 0, 0.9]]]),
+        "errors_total": counter([[["detect"], [3]]]),
+    })
+    write_process_file(tmp_path, dead_pid, {
+        "latency": histogram([[["cat"], [0, 1, 1, 2.5]], [["dog"], [1, 0, 0, 0.05]]]),
+        "errors_total": counter([[["detect"], [2]]]),
+    })
+
+    merged = _merge(tmp_path)
+
+    assert merged["latency"]["values"] == {("cat",): [1, 3, 1, 3.4], ("dog",): [1, 0, 0, 0.05]}
+    assert merged["errors_total"]["values"] == {("detect",): 5}
+
+
+def test_merge_only_counts_gauges_of_live_processes(tmp_path, dead_pid):
+    write_process_file(tmp_path, os.getpid(), {"depth": gauge([[["cat"], 2]]), "load": gauge([[["cat"], 1.5]], "max")})
+    write_process_file(tmp_path, dead_pid, {"depth": gauge([[["cat"], 7]]), "load": gauge([[["cat"], 9.0]], "max")})
+
+    merged = _merge(tmp_path)
+
+    assert merged["depth"]["values"] == {("cat",): 2}
+    assert merged["load"]["values"] == {("cat",): 1.5}
+
+
+def test_merge_combines_live_gauges_by_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.services.metrics._process_alive", lambda pid: True)
+    write_process_file(tmp_path, 101, {"depth": gauge([[["cat"], 2]]), "load": gauge([[["cat"], 1.5]], "max")})
+    write_process_file(tmp_path, 102, {"depth": gauge([[["cat"], 3]]), "load": gauge([[["cat"], 4.0]], "max")})
+
+    merged = _merge(tmp_path)
+
+    assert merged["depth"]["values"] == {("cat",): 5}
+    assert merged["load"]["values"] == {("cat",): 4.0}
+
+
+def test_merge_skips_unreadable_files(tmp_path):
+    (tmp_path / "metrics-1.json").write_text("{truncated")
+
+    assert _merge(tmp_path) == {}
+
+
+def test_render_histogram_buckets_are_cumulative(tmp_path):
+    write_process_file(tmp_path, os.getpid(), {"latency_seconds": histogram([[["cat"], [1, 2, 3, 4.5]]])})
+
+    lines = render_metrics(tmp_path).splitlines()
+
+    assert lines[:2] == ["# HELP latency_seconds Latency", "# TYPE latency_seconds histogram"]
+    assert lines[2:] == [
+        'latency_seconds_bucket{species="cat",le="0.1"} 1',
+        'latency_seconds_bucket{species="cat",le="1.0"} 3',
+        'latency_seconds_bucket{species="cat",le="+Inf"} 6',
+        'latency_seconds_sum{species="cat"} 4.5',
+        'latency_seconds_count{species="cat"} 6',
+    ]
+
+
+def test_render_counters_gauges_and_label_escaping(tmp_path):
+    write_process_file(tmp_path, os.getpid(), {
+        "cache_lookups": counter([[['say "hi"\\'], 4]], kind="collected_counter"),
+        "errors_total": counter([[["detect"], [1]]]),
+        "queue_depth": gauge([[["cat"], 2]]),
+    })
+
+    text = render_metrics(tmp_path)
+
+    assert "# TYPE cache_lookups counter\n" in text
+    assert 'cache_lookups_total{route="say \\"hi\\"\\\\"} 4\n' in text
+    assert 'errors_total{route="detect"} 1\n' in text
+    assert 'queue_depth{species="cat"} 2\n' in text
@@ -0,0 +1,60 @@
+import pytest
+
+from app.services import model_preload
+from app.services.model_preload import expect_warmup, is_ready, model_status, record_load, record_warmup
+
+
+@pytest.fixture(autouse=True)
+def fresh_status(monkeypatch):
+    monkeypatch.setattr(model_preload, "_status", {species: {"state": "not_loaded"} for species in model_preload.SPECIES})
+    monkeypatch.setattr(model_preload, "_warmup_pending", set())
+
+
+def test_lazy_load_is_ready_once_loaded():
+    record_load("cat", 1.5)
+
+    assert model_status("cat")["state"] == "ready"
+
+
+def test_preloaded_model_is_ready_only_after_warmup():
+    expect_warmup("cat")
+    record_load("cat", 1.5)
+    assert model_status("cat")["state"] == "loaded"
+    assert not is_ready(("cat",))
+
+    record_warmup("cat", {"1": {"first_ms": 90.0, "warm_ms": 12.0}})
+    assert model_status("cat")["state"] == "ready"
+    assert is_ready(("cat",))
+
+
+def test_model_loaded_before_the_fork_waits_for_the_worker_warmup():
+    record_load("dog", 3.0)  # prefork master, no warmup there
+    expect_warmup("dog")
+
+    assert model_status("dog")["state"] == "loaded"
+
+
+def test_preload_reports_loaded_while_warming(monkeypatch):
+    class Detector:
+        def predict_preprocessed(self, batch):
+            return []
+
+    def load(species):
+        record_load(species, 0.1)
+        return Detector()
+
+    seen = []
+    monkeypatch.setattr(model_preload, "_load_local", load)
+    monkeypatch.setattr(model_preload, "warm_up", lambda *args: seen.append(model_status("cat")["state"]) or {})
+
+    model_preload._preload("cat", (1,), 1)
+
+    assert seen == ["warming_up"]
+    assert model_status("cat")["state"] == "ready"
+
+
+def test_failed_load_is_reported():
+    expect_warmup("dog")
+    record_load("dog", 0.2, error=OSError("dog.h5 missing"))
+
+    assert model_status("dog") == {"state": "failed", "load_seconds": 0.2, "error": "dog.h5 missing"}
@@ -0,0 +1,121 @@
+import io
+import threading
+import time
+
+from app.services.prediction_cache import CachedDetector, PredictionCache
+
+
+class FakeDetector:
+    def __init__(self, model_version="v1"):
+        self.model_version = model_version
+        self.calls = 0
+
+    def predict_from_bytes(self, image_bytes):
+        self.calls += 1
+        return {"success": True, "emotion": "happy", "size": len(image_bytes)}
+
+    def predict_batch_from_bytes(self, images_bytes):
+        return [self.predict_from_bytes(data) for data in images_bytes]
+
+
+def test_key_covers_species_model_version_and_content():
+    cache = PredictionCache()
+    cat = CachedDetector("cat", FakeDetector("v1"), cache)
+    key = cat.cache_key(b"photo")
+
+    assert key.startswith("cat:v1:")
+    assert cat.cache_key(b"photo") == key
+    assert cat.cache_key(b"other photo") != key
+    assert CachedDetector("dog", FakeDetector("v1"), cache).cache_key(b"photo") != key
+    assert CachedDetector("cat", FakeDetector("v2"), cache).cache_key(b"photo") != key
+
+
+def test_key_of_a_stream_matches_its_bytes_and_rewinds_it():
+    detector = CachedDetector("cat", FakeDetector(), PredictionCache())
+    stream = io.BytesIO(b"photo" * 30000)
+
+    assert detector.cache_key(stream) == detector.cache_key(b"photo" * 30000)
+    assert stream.tell() == 0
+
+
+def test_repeated_upload_is_answered_from_the_cache():
+    fake = FakeDetector()
+    detector = CachedDetector("cat", fake, PredictionCache())
+
+    first = detector.predict_from_bytes(b"photo")
+    second = detector.predict_from_bytes(b"photo")
+
+    assert second == first
+    assert fake.calls == 1
+    assert detector.cache.stats()["hits"] == 1
+
+
+def test_batch_only_computes_missing_images():
+    fake = FakeDetector()
+    detector = CachedDetector("cat", fake, PredictionCache())
+    detector.predict_from_bytes(b"a")
+
+    results = detector.predict_batch_from_bytes([b"a", b"bb", b"a"])
+
+    assert [r["size"] for r in results] == [1, 2, 1]
+    assert fake.calls == 2
+
+
+def test_entries_expire_after_ttl():
+    cache = PredictionCache(ttl_seconds=0)
+    cache.store("k", {"success": True})
+
+    assert cache.lookup("k") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(max_entries=2)
+    cache.store("a", {"success": True})
+    cache.store("b", {"success": True})
+    cache.lookup("a")
+    cache.store("c", {"success": True})
+
+    assert cache.lookup("b") is None
+    assert cache.lookup("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_failures_are_shared_but_not_cached():
+    cache = PredictionCache()
+
+    def fail():
+        raise RuntimeError("model not loaded")
+
+    assert cache.get_or_compute("k", fail) == {"success": False, "error": "model not loaded"}
+    assert cache.get_or_compute("k", lambda: {"success": True}) == {"success": True}
+
+
+def test_concurrent_requests_for_one_key_compute_once():
+    cache = PredictionCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return {"success": True}
+
+    waiters = 4
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+        for _ in range(waiters + 1)
+    ]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + 5
+    while cache.stats()["coalesced"] < waiters and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(calls) == 1
+    assert results == [{"success": True}] * (waiters + 1)
+    assert cache.stats()["coalesced"] == waiters
@@ -0,0 +1,71 @@
+import hashlib
+import io
+import os
+import stat
+
+import pytest
+
+from app.services.upload_store import UploadStore, is_content_name
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / "pets_data"), str(tmp_path / "index" / "uploads.sqlite3"))
+
+
+def test_put_names_files_by_content(store):
+    name = store.put(b"photo", "jpg")
+    digest = hashlib.sha256(b"photo").hexdigest()
+
+    assert name == f"{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+    assert is_content_name(name)
+    with open(store.path(name), "rb") as f:
+        assert f.read() == b"photo"
+    assert stat.S_IMODE(os.stat(store.path(name)).st_mode) == 0o644
+    assert os.listdir(store.temp_dir) == []
+
+
+def test_same_content_is_stored_once_and_counted(store):
+    first = store.put(b"photo", "jpg")
+    second = store.put(io.BytesIO(b"photo"), "jpg")
+
+    assert first == second
+    assert store.refs(first) == 2
+    assert store.stats() == {"files": 1, "references": 2, "bytes": 5}
+
+
+def test_last_release_deletes_the_file_and_its_derived_files(store):
+    name = store.put(b"photo", "jpg")
+    store.put(b"photo", "jpg")
+    cleaned = []
+
+    assert store.release(name, cleanup=cleaned.append) is False
+    assert os.path.exists(store.path(name))
+    assert cleaned == []
+
+    assert store.release(name, cleanup=cleaned.append) is True
+    assert not os.path.exists(store.path(name))
+    assert cleaned == [store.path(name)]
+    assert store.refs(name) == 0
+    # emptied shard directories are pruned
+    assert sorted(os.listdir(store.root)) == [".tmp"]
+
+
+def test_legacy_flat_names_count_as_one_reference(store):
+    with open(os.path.join(store.root, "old-uuid.jpg"), "wb") as f:
+        f.write(b"photo")
+
+    assert store.release("old-uuid.jpg") is True
+    assert not os.path.exists(os.path.join(store.root, "old-uuid.jpg"))
+
+
+def test_names_outside_the_folder_are_ignored(store):
+    assert store.path("../index/uploads.sqlite3") is None
+    assert store.release("../index/uploads.sqlite3") is False
+
+
+def test_put_async_resolves_to_the_stored_name(store):
+    name = store.put_async(b"clip bytes", "mp4").result(timeout=10)
+
+    assert store.refs(name) == 1
+    assert name.endswith(".mp4")
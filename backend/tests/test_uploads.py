@@ -0,0 +1,140 @@
+import io
+
+import pytest
+from flask import Flask
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from app.services.uploads import (
+    MB,
+    IMAGE_FORMATS,
+    UploadError,
+    UploadSpool,
+    _MemoryBudget,
+    check_upload,
+    sniff_format,
+)
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\0" * 12
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 8
+MP4 = b"\0\0\0\x18ftypmp42" + b"\0" * 4
+
+
+@pytest.mark.parametrize("head, expected", [
+    (JPEG, "jpeg"),
+    (PNG, "png"),
+    (b"GIF89a" + b"\0" * 10, "gif"),
+    (b"RIFF\0\0\0\0WEBPVP8 ", "webp"),
+    (b"RIFF\0\0\0\0AVI LIST", "avi"),
+    (b"BM" + b"\0" * 14, "bmp"),
+    (MP4, "mp4"),
+    (b"\x1a\x45\xdf\xa3" + b"\0" * 12, "matroska"),
+    (b"%PDF-1.7\n" + b"\0" * 7, None),
+    (b"", None),
+])
+def test_sniff_format(head, expected):
+    assert sniff_format(head) == expected
+
+
+def spool(budget=MB, image_limit=100, clip_limit=1000):
+    return UploadSpool(_MemoryBudget(budget), image_limit, clip_limit)
+
+
+def test_spool_sniffs_across_small_writes():
+    upload = spool()
+    for byte in JPEG:
+        upload.write(bytes([byte]))
+
+    assert upload.format == "jpeg"
+    assert upload.error is None
+    upload.seek(0)
+    assert upload.read() == JPEG
+
+
+def test_spool_rejects_unsupported_files_without_keeping_them():
+    upload = spool()
+    upload.write(b"%PDF-1.7\n" + b"x" * 200)
+
+    assert upload.error == "unsupported"
+    assert upload.size == 209
+    upload.seek(0)
+    assert upload.read() == b""
+
+
+def test_spool_caps_images_and_clips_separately():
+    image = spool()
+    image.write(JPEG)
+    image.write(b"x" * 100)
+    assert image.error == "too_large"
+
+    clip = spool()
+    clip.write(MP4)
+    clip.write(b"x" * 100)
+    assert clip.error is None
+    clip.write(b"x" * 1000)
+    assert clip.error == "too_large"
+
+
+def test_short_file_gets_its_verdict_on_finish():
+    upload = spool()
+    upload.write(b"\xff\xd8")
+
+    assert upload.sniffed is False
+    assert upload.finish().error == "unsupported"
+
+
+def test_spool_rolls_over_to_disk_past_the_request_budget():
+    budget = _MemoryBudget(64)
+    first = UploadSpool(budget, 1000, 1000)
+    first.write(PNG + b"x" * 32)
+    second = UploadSpool(budget, 1000, 1000)
+    second.write(PNG + b"x" * 32)
+
+    assert not first._file._rolled
+    assert second._file._rolled
+    assert budget.remaining == 64 - 48
+
+    first.write(b"x" * 1000)
+    assert first.error == "too_large"
+    assert budget.remaining == 64
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config["UPLOAD_MAX_IMAGE_PIXELS"] = 10_000
+    with app.app_context():
+        yield app
+
+
+def image_upload(size, image_format="PNG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size).save(buffer, image_format)
+    upload = spool(image_limit=MB)
+    upload.write(buffer.getvalue())
+    return FileStorage(stream=upload, filename="photo.png")
+
+
+def test_check_upload_accepts_an_image_and_rewinds(app):
+    upload = image_upload((50, 50))
+
+    assert check_upload(upload, IMAGE_FORMATS) == "png"
+    assert upload.stream.tell() == 0
+
+
+def test_check_upload_rejects_oversized_and_decompression_bombs(app):
+    too_large = spool(image_limit=10)
+    too_large.write(JPEG)
+    with pytest.raises(UploadError) as error:
+        check_upload(FileStorage(stream=too_large, filename="a.jpg"), IMAGE_FORMATS)
+    assert error.value.status == 413
+
+    with pytest.raises(UploadError) as error:
+        check_upload(image_upload((200, 200)), IMAGE_FORMATS)
+    assert error.value.status == 413
+
+
+def test_check_upload_rejects_formats_the_route_does_not_accept(app):
+    with pytest.raises(UploadError) as error:
+        check_upload(image_upload((10, 10), "GIF"), {"jpeg", "png"})
+    assert error.value.status == 400
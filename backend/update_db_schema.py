@@ -1,7 +1,7 @@
 from app import create_app, db
 from sqlalchemy import text
 
-app = create_app()
+app = create_app(preload_models=False)
 
 with app.app_context():
     try:
@@ -13,5 +13,15 @@ with app.app_context():
             else:
                 connection.execute(text("ALTER TABLE pets ADD COLUMN device_mac_id VARCHAR(50)"))
                 print("Successfully added device_mac_id column.")
+
+            # Model registry version that produced each emotion prediction
+            for table in ("cat_emotion_history", "dog_emotion_history"):
+                result = connection.execute(text(f"SHOW COLUMNS FROM {table} LIKE 'model_version'"))
+                if result.fetchone():
+                    print(f"Column {table}.model_version already exists.")
+                else:
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN model_version VARCHAR(64) NULL"))
+                    print(f"Successfully added {table}.model_version column.")
+            connection.commit()
     except Exception as e:
         print(f"Error updating database: {e}")